@@ -0,0 +1,57 @@
+import json
+import os
+import random
+import sys
+import timeit
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bots.chess import ChessGame
+from bots.gomoku import GomokuGame
+
+# JSON存档 vs 二进制存档的体积和耗时对比
+# 用法: python bench/codec_bench.py [走棋步数]
+
+
+def random_chess_game(plies):
+    game = ChessGame()
+    for _ in range(plies):
+        moves = game.generate_legal_moves(game.current_player)
+        if not moves or game.game_over:
+            break
+        game.move(random.choice(moves))
+    return game
+
+
+def random_gomoku_game(stones):
+    game = GomokuGame(forbidden_rule=False)
+    empty = [(x, y) for x in range(15) for y in range(15)]
+    random.shuffle(empty)
+    for x, y in empty[:stones]:
+        game.set_stone(x, y, game.current_player)
+        game.last_move = (game.current_player, x, y)
+        game.current_player = 3 - game.current_player
+    return game
+
+
+def compare(name, game, cls, number):
+    def json_save():
+        return json.dumps(game.to_dict(), ensure_ascii=False, indent=2)
+
+    def bin_save():
+        return game.to_bytes()
+
+    text = json_save()
+    buf = bin_save()
+    assert cls.from_bytes(buf).to_dict() == cls.from_dict(json.loads(text)).to_dict()
+    t_js = timeit.timeit(json_save, number=number) / number
+    t_bs = timeit.timeit(bin_save, number=number) / number
+    t_jl = timeit.timeit(lambda: cls.from_dict(json.loads(text)), number=number) / number
+    t_bl = timeit.timeit(lambda: cls.from_bytes(buf), number=number) / number
+    print(f'{name}: JSON {len(text.encode())}B 存 {t_js*1e6:.1f}us 读 {t_jl*1e6:.1f}us | '
+          f'二进制 {len(buf)}B 存 {t_bs*1e6:.1f}us 读 {t_bl*1e6:.1f}us')
+
+
+if __name__ == '__main__':
+    random.seed(0)
+    plies = int(sys.argv[1]) if len(sys.argv) > 1 else 80
+    compare(f'国际象棋({plies}步)', random_chess_game(plies), ChessGame, 2000)
+    compare('五子棋(100子)', random_gomoku_game(100), GomokuGame, 2000)
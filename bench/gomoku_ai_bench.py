@@ -0,0 +1,52 @@
+import argparse
+import os
+import random
+import sys
+import time
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import gomoku_engine
+from bots.gomoku import GomokuGame, quick_move
+
+# 五子棋电脑对手：和只看evaluate_points的贪心下法对局，统计胜率和每步耗时（含是否超时）
+# 用法: python bench/gomoku_ai_bench.py [--games 6] [--time 1]
+
+
+def greedy_move(game, rng):
+    # 贪心下法加一点随机，免得每盘都一样
+    points = game.evaluate_points(game.current_player).astype(float)
+    points += np.random.default_rng(rng.randrange(1 << 30)).random(points.shape)
+    best = np.argsort(points, axis=None)[::-1]
+    for c in best:
+        x, y = divmod(int(c), game.board_size[1])
+        if game.board[x, y] == 0 and not (game.forbidden_rule and game.current_player == 1 and game.check_forbidden(x, y)):
+            return x, y
+    return quick_move(game)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', type=int, default=6)
+    parser.add_argument('--time', type=float, default=1)
+    args = parser.parse_args()
+    wins = 0
+    times = []
+    for n in range(args.games):
+        rng = random.Random(n)
+        game = GomokuGame(forbidden_rule=n % 2 == 0)
+        ai = 1 if n % 4 < 2 else 2
+        while not game.game_over:
+            if game.current_player == ai:
+                start = time.perf_counter()
+                x, y = gomoku_engine.think(game.to_bytes(), args.time)
+                times.append(time.perf_counter() - start)
+            else:
+                x, y = greedy_move(game, rng)
+            if not game.move(game.current_player, x, y)['success']:
+                print(f'第{n + 1}盘：{x},{y} 落子失败')
+                sys.exit(1)
+        wins += game.winner == ai
+        print(f'第{n + 1}盘：电脑执{"黑" if ai == 1 else "白"}{"（禁手）" if game.forbidden_rule else ""}，'
+              f'{"胜" if game.winner == ai else "和" if game.winner == 0 else "负"}，共{game.stones}手')
+    over = sum(t > args.time + 0.1 for t in times)
+    print(f'电脑胜{wins}/{args.games}盘，平均{sum(times) / len(times):.2f}秒/步，最长{max(times):.2f}秒，超时{over}步')
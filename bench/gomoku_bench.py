@@ -0,0 +1,67 @@
+import os
+import random
+import sys
+import time
+import timeit
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bots.gomoku import GomokuGame
+
+# 五子棋棋盘操作耗时：逐步落子（含胜负/满盘判断）、批量求成五点、批量给全部空点打分，
+# 以及大棋盘（255路）上在中间一小块落子和画图的耗时
+# 用法: python bench/gomoku_bench.py
+
+
+def random_game(seed, forbidden_rule=False, board_size=(15, 15), area=15):
+    # 在棋盘中间area×area的范围里随机落子
+    rng = random.Random(seed)
+    game = GomokuGame(forbidden_rule=forbidden_rule, board_size=board_size)
+    x0, y0 = (board_size[0] - area) // 2, (board_size[1] - area) // 2
+    moves = 0
+    elapsed = 0
+    while not game.game_over and game.stones < area * area:
+        x, y = x0 + rng.randrange(area), y0 + rng.randrange(area)
+        if (x, y) in game.stone_map:
+            continue
+        start = time.perf_counter()
+        result = game.move(game.current_player, x, y)
+        elapsed += time.perf_counter() - start
+        moves += result['success']
+    return game, moves, elapsed
+
+
+if __name__ == '__main__':
+    total_moves = total_time = 0
+    for seed in range(50):
+        game, moves, elapsed = random_game(seed)
+        total_moves += moves
+        total_time += elapsed
+    print(f'落子（无禁手）: {total_moves}步，平均{total_time / total_moves * 1e6:.1f}us/步')
+    total_moves = total_time = 0
+    for seed in range(10):
+        _, moves, elapsed = random_game(seed, forbidden_rule=True)
+        total_moves += moves
+        total_time += elapsed
+    print(f'落子（禁手）: {total_moves}步，平均{total_time / total_moves * 1e6:.1f}us/步')
+    n = 200
+    t = timeit.timeit(lambda: game.is_full(), number=100000) / 100000
+    print(f'is_full: {t * 1e6:.2f}us')
+    t = timeit.timeit(lambda: game.winning_points(1), number=n) / n
+    print(f'winning_points（全部{game.board.size}点）: {t * 1e3:.2f}ms')
+    t = timeit.timeit(lambda: game.evaluate_points(1), number=n) / n
+    print(f'evaluate_points（全部{game.board.size}点）: {t * 1e3:.2f}ms')
+
+    total_moves = total_time = 0
+    for seed in range(10):
+        big, moves, elapsed = random_game(seed, forbidden_rule=True, board_size=(255, 255), area=30)
+        total_moves += moves
+        total_time += elapsed
+    print(f'255路落子（禁手）: {total_moves}步，平均{total_time / total_moves * 1e6:.1f}us/步')
+    t = timeit.timeit(lambda: big.draw_board(), number=1)
+    print(f'255路画图（第一次，整个视野）: {t * 1e3:.2f}ms')
+    x, y = next((x, y) for x in range(big.bounds[0], big.bounds[2] + 1)
+                for y in range(big.bounds[1], big.bounds[3] + 1) if (x, y) not in big.stone_map)
+    big.game_over = False
+    start = time.perf_counter()
+    big.move(big.current_player, x, y)
+    big.draw_board()
+    print(f'255路落子后重画: {(time.perf_counter() - start) * 1e3:.2f}ms')
@@ -0,0 +1,98 @@
+import os
+import random
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bots.chess import ChessGame
+from bots.gomoku import GomokuGame
+from game_history import GameHistory, CHECKPOINT_INTERVAL
+
+# 悔棋/回放的历史记录：随机对局里每一手都和当时的局面对比（包括悔棋之后接着下），
+# 再比较跳到任意一手的耗时：存档点+重放 vs 从开局重放。有不一致时以非0状态码退出
+# 用法: python bench/history_bench.py [对局数]
+
+
+def chess_step(game, rng):
+    moves = game.generate_legal_moves(game.current_player)
+    return game.move(rng.choice(moves)) if moves else None
+
+
+def gomoku_step(game, rng):
+    # 随机找个空点，碰到禁手换一个
+    while True:
+        x, y = rng.randrange(game.board_size[0]), rng.randrange(game.board_size[1])
+        if (x, y) not in game.stone_map:
+            response = game.move(game.current_player, x, y)
+            if response['success']:
+                return response
+
+
+def play(name, new_game, step, seed, plies):
+    # 边下边记，每手的局面存一份；中途随机悔几次棋。返回(不一致的手数列表, 最后的历史, 局面快照)
+    rng = random.Random(seed)
+    game = new_game()
+    history = GameHistory(game)
+    snapshots = [game.to_bytes()]
+    failures = []
+    while len(snapshots) <= plies and not game.game_over:
+        if len(snapshots) > 3 and rng.random() < 0.05:
+            n = rng.choice((1, 2))
+            game = history.undo(n)
+            del snapshots[-n:]
+            if game.to_bytes() != snapshots[-1]:
+                failures.append(f'{name} 种子{seed} 悔{n}手后第{history.ply}手不一致')
+            continue
+        response = step(game, rng)
+        if response is None or not response['success']:
+            break
+        history.record(game)
+        snapshots.append(game.to_bytes())
+    for ply, want in enumerate(snapshots):
+        if history.position(ply).to_bytes() != want:
+            failures.append(f'{name} 种子{seed} 第{ply}手不一致')
+    return failures, history, snapshots
+
+
+def replay_from_start(new_game, history, ply):
+    game = new_game()
+    for m in history.moves[:ply]:
+        game.play_packed(m)
+    return game
+
+
+def bench(name, new_game, history):
+    plies = range(history.ply + 1)
+    start = time.perf_counter()
+    for ply in plies:
+        history.position(ply)
+    t_cp = (time.perf_counter() - start) / len(plies)
+    start = time.perf_counter()
+    for ply in plies:
+        replay_from_start(new_game, history, ply)
+    t_full = (time.perf_counter() - start) / len(plies)
+    size = len(history.moves) * history.moves.itemsize + sum(len(c) for c in history.checkpoints)
+    print(f'{name}（{history.ply}手，{len(history.checkpoints)}个存档点，共{size}B）: '
+          f'跳到任意一手平均 存档点 {t_cp * 1e3:.2f}ms | 从头重放 {t_full * 1e3:.2f}ms')
+
+
+if __name__ == '__main__':
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    cases = [
+        ('国际象棋', ChessGame, chess_step, 300),
+        ('五子棋', lambda: GomokuGame(forbidden_rule=True), gomoku_step, 225),
+        ('五子棋255路', lambda: GomokuGame(board_size=(255, 255)), gomoku_step, 400),
+    ]
+    failed = []
+    for name, new_game, step, plies in cases:
+        longest = None
+        for seed in range(games):
+            failures, history, _ = play(name, new_game, step, seed, plies)
+            failed += failures
+            if longest is None or history.ply > longest.ply:
+                longest = history
+        bench(name, new_game, longest)
+    print(f'存档点间隔: {CHECKPOINT_INTERVAL}手')
+    for line in failed:
+        print(line)
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,110 @@
+import logging
+import os
+import queue
+import sys
+import tempfile
+import time
+from logging.handlers import QueueListener, RotatingFileHandler
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from logger import SampleFilter, _QueueHandler, log_formatter
+
+# 日志：事件循环里每打一条日志要多久，原来直接写控制台+文件 vs 进队列由后台线程写；
+# 再检查队列这条路INFO一条不丢、DEBUG按抽样率留、滚动之后加起来也不丢。有不一致时以非0状态码退出
+# 用法: python bench/log_bench.py [条数]
+
+# 收到的一条聊天消息大概长这样，原来每条都整个记下来
+MESSAGE = {
+    '_id': 'x' * 17, 'rid': '6815cd855ebf6e703ce29395', 'msg': 'H8',
+    'ts': {'$date': 1760000000000}, 'u': {'_id': 'y' * 17, 'username': 'someone', 'name': '某人'},
+    '_updatedAt': {'$date': 1760000000000}, 'urls': [], 'mentions': [], 'channels': [], 'md': [
+        {'type': 'PARAGRAPH', 'value': [{'type': 'PLAIN_TEXT', 'value': 'H8'}]}],
+}
+
+
+def sync_pipeline(name, path, devnull):
+    log = logging.getLogger(name)
+    log.propagate = False
+    for h in (logging.StreamHandler(devnull), logging.FileHandler(path, encoding='utf-8')):
+        h.setFormatter(log_formatter)
+        log.addHandler(h)
+    log.setLevel(logging.DEBUG)
+    return log, lambda: [h.close() for h in log.handlers]
+
+
+def queue_pipeline(name, path, devnull, rates, max_bytes=0, backups=0):
+    log = logging.getLogger(name)
+    log.propagate = False
+    console = logging.StreamHandler(devnull)
+    file = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+    for h in (console, file):
+        h.setFormatter(log_formatter)
+    q = queue.SimpleQueue()
+    handler = _QueueHandler(q)
+    handler.addFilter(SampleFilter(rates))
+    log.addHandler(handler)
+    log.setLevel(logging.DEBUG)
+    listener = QueueListener(q, console, file, respect_handler_level=True)
+    listener.start()
+
+    def stop():
+        listener.stop()
+        file.close()
+    return log, stop
+
+
+def count_lines(path, marker):
+    n = 0
+    for p in [path] + [f'{path}.{i}' for i in range(1, 1000)]:
+        if not os.path.exists(p):
+            continue
+        with open(p, encoding='utf-8') as f:
+            n += sum(marker in line for line in f)
+    return n
+
+
+def latency(n, tmp, devnull):
+    results = {}
+    for kind, build in (('直接写', sync_pipeline), ('进队列', lambda *a: queue_pipeline(*a, {}))):
+        log, stop = build(f'bench.{kind}', os.path.join(tmp, f'{kind}.log'), devnull)
+        start = time.perf_counter()
+        for i in range(n):
+            log.info('%s %s: %s', MESSAGE['rid'], MESSAGE['u']['username'], MESSAGE['msg'])
+            log.debug('%s', MESSAGE)
+        results[kind] = (time.perf_counter() - start) / n
+        stop()
+    print(f'每条消息（INFO一行+完整dict）打日志的耗时: 直接写 {results["直接写"] * 1e6:.1f}us | 进队列 {results["进队列"] * 1e6:.1f}us')
+
+
+def check(n, tmp, devnull):
+    failures = []
+    rate = 10
+    path = os.path.join(tmp, 'check.log')
+    # 文件很小，逼它滚动好几次
+    log, stop = queue_pipeline('bench.check', path, devnull, {'bench.check': rate}, max_bytes=64 * 1024, backups=999)
+    for i in range(n):
+        log.info('info-%d', i)
+        log.debug('debug-%d %s', i, MESSAGE)
+    stop()
+    info, debug = count_lines(path, 'INFO bench.check: info-'), count_lines(path, 'DEBUG bench.check: debug-')
+    want_debug = (n + rate - 1) // rate
+    if info != n:
+        failures.append(f'INFO应有{n}条，实际{info}条')
+    if debug != want_debug:
+        failures.append(f'DEBUG按1/{rate}抽样应有{want_debug}条，实际{debug}条')
+    if not os.path.exists(f'{path}.1'):
+        failures.append('没有滚动')
+    print(f'队列+滚动+抽样校验: INFO {info}/{n}，DEBUG {debug}/{want_debug}，'
+          f'滚动出{sum(os.path.exists(f"{path}.{i}") for i in range(1, 1000))}个旧文件')
+    return failures
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    tmp = tempfile.mkdtemp()
+    with open(os.devnull, 'w') as devnull:
+        latency(n, tmp, devnull)
+        failed = check(n, tmp, devnull)
+    for line in failed:
+        print(line)
+    if failed:
+        sys.exit(1)
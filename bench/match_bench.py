@@ -0,0 +1,142 @@
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bots.gomoku import GomokuBot
+from matchmaking import MatchQueue, MATCH_MAX_WINDOW, MATCH_TIMEOUT
+from player_stats import PlayerRecord
+from room import Player
+
+# 匹配队列吞吐：一下子涌进来几千人【匹配】（两个变体混着），之后按秒推进时间轮，
+# 统计入队耗时、多久配上、配对的等级分差；再在队列里已经压着很多人时，和每次扫一遍全队列的做法比一下。
+# 检查每个人最后恰好在一个房间里或者超时退出、分差不超过上限，跳表随机增删之后顺序和前后指针都对，不对时以非0状态码退出
+# 用法: python bench/match_bench.py [人数]
+
+
+class Msg:
+    def __init__(self, user_id, text):
+        self.talker_id = user_id
+        self.talker_name = user_id
+        self.text = text
+
+    async def reply(self, text):
+        pass
+
+
+def skiplist_check(seed, ops=20000):
+    # 随机入队出队（很多人同分），每隔一阵沿跳表走一遍，和排好序的参照比
+    rng = random.Random(seed)
+    queue = MatchQueue()
+    ref = {}
+    for i in range(ops):
+        if ref and rng.random() < 0.45:
+            uid = rng.choice(list(ref))
+            queue.remove(uid)
+            del ref[uid]
+        else:
+            uid = f'p{i}'
+            rating = rng.choice([1500, rng.randrange(1000, 2000)])
+            queue.push(Player(uid, None), rating, i)
+            ref[uid] = (rating, i, uid)
+        if i % 1000 == 0 or i == ops - 1:
+            walked = []
+            prev, node = None, queue.entries.head.next[0]
+            while node is not None:
+                if node.prev is not prev:
+                    return [f'跳表 种子{seed} 第{i}步: {node.entry}的前一个指针不对']
+                walked.append(node.entry)
+                prev, node = node, node.next[0]
+            if walked != sorted(ref.values()) or len(queue) != len(ref):
+                return [f'跳表 种子{seed} 第{i}步: 顺序和参照不一致']
+    return []
+
+
+def standing_queue(size, arrivals=2000):
+    # 队列里压着size个互相配不上的人（分差都超过上限），再来arrivals个人，各自配走一个（配走的放回去）
+    rng = random.Random(size)
+    gap = MATCH_MAX_WINDOW + 1
+    queue = MatchQueue()
+    naive = []
+    for i in range(size):
+        queue.push(Player(f's{i}', None), i * gap, 0)
+        naive.append((i * gap, f's{i}'))
+    newcomers = [rng.randrange(size) * gap + rng.randrange(-50, 51) for _ in range(arrivals)]
+    start = time.perf_counter()
+    for i, r in enumerate(newcomers):
+        queue.push(Player(f'n{i}', None), r, 0)
+        _, partner = queue.pair(f'n{i}', 0)
+        queue.push(partner, int(partner.id[1:]) * gap, 0)  # 配走的人放回去，保持队列大小
+    t_skip = (time.perf_counter() - start) / arrivals
+    # 对照：不排序，每来一个人扫一遍队列找分差最小的
+    start = time.perf_counter()
+    sample = newcomers[:100]  # 太慢了，取一部分算平均
+    for r in sample:
+        min(naive, key=lambda e: abs(e[0] - r))
+    t_naive = (time.perf_counter() - start) / len(sample)
+    print(f'队列里压着{size}人时来一个人配对: 跳表 {t_skip * 1e6:.1f}us | 扫全队列 {t_naive * 1e6:.1f}us')
+
+
+async def burst(n, seed):
+    rng = random.Random(seed)
+    bot = GomokuBot()
+    users = [f'u{i}' for i in range(n)]
+    ratings = {}
+    for uid in users:
+        ratings[uid] = rng.gauss(1500, 300)
+        bot.stats.players[uid] = PlayerRecord(uid, uid, ratings[uid])
+    start = time.perf_counter()
+    for uid in users:
+        await bot.message_handler(Msg(uid, '匹配 禁' if rng.random() < 0.3 else '匹配'))
+    t_enqueue = (time.perf_counter() - start) / n
+    matched_at_once = n - len(bot.match_variant)
+    # 按秒推进，记下每个时刻还在排队的人数
+    now = time.time()
+    waiting = {}
+    start = time.perf_counter()
+    ticks = 0
+    for sec in range(1, MATCH_TIMEOUT + 2):
+        await bot.tick(now + sec)
+        ticks += 1
+        if sec in (10, 30, 60, 120, 300):
+            waiting[sec] = len(bot.match_variant)
+    t_tick = (time.perf_counter() - start) / ticks
+    print(f'{n}人同时匹配: 入队 {t_enqueue * 1e6:.1f}us/人（含开房），当场配上{matched_at_once}人；'
+          f'时间轮推进 {t_tick * 1e6:.1f}us/秒')
+    print('  还在排队: ' + ' '.join(f'{sec}秒{k}人' for sec, k in waiting.items()))
+    # 校验
+    failures = []
+    seen = {}
+    diffs = []
+    for room_id, room in bot.rooms.items():
+        a, b = (p.id for p in room.players)
+        for uid in (a, b):
+            if uid in seen:
+                failures.append(f'{uid}同时在房间{seen[uid]}和{room_id}')
+            seen[uid] = room_id
+        diffs.append(abs(ratings[a] - ratings[b]))
+    timed_out = n - len(seen)
+    if bot.match_variant or any(len(q) or q.players for q in bot.match_queues.values()):
+        failures.append('时间到了还有人在队列里')
+    if diffs and max(diffs) > MATCH_MAX_WINDOW:
+        failures.append(f'分差{max(diffs):.0f}超过上限{MATCH_MAX_WINDOW}')
+    diffs.sort()
+    print(f'  {len(bot.rooms)}个房间，分差中位数{diffs[len(diffs) // 2]:.0f} 最大{diffs[-1]:.0f}，超时退出{timed_out}人')
+    return failures
+
+
+if __name__ == '__main__':
+    os.chdir(tempfile.mkdtemp())  # bot会在当前目录下建data/
+    failed = []
+    for n in ([int(sys.argv[1])] if len(sys.argv) > 1 else [1000, 5000, 20000]):
+        failed += asyncio.run(burst(n, n))
+    for seed in range(3):
+        failed += skiplist_check(seed)
+    for size in (1000, 10000, 100000, 1000000):
+        standing_queue(size)
+    for line in failed:
+        print(line)
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,40 @@
+import os
+import random
+import sys
+import time
+import timeit
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bots.chess import ChessGame
+
+# 合法走法生成耗时随对局长度的变化，应当基本持平
+# 用法: python bench/movegen_bench.py
+
+
+def midgame(seed=0, plies=30):
+    random.seed(seed)
+    game = ChessGame()
+    for _ in range(plies):
+        game.move(random.choice(game.generate_legal_moves(game.current_player)))
+    return game
+
+
+if __name__ == '__main__':
+    game = midgame()
+    history, positions = list(game.move_history), list(game.position_history)
+    for length in (0, 100, 1000, 10000):
+        # 用重复的历史把对局“拉长”，局面本身不变
+        game.move_history = (history * (length // len(history) + 1))[:length]
+        game.position_history = (positions * (length // len(positions) + 1))[:length]
+        n = 50
+
+        def generate():
+            game._legal_cache = None  # 不走缓存，测真实生成耗时
+            return game.generate_legal_moves(game.current_player)
+        t = timeit.timeit(generate, number=n) / n
+        print(f'历史长度{length:>6}: generate_legal_moves {t*1e3:.2f}ms')
+    t = timeit.timeit(lambda: game.is_legal_move({'from': (6, 0), 'to': (5, 0)}), number=10000) / 10000
+    print(f'缓存命中: is_legal_move {t*1e6:.2f}us')
+    start = time.perf_counter()
+    nodes = ChessGame().perft(4)
+    elapsed = time.perf_counter() - start
+    print(f'初始局面perft(4): {nodes}节点 {elapsed:.2f}s {nodes/elapsed:.0f}节点/秒')
@@ -0,0 +1,68 @@
+import argparse
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bots.chess import ChessGame
+
+# 走法生成的perft校验：从标准局面出发数到固定深度的叶子节点数，和参考值比对并报告速度
+# 改了bots/chess.py之后跑一遍，有不一致时以非0状态码退出：
+#   python bench/perft.py           # 完整深度
+#   python bench/perft.py --quick   # 只跑到深度3，几秒钟
+
+# (名字, FEN, 有吃必吃, 从深度1开始的参考节点数)
+POSITIONS = [
+    ('初始局面', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1', False,
+     [20, 400, 8902, 197281, 4865609]),
+    ('Kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1', False,
+     [48, 2039, 97862, 4085603]),
+    ('局面3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', False,
+     [14, 191, 2812, 43238, 674624]),
+    ('局面4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1', False,
+     [6, 264, 9467, 422333]),
+    ('局面5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', False,
+     [44, 1486, 62379, 2103487]),
+    ('局面6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10', False,
+     [46, 2079, 89890, 3894594]),
+    # 有吃必吃：初始局面的数值和抢吃棋（antichess）公开的perft一致（前4层还不会升变）
+    ('有吃必吃-初始局面', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1', True,
+     [20, 400, 8067, 153299]),
+    # 以下几个是本项目规则（不能升变成王）下记录的回归值
+    ('有吃必吃-开局', 'rnbqkbnr/p1pppppp/8/1B6/8/4P3/PPPP1PPP/RNBQK1NR b - - 0 2', True,
+     [20, 24, 74, 1774]),
+    ('有吃必吃-升变', '8/1P3k2/8/3p4/4P3/8/5Kp1/8 w - - 0 1', True,
+     [2, 13, 25, 184]),
+    ('有吃必吃-中局', 'r1b1k2r/pp3ppp/2n5/3pp3/1b1P4/2N5/PP2PPPP/R1B1KB1R w - - 0 8', True,
+     [2, 5, 5, 6]),
+]
+
+
+def run(max_depth):
+    failed = 0
+    total_nodes = 0
+    total_time = 0
+    for name, fen, must_capture, expected in POSITIONS:
+        game = ChessGame.from_fen(fen, must_capture=must_capture)
+        for depth, want in enumerate(expected[:max_depth], 1):
+            start = time.perf_counter()
+            got = game.perft(depth)
+            elapsed = time.perf_counter() - start
+            total_nodes += got
+            total_time += elapsed
+            status = 'ok' if got == want else f'错误，应为{want}'
+            if got != want:
+                failed += 1
+            print(f'{name} 深度{depth}: {got} {status} ({got / max(elapsed, 1e-9):.0f}节点/秒)')
+    print(f'共{total_nodes}节点，{total_time:.2f}秒，{total_nodes / max(total_time, 1e-9):.0f}节点/秒')
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--quick', action='store_true', help='只跑到深度3')
+    parser.add_argument('--depth', type=int, default=5)
+    args = parser.parse_args()
+    failed = run(3 if args.quick else args.depth)
+    if failed:
+        print(f'{failed}项perft不一致！')
+        sys.exit(1)
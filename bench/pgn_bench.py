@@ -0,0 +1,60 @@
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bots.chess import ChessGame
+import chess_pgn
+
+# PGN导出/导入的吞吐量：随机生成一批存档，导出成PGN再导入回来，检查着法一致
+# 用法: python bench/pgn_bench.py [盘数]
+
+
+def random_record(seed):
+    rng = random.Random(seed)
+    game = ChessGame(must_capture=seed % 4 == 0)
+    for _ in range(rng.randint(20, 120)):
+        moves = game.generate_legal_moves(game.current_player)
+        if game.game_over or not moves:
+            break
+        game.move(rng.choice(moves))
+    players = [{'id': f'u{seed}a', 'name': f'甲{seed}'}, {'id': f'u{seed}b', 'name': f'乙{seed}'}]
+    return {'game': game.to_dict(), 'players': players, 'status': 'finished', 'draw_offer': None}
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, 'src')
+        os.makedirs(src)
+        records = []
+        for i in range(n):
+            record = random_record(i)
+            records.append(record)
+            with open(os.path.join(src, f'{1700000000 + i}_{i}.json'), 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False)
+        plies = sum(len(r['game']['move_history']) for r in records)
+
+        start = time.perf_counter()
+        out = io.StringIO()
+        for text in chess_pgn.export_archive(src):
+            out.write(text + '\n')
+        elapsed = time.perf_counter() - start
+        print(f'导出 {n}盘/{plies}步: {elapsed:.2f}s，{n / elapsed:.0f}盘/秒，{plies / elapsed:.0f}步/秒')
+
+        dst = os.path.join(tmp, 'dst')
+        start = time.perf_counter()
+        ok, failed = chess_pgn.import_pgn(io.StringIO(out.getvalue()), dst)
+        elapsed = time.perf_counter() - start
+        print(f'导入 {ok}盘（失败{failed}）: {elapsed:.2f}s，{ok / elapsed:.0f}盘/秒，{plies / elapsed:.0f}步/秒')
+
+        # 按导入顺序比对着法
+        for i, (tags, movetext) in enumerate(chess_pgn.read_pgn(io.StringIO(out.getvalue()))):
+            game = chess_pgn.pgn_to_game(tags, movetext)
+            if game.move_history != ChessGame.from_dict(records[i]['game']).move_history:
+                print(f'第{i + 1}盘着法不一致！')
+                sys.exit(1)
+        print('往返一致')
@@ -0,0 +1,116 @@
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import gomoku_engine
+from bots.gomoku import GomokuGame
+
+# 禁手判断的回归局面：每个局面给出黑白子和若干点的期望结果（False或禁手类型），有不一致时以非0状态码退出；
+# 再加几个黑棋VCF的局面，检查VCF搜索里的冲四也按禁手判断查
+# 改了GomokuGame.check_forbidden或者gomoku_engine的VCF之后跑一遍：
+#   python bench/renju_corpus.py
+# 坐标同游戏里的写法：字母是行（A~O），数字是列（1~15）
+
+# (名字, 黑子, 白子, {点: 期望}, 是否要求全盘禁手点恰好就是这些)
+POSITIONS = [
+    # bots/gomoku.py原来__main__里的局面，全盘检查
+    ('模块自带局面', 'I4 H2 H3 K4 J1 J2 J3 J5 J6', '',
+     {'H5': '双活三', 'I2': '双活三', 'J4': '长连', 'K2': '双活三'}, True),
+    ('简单双活三', 'H9 H10 I8 J8', '', {'H8': '双活三', 'H11': False}, False),
+    ('跳活三加活三', 'H10 H11 I9 J10', '', {'H8': '双活三'}, False),
+    ('双活四', 'H9 H10 H11 I8 J8 K8', '', {'H8': '双四'}, False),
+    ('冲四加活四', 'H9 H10 H11 I8 J8 K8', 'H12', {'H8': '双四'}, False),
+    ('一条线上的双四', 'H5 H7 H9 H11', '', {'H8': '双四', 'H6': False}, False),
+    ('长连', 'H4 H5 H6 H8 H9', '', {'H7': '长连'}, False),
+    ('成五优先于禁手', 'H4 H5 H6 H7 I8 J8 K8', '', {'H8': False}, False),
+    ('成五同时长连', 'H4 H5 H6 H7 D8 E8 F8 G8 I8', '', {'H8': False}, False),
+    ('四三不禁', 'H9 H10 H11 I8 J8', '', {'H8': False}, False),
+    ('白子挡住的假活三', 'H9 H10 I8 J8', 'H12 H6', {'H8': False}, False),
+    ('边线挡住的假活三', 'H2 H3 I1 J1', '', {'H1': False}, False),
+    # 横向的活三两个补四点H7、H11本身都是长连禁手，只剩竖向一个真活三
+    ('补四点是禁手的假活三', 'H9 H10 I8 J8 D7 E7 F7 G7 I7 D11 E11 F11 G11 I11', '',
+     {'H8': False, 'H7': '长连', 'H11': '长连'}, False),
+    ('三个活三', 'H9 H10 I8 J8 I9 J10', '', {'H8': '双活三'}, False),
+]
+
+# (名字, 黑子, 白子, 是否禁手规则, 黑先VCF的第一步，None表示没有)
+VCF_POSITIONS = [
+    # 冲四只有H7，但H7是一条线上的双四（B.BBB.B）
+    ('一条线上的双四不算杀', 'H4 H6 H8 H10', 'A1 A3 O15 O13', True, None),
+    ('不禁手时同一局面有杀', 'H4 H6 H8 H10', 'A1 A3 O15 O13', False, 'H7'),
+    # 先冲B5（B1被堵，只能再冲B6），之后的H7才是双四，电脑不能当成杀去走B5
+    ('第二步冲四才是禁手', 'H4 H6 H8 H10 B2 B3 B4', 'B1 O1 O3 O5 O15 O13 O11', True, None),
+]
+
+
+def parse_point(name):
+    return ord(name[0].upper()) - ord('A'), int(name[1:]) - 1
+
+
+def point_name(x, y):
+    return f'{chr(ord("A") + x)}{y + 1}'
+
+
+def build(black, white):
+    board = [[0] * 15 for _ in range(15)]
+    for names, v in ((black, 1), (white, 2)):
+        for name in names.split():
+            x, y = parse_point(name)
+            board[x][y] = v
+    game = GomokuGame(forbidden_rule=True)
+    game.board = board
+    return game
+
+
+def check(name, black, white, expected, whole_board):
+    game = build(black, white)
+    failures = []
+    for point, want in expected.items():
+        got = game.check_forbidden(*parse_point(point))
+        if got != want:
+            failures.append(f'{point} 期望{want} 实际{got}')
+    if whole_board:
+        found = {
+            point_name(x, y)
+            for x in range(15) for y in range(15)
+            if game.board[x, y] == 0 and game.check_forbidden(x, y)
+        }
+        want = {point for point, v in expected.items() if v}
+        if found != want:
+            failures.append(f'全盘禁手点 期望{sorted(want)} 实际{sorted(found)}')
+    return failures
+
+
+def check_vcf(black, white, forbidden_rule, want):
+    game = build(black, white)
+    line = gomoku_engine.find_vcf(game.board.tolist(), 1, forbidden_rule)
+    got = None if line is None else point_name(*line[0])
+    return [] if got == want else [f'VCF第一步 期望{want} 实际{got}']
+
+
+if __name__ == '__main__':
+    failed = 0
+    for name, black, white, expected, whole_board in POSITIONS:
+        failures = check(name, black, white, expected, whole_board)
+        print(f'{name}: {"OK" if not failures else "不一致"}')
+        for line in failures:
+            print(f'  {line}')
+        failed += bool(failures)
+    for name, black, white, forbidden_rule, want in VCF_POSITIONS:
+        failures = check_vcf(black, white, forbidden_rule, want)
+        print(f'{name}: {"OK" if not failures else "不一致"}')
+        for line in failures:
+            print(f'  {line}')
+        failed += bool(failures)
+    # 速度：第一个局面全盘每个空点判断一次
+    game = build(*POSITIONS[0][1:3])
+    points = [(x, y) for x in range(15) for y in range(15) if game.board[x, y] == 0]
+    start = time.perf_counter()
+    for _ in range(20):
+        for x, y in points:
+            game.check_forbidden(x, y)
+    elapsed = time.perf_counter() - start
+    print(f'禁手判断: 平均{elapsed / (20 * len(points)) * 1e6:.1f}us/点')
+    if failed:
+        print(f'{failed}个局面不一致')
+        sys.exit(1)
@@ -0,0 +1,144 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bots.chess import ChessBot, ChessGame
+from bots.gomoku import GomokuBot, GomokuGame
+from chess_base import parse_time_control
+from game_history import GameHistory
+from room import Player, RoomStatus
+
+# 房间对象：十万个空闲房间（等人加入）时每个房间占多少内存，__slots__的Room和原来的dict比；
+# 再随机下几局、随便填上计时/申请之类的字段，room_to_dict -> json -> dict_to_room 来回转，检查不丢东西。
+# 有不一致时以非0状态码退出
+# 用法: python bench/room_bench.py [房间数]
+
+
+def dict_room(game, history, user_id, deadline, chess):
+    # 原来的房间dict
+    room = {
+        'game': game,
+        'history': history,
+        'players': [{'id': user_id, 'name': f'玩家{user_id}'}],
+        'status': 'waiting',
+        'undo_offer': None,
+        'clock': None,
+        'deadline': deadline,
+    }
+    if chess:
+        room['draw_offer'] = None
+    return room
+
+
+def slotted_room(bot, game, history, user_id, deadline):
+    room = bot.make_room(game, [Player(user_id, f'玩家{user_id}')], RoomStatus.WAITING)
+    room.history = history
+    room.deadline = deadline
+    return room
+
+
+def footprint(bot, new_game, n, chess):
+    # 先建好n局棋和历史，再分别包成dict和Room，量包装本身多占多少
+    now = time.time()
+    tracemalloc.start()
+    games = []
+    for _ in range(n):
+        game = new_game()
+        games.append((game, GameHistory(game)))
+    base = tracemalloc.get_traced_memory()[0]
+    rooms = [dict_room(g, h, str(100000 + i), now + i, chess) for i, (g, h) in enumerate(games)]
+    t_dict = tracemalloc.get_traced_memory()[0] - base
+    del rooms
+    base = tracemalloc.get_traced_memory()[0]
+    rooms = [slotted_room(bot, g, h, str(100000 + i), now + i) for i, (g, h) in enumerate(games)]
+    t_slots = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    # 找座位：原来每条消息在players里找一遍 vs 座位表
+    room = bot.make_room(games[0][0], [Player('a', 'A'), Player('b', 'B')], RoomStatus.PLAYING)
+    old = {'players': [p.to_dict() for p in room.players]}
+    k = 200000
+    start = time.perf_counter()
+    for _ in range(k):
+        [p['id'] for p in old['players']].index('b')
+    t_index = (time.perf_counter() - start) / k
+    start = time.perf_counter()
+    for _ in range(k):
+        room.seat('b')
+    t_seat = (time.perf_counter() - start) / k
+    game_size = base / n
+    print(f'{bot.game_name} {n}个空闲房间，每个: 棋局+历史约{game_size / 1024:.1f}KB，'
+          f'房间本身 dict {t_dict / n:.0f}B -> Room {t_slots / n:.0f}B；'
+          f'找座位 {t_index * 1e9:.0f}ns -> {t_seat * 1e9:.0f}ns')
+
+
+def chess_step(game, rng):
+    moves = game.generate_legal_moves(game.current_player)
+    return game.move(rng.choice(moves)) if moves else None
+
+
+def gomoku_step(game, rng):
+    while True:
+        x, y = rng.randrange(game.board_size[0]), rng.randrange(game.board_size[1])
+        if (x, y) not in game.stone_map:
+            response = game.move(game.current_player, x, y)
+            if response['success']:
+                return response
+
+
+def round_trip(bot, new_game, step, offers, seed):
+    rng = random.Random(seed)
+    game = new_game(rng)
+    players = [Player(f'u{seed}', f'甲{seed}'), Player(f'v{seed}', None)]
+    clock, _ = parse_time_control(rng.choice(['', '10+5', '每步30', '3+2 每步20']))
+    room = bot.make_room(game, players, rng.choice(list(RoomStatus)), clock)
+    for _ in range(rng.randrange(60)):
+        response = step(room.game, rng)
+        if response is None or not response['success']:
+            break
+        room.history.record(room.game)
+        if room.game.game_over:
+            break
+    room.undo_offer = rng.choice(offers)
+    if hasattr(room, 'draw_offer'):
+        room.draw_offer = rng.choice(offers)
+    room.deadline = rng.choice([None, time.time() + rng.random() * 3600])
+    if clock:
+        clock['turn_start'] = time.time()
+        if clock['remaining']:
+            clock['remaining'] = [rng.random() * 600, rng.random() * 600]
+    data = bot.room_to_dict(room)
+    back = bot.dict_to_room(json.loads(json.dumps(data, ensure_ascii=False)))
+    failures = []
+    if bot.room_to_dict(back) != data:
+        failures.append(f'{bot.game_name} 种子{seed}: 来回转之后dict不一样')
+    if type(back) is not type(room) or back.status is not room.status:
+        failures.append(f'{bot.game_name} 种子{seed}: 房间类型或状态不对')
+    if back.game.to_bytes() != room.game.to_bytes():
+        failures.append(f'{bot.game_name} 种子{seed}: 局面不一样')
+    if (back.history.ply, back.history.moves) != (room.history.ply, room.history.moves):
+        failures.append(f'{bot.game_name} 种子{seed}: 历史没重放对')
+    if back.seats != room.seats or back.seat(players[1].id) != 1:
+        failures.append(f'{bot.game_name} 种子{seed}: 座位表不对')
+    return failures
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    os.chdir(tempfile.mkdtemp())  # bot会在当前目录下建data/
+    chess, gomoku = ChessBot(), GomokuBot()
+    failed = []
+    for seed in range(200):
+        failed += round_trip(chess, lambda rng: ChessGame(must_capture=rng.random() < 0.3), chess_step, [None, 'w', 'b'], seed)
+        failed += round_trip(gomoku, lambda rng: GomokuGame(rng.random() < 0.5, (rng.choice([9, 15, 19]),) * 2),
+                             gomoku_step, [None, 1, 2], seed)
+    print('来回转换校验: ' + ('OK' if not failed else '不一致'))
+    footprint(chess, ChessGame, n, True)
+    footprint(gomoku, GomokuGame, n, False)
+    for line in failed:
+        print(line)
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,89 @@
+import heapq
+import math
+import os
+import random
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import timer_wheel
+from timer_wheel import TimerWheel
+
+# 时间轮：随机加/改/删定时器，逐tick推进，每个定时器到期的tick和堆算出来的对比；
+# 再量一下几万个房间同时在线时加定时器和每个tick的耗时。有不一致时以非0状态码退出
+# 用法: python bench/timer_bench.py [定时器个数]
+
+
+def check(n, tick, horizon, seed):
+    # horizon: 定时器最远多少秒以后到期；超过时间轮范围的会进overflow
+    rng = random.Random(seed)
+    start = 1_700_000_000.0
+    wheel = TimerWheel(start, tick)
+    expected = {}  # key -> 应该到期的tick
+    for key in range(n):
+        when = start + rng.random() * horizon
+        wheel.schedule(key, when)
+        expected[key] = max(math.ceil(when / tick), int(start // tick) + 1)
+    # 一部分改期、一部分取消
+    for key in rng.sample(range(n), n // 4):
+        when = start + rng.random() * horizon
+        wheel.schedule(key, when)
+        expected[key] = max(math.ceil(when / tick), int(start // tick) + 1)
+    for key in rng.sample(range(n), n // 10):
+        wheel.cancel(key)
+        del expected[key]
+    heap = [(t, key) for key, t in expected.items()]
+    heapq.heapify(heap)
+    failures = []
+    now = start
+    # 每次随机往前走1~3个tick，偶尔一下跳很远（比如进程卡住）
+    while heap:
+        now += tick * (rng.randint(1, 3) if rng.random() > 0.001 else rng.randint(100, 5000))
+        got = sorted(wheel.advance(now))
+        want = []
+        while heap and heap[0][0] <= int(now // tick):
+            want.append(heapq.heappop(heap)[1])
+        if got != sorted(want):
+            failures.append(f'tick={tick} 种子{seed} 时间{now - start:.0f}: 期望{sorted(want)[:5]} 实际{got[:5]}')
+            break
+    if len(wheel):
+        failures.append(f'tick={tick} 种子{seed}: 还剩{len(wheel)}个没到期')
+    return failures
+
+
+def speed(n):
+    rng = random.Random(0)
+    now = time.time()
+    wheel = TimerWheel(now)
+    start = time.perf_counter()
+    for key in range(n):
+        wheel.schedule(key, now + rng.random() * 24 * 3600)
+    t_schedule = (time.perf_counter() - start) / n
+    start = time.perf_counter()
+    for key in range(n):
+        wheel.schedule(key, now + rng.random() * 24 * 3600)  # 走一步改一次期限
+    t_reschedule = (time.perf_counter() - start) / n
+    ticks = 3 * 3600
+    fired = 0
+    start = time.perf_counter()
+    for i in range(1, ticks + 1):
+        fired += len(wheel.advance(now + i))
+    t_tick = (time.perf_counter() - start) / ticks
+    print(f'{n}个定时器: 加 {t_schedule * 1e6:.2f}us/个 改期 {t_reschedule * 1e6:.2f}us/个 | '
+          f'推进 {t_tick * 1e6:.2f}us/tick（{ticks}个tick到期{fired}个）')
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    failed = []
+    failed += check(n // 5, 1.0, 3 * 24 * 3600, 0)        # 房间期限一般在几天以内
+    failed += check(n // 50, 0.25, 600, 1)
+    # 只留两层（范围4096个tick），让一大半定时器走overflow
+    timer_wheel.LEVELS = 2
+    failed += check(n // 50, 1.0, 50000, 2)
+    timer_wheel.LEVELS = 4
+    print('到期时刻校验: ' + ('OK' if not failed else '不一致'))
+    speed(n)
+    for line in failed:
+        print(line)
+    if failed:
+        sys.exit(1)
@@ -1,3 +1,5 @@
+import asyncio
+import difflib
 import random
 import re
 import cv2
@@ -6,8 +8,12 @@ import os
 import json
 from pathlib import Path
 from PIL import Image, ImageDraw, ImageFont
-from chess_base import ChessGameBase
-import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from chess_base import ChessGameBase, parse_time_control, describe_time_control
+from game_history import GameHistory
+from room import Player, Room, RoomStatus
+import game_codec
+from collections import Counter
 
 # 棋子中文名
 PIECE_NAMES = {
@@ -31,9 +37,121 @@ START_BOARD = [
     ['wR', 'wN', 'wB', 'wQ', 'wK', 'wB', 'wN', 'wR'],
 ]
 
+def _to_square(v):
+    return (int(v[0]), int(v[1]))
+
+# 位棋盘：格子编号 sq = x*8 + y，x为行（0是第8横线），y为列（0是a列），对应board[x][y]
+WHITE, BLACK = 0, 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+# 棋子编号 = 颜色*6 + 兵种，和'wP'这类字符串互转
+PIECE_STR = [c + k for c in 'wb' for k in 'PNBRQK']
+PIECE_CODE = {s: i for i, s in enumerate(PIECE_STR)}
+PROMO_KINDS = {'Q': QUEEN, 'R': ROOK, 'B': BISHOP, 'N': KNIGHT}
+PROMO_LETTERS = {v: k for k, v in PROMO_KINDS.items()}
+# 易位权位：wK=1, wQ=2, bK=4, bQ=8
+CASTLING_BITS = {'wK': 1, 'wQ': 2, 'bK': 4, 'bQ': 8}
+# 走棋的起点或终点是王/车的原始格时，对应易位权清掉（车被吃也算）
+CASTLING_MASK = [15] * 64
+CASTLING_MASK[63] = 15 & ~1   # h1
+CASTLING_MASK[56] = 15 & ~2   # a1
+CASTLING_MASK[60] = 15 & ~3   # e1
+CASTLING_MASK[7] = 15 & ~4    # h8
+CASTLING_MASK[0] = 15 & ~8    # a8
+CASTLING_MASK[4] = 15 & ~12   # e8
+
+# 走法打包成整数：0-5位起点，6-11位终点，12-14位升变兵种，再加3个标记位
+MOVE_CASTLE = 1 << 15
+MOVE_EP = 1 << 16
+MOVE_DOUBLE = 1 << 17
+
+
+def _step_table(offsets):
+    table = []
+    for sq in range(64):
+        x, y = divmod(sq, 8)
+        bb = 0
+        for dx, dy in offsets:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < 8 and 0 <= ny < 8:
+                bb |= 1 << (nx * 8 + ny)
+        table.append(bb)
+    return table
+
+
+KNIGHT_ATTACKS = _step_table([(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)])
+KING_ATTACKS = _step_table([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy])
+# PAWN_ATTACKS[color][sq]：color方的兵在sq上能吃到的格子
+PAWN_ATTACKS = (_step_table([(-1, -1), (-1, 1)]), _step_table([(1, -1), (1, 1)]))
+
+# 8个方向的射线（不含起点），前4个方向格子编号递增，后4个递减
+RAY_DIRS = [(1, 0), (0, 1), (1, 1), (1, -1), (-1, 0), (0, -1), (-1, -1), (-1, 1)]
+RAYS = []
+for _dx, _dy in RAY_DIRS:
+    _table = []
+    for _sq in range(64):
+        _x, _y = divmod(_sq, 8)
+        _bb = 0
+        while True:
+            _x, _y = _x + _dx, _y + _dy
+            if not (0 <= _x < 8 and 0 <= _y < 8):
+                break
+            _bb |= 1 << (_x * 8 + _y)
+        _table.append(_bb)
+    RAYS.append(_table)
+ROOK_DIRS = (0, 1, 4, 5)
+BISHOP_DIRS = (2, 3, 6, 7)
+
+# BETWEEN[a][b]：a、b在同一直线/斜线上时，两者之间的格子（不含两端）
+BETWEEN = [[0] * 64 for _ in range(64)]
+for _d in range(8):
+    for _a in range(64):
+        _ray = RAYS[_d][_a]
+        _bb = _ray
+        while _bb:
+            _low = _bb & -_bb
+            _bb ^= _low
+            _b = _low.bit_length() - 1
+            BETWEEN[_a][_b] = _ray & ~RAYS[_d][_b] & ~(1 << _b)
+
+# Zobrist哈希键，固定种子保证存档里的局面哈希跨进程一致
+_zobrist_rng = random.Random(20250504)
+ZOBRIST_PIECES = [[_zobrist_rng.getrandbits(64) for _ in range(64)] for _ in range(12)]
+ZOBRIST_CASTLING = [_zobrist_rng.getrandbits(64) for _ in range(16)]
+ZOBRIST_EP = [_zobrist_rng.getrandbits(64) for _ in range(8)]  # 按过路兵所在列
+ZOBRIST_SIDE = _zobrist_rng.getrandbits(64)  # 黑方走棋时异或进去
+
+
+def slide_attacks(sq, occ, dirs):
+    # 沿射线找到第一个阻挡子，去掉它后面的部分
+    attacks = 0
+    for d in dirs:
+        ray = RAYS[d][sq]
+        blockers = ray & occ
+        if blockers:
+            if d < 4:
+                b = (blockers & -blockers).bit_length() - 1
+            else:
+                b = blockers.bit_length() - 1
+            ray ^= RAYS[d][b]
+        attacks |= ray
+    return attacks
+
+
+def encode_move_tuple(f, t, promo=None):
+    return f | (t << 6) | (PROMO_KINDS[promo] << 12 if promo else 0)
+
+
+def decode_move(m):
+    f, t = m & 63, (m >> 6) & 63
+    move = {'from': (f >> 3, f & 7), 'to': (t >> 3, t & 7)}
+    if m & 0x7000:
+        move['promotion'] = PROMO_LETTERS[(m >> 12) & 7]
+    return move
+
+
 class ChessGame:
     def __init__(self, must_capture=False):
-        self.board = [row[:] for row in START_BOARD]
+        self.board = START_BOARD
         self.current_player = 'w'  # 'w' or 'b'
         self.game_over = False
         self.winner = None
@@ -59,89 +177,95 @@ class ChessGame:
             }
         self.en_passant = None  # (x, y) 可吃过路兵目标格
         self.must_capture = must_capture
-        self.position_history = []
+        self.position_history = []  # 每步之后的局面哈希
+        self.position_counts = Counter()  # 局面哈希 -> 出现次数，判三次重复用
+        self.zobrist = self.compute_zobrist()
+
+    # 内部用位棋盘：bitboards[棋子编号]、每方占位occupancy[颜色]，squares是每格的棋子编号（空为None）
+    # board/castling_rights/en_passant保留原来的格式，读写时转换
+    @property
+    def board(self):
+        sq = self.squares
+        return [[None if sq[i] is None else PIECE_STR[sq[i]] for i in range(x * 8, x * 8 + 8)] for x in range(8)]
+
+    @board.setter
+    def board(self, rows):
+        self._legal_cache = None
+        self.bitboards = [0] * 12
+        self.occupancy = [0, 0]
+        self.squares = [None] * 64
+        for x in range(8):
+            for y in range(8):
+                if rows[x][y]:
+                    p = PIECE_CODE[rows[x][y]]
+                    sq = x * 8 + y
+                    self.squares[sq] = p
+                    self.bitboards[p] |= 1 << sq
+                    self.occupancy[p // 6] |= 1 << sq
+
+    @property
+    def castling_rights(self):
+        return {k: bool(self.castling & bit) for k, bit in CASTLING_BITS.items()}
+
+    @castling_rights.setter
+    def castling_rights(self, rights):
+        self._legal_cache = None
+        self.castling = sum(bit for k, bit in CASTLING_BITS.items() if rights.get(k))
+
+    @property
+    def en_passant(self):
+        return None if self.ep_square is None else (self.ep_square >> 3, self.ep_square & 7)
+
+    @en_passant.setter
+    def en_passant(self, pos):
+        self._legal_cache = None
+        self.ep_square = None if pos is None else pos[0] * 8 + pos[1]
 
     def in_board(self, x, y):
         return 0 <= x < 8 and 0 <= y < 8
 
     def get_piece(self, x, y):
-        return self.board[x][y]
+        p = self.squares[x * 8 + y]
+        return None if p is None else PIECE_STR[p]
+
+    def compute_zobrist(self):
+        # 从头计算局面哈希，只考虑棋盘、当前方、易位权、过路兵。走棋时由_make/_unmake增量维护
+        key = ZOBRIST_CASTLING[self.castling]
+        for sq, p in enumerate(self.squares):
+            if p is not None:
+                key ^= ZOBRIST_PIECES[p][sq]
+        if self.ep_square is not None:
+            key ^= ZOBRIST_EP[self.ep_square & 7]
+        if self.current_player == 'b':
+            key ^= ZOBRIST_SIDE
+        return key
 
     def get_position_hash(self):
-        # 只考虑棋盘、当前方、易位权、过路兵
-        board_str = json.dumps(self.board, sort_keys=True)
-        cr_str = json.dumps(self.castling_rights, sort_keys=True)
-        ep_str = str(self.en_passant)
-        s = f'{board_str}|{self.current_player}|{cr_str}|{ep_str}'
-        return hashlib.md5(s.encode()).hexdigest()
+        return self.zobrist
 
     def move(self, move):
         # 兼容外部传入list格式
         if isinstance(move, list) and len(move) == 2:
             move = {'from': tuple(move[0]), 'to': tuple(move[1])}
         player = self.current_player
-        if not self.is_legal_move(move):
+        m = self.encode_move(move)
+        if m is None or not self.is_legal_move(m):
             msg = '走法不合法！正确示例：\n正常走棋：a2a4\n升变：a7a8Q\n王车易位：e1g1\n吃过路兵：a5b6'
             if self.must_capture:
                 msg += '\n当前是有吃必吃模式，请确保有吃必吃！'
             return {'success': False, 'msg': msg}
-        fx, fy = move['from']
-        tx, ty = move['to']
-        piece = self.get_piece(fx, fy)
-        # 判断王车易位
-        if piece and piece[1] == 'K' and fx == tx and abs(fy - ty) == 2:
-            # 王侧易位
-            if ty > fy:
-                self.board[fx][fy] = None
-                self.board[fx][fy+2] = piece
-                self.board[fx][fy+1] = self.board[fx][fy+3]
-                self.board[fx][fy+3] = None
-            # 后侧易位
-            else:
-                self.board[fx][fy] = None
-                self.board[fx][fy-2] = piece
-                self.board[fx][fy-1] = self.board[fx][fy-4]
-                self.board[fx][fy-4] = None
-            self.castling_rights[player+'K'] = False
-            self.castling_rights[player+'Q'] = False
-        # 判断吃过路兵
-        elif piece and piece[1] == 'P' and self.en_passant and (tx, ty) == self.en_passant and abs(fy - ty) == 1 and abs(fx - tx) == 1 and self.get_piece(tx, ty) is None:
-            self.board[tx][ty] = piece
-            self.board[fx][fy] = None
-            self.board[fx][ty] = None  # 吃掉对方兵
-        # 升变
-        elif move.get('promotion'):
-            self.board[tx][ty] = player + move['promotion']
-            self.board[fx][fy] = None
-        # 普通走法
-        else:
-            self.board[tx][ty] = piece
-            self.board[fx][fy] = None
+        self._make(m)
         self.last_move = move
         self.move_history.append(move)
-        # 更新易位权
-        if piece[1] == 'K':
-            self.castling_rights[player+'K'] = False
-            self.castling_rights[player+'Q'] = False
-        if piece[1] == 'R':
-            if fy == 0:
-                self.castling_rights[player+'Q'] = False
-            elif fy == 7:
-                self.castling_rights[player+'K'] = False
-        # 更新en_passant
-        if piece[1] == 'P' and abs(tx - fx) == 2:
-            self.en_passant = ((fx + tx)//2, fy)
-        else:
-            self.en_passant = None
+        next_player = 'b' if player == 'w' else 'w'
+        # 对方的合法走法会被缓存，下一步判断合法性时直接复用
+        legal_moves = self.legal_move_ints(next_player)
         # 有吃必吃模式下，谁先无子谁赢
-        legal_moves = self.generate_legal_moves(next_player)
         if self.must_capture:
-            w_count = sum(1 for x in range(8) for y in range(8) if self.get_piece(x, y) and self.get_piece(x, y)[0] == 'w')
-            b_count = sum(1 for x in range(8) for y in range(8) if self.get_piece(x, y) and self.get_piece(x, y)[0] == 'b')
-            if w_count == 0:
+            if not self.occupancy[WHITE]:
                 self.game_over = True
                 self.winner = 'w'
-            elif b_count == 0:
+            elif not self.occupancy[BLACK]:
                 self.game_over = True
                 self.winner = 'b'
             elif not legal_moves:
@@ -150,9 +274,6 @@ class ChessGame:
                 self.winner = next_player
         else:
             # 走完后判断对方是否被将死或无子可动
-            next_player = 'b' if player == 'w' else 'w'
-            # 可选缓存下一步合法走法
-            # self.next_legal_moves = legal_moves
             if not legal_moves:
                 if self.is_in_check(next_player):
                     self.game_over = True
@@ -160,12 +281,14 @@ class ChessGame:
                 else:
                     self.game_over = True
                     self.winner = None  # 和棋
-        if not self.game_over:
-            self.current_player = 'b' if player == 'w' else 'w'
+        if self.game_over:
+            self.current_player = player
+            self.zobrist ^= ZOBRIST_SIDE
         # 走棋后记录局面哈希
         pos_hash = self.get_position_hash()
         self.position_history.append(pos_hash)
-        repeat_count = self.position_history.count(pos_hash)
+        self.position_counts[pos_hash] += 1
+        repeat_count = self.position_counts[pos_hash]
         repeat_draw = False
         if repeat_count >= 3:
             self.game_over = True
@@ -181,12 +304,135 @@ class ChessGame:
             'is_draw': self.game_over and self.winner is None
         }
 
-    def is_legal_move(self, move):
-        return any(self._move_eq(move, m) for m in self.generate_legal_moves(self.current_player))
+    def encode_move(self, move):
+        # move字典 -> 打包整数，按当前局面补上易位/过路兵/兵走两步标记；格式不对返回None
+        try:
+            (fx, fy), (tx, ty) = move['from'], move['to']
+            promo = move.get('promotion')
+            if not (self.in_board(fx, fy) and self.in_board(tx, ty)) or (promo and promo not in PROMO_KINDS):
+                return None
+        except (KeyError, TypeError, ValueError):
+            return None
+        f, t = fx * 8 + fy, tx * 8 + ty
+        m = encode_move_tuple(f, t, promo)
+        piece = self.squares[f]
+        if piece is None:
+            return m
+        kind = piece % 6
+        if kind == KING and fx == tx and abs(fy - ty) == 2:
+            m |= MOVE_CASTLE
+        elif kind == PAWN:
+            if abs(tx - fx) == 2:
+                m |= MOVE_DOUBLE
+            elif fy != ty and self.squares[t] is None and t == self.ep_square:
+                m |= MOVE_EP
+        return m
+
+    def make_move(self, move):
+        # 原地走棋，只改动涉及的格子、易位权、过路兵和当前方，返回unmake_move需要的还原信息
+        return self._make(self.encode_move(move))
+
+    def unmake_move(self, move, undo):
+        # 撤销make_move
+        self._unmake(undo)
+
+    def _make(self, m):
+        f, t = m & 63, (m >> 6) & 63
+        sq = self.squares
+        bbs = self.bitboards
+        occ = self.occupancy
+        piece = sq[f]
+        color = piece // 6
+        captured = sq[t]
+        key = self.zobrist
+        undo = (m, piece, captured, self.castling, self.ep_square, self.current_player, key)
+        fbit, tbit = 1 << f, 1 << t
+        bbs[piece] ^= fbit
+        occ[color] ^= fbit
+        sq[f] = None
+        key ^= ZOBRIST_PIECES[piece][f]
+        if captured is not None:
+            bbs[captured] ^= tbit
+            occ[1 - color] ^= tbit
+            key ^= ZOBRIST_PIECES[captured][t]
+        promo = (m >> 12) & 7
+        moved = color * 6 + promo if promo else piece
+        bbs[moved] |= tbit
+        occ[color] |= tbit
+        sq[t] = moved
+        key ^= ZOBRIST_PIECES[moved][t]
+        if m & MOVE_CASTLE:
+            # 王车易位，车跟着走
+            rf, rt = (f + 3, f + 1) if t > f else (f - 4, f - 1)
+            rook = sq[rf]
+            if rook is not None:
+                rbits = (1 << rf) | (1 << rt)
+                bbs[rook] ^= rbits
+                occ[color] ^= rbits
+                sq[rt], sq[rf] = rook, None
+                key ^= ZOBRIST_PIECES[rook][rf] ^ ZOBRIST_PIECES[rook][rt]
+        elif m & MOVE_EP:
+            # 吃过路兵，被吃的兵和起点同一行
+            cap = (f & ~7) | (t & 7)
+            pawn = sq[cap]
+            bbs[pawn] ^= 1 << cap
+            occ[1 - color] ^= 1 << cap
+            sq[cap] = None
+            key ^= ZOBRIST_PIECES[pawn][cap]
+        # 更新易位权
+        castling = self.castling & CASTLING_MASK[f] & CASTLING_MASK[t]
+        if castling != self.castling:
+            key ^= ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_CASTLING[castling]
+            self.castling = castling
+        # 更新en_passant
+        if self.ep_square is not None:
+            key ^= ZOBRIST_EP[self.ep_square & 7]
+        if m & MOVE_DOUBLE:
+            self.ep_square = (f + t) >> 1
+            key ^= ZOBRIST_EP[f & 7]
+        else:
+            self.ep_square = None
+        self.current_player = 'b' if color == WHITE else 'w'
+        self.zobrist = key ^ ZOBRIST_SIDE
+        return undo
 
-    def _move_eq(self, m1, m2):
-        keys = ['from', 'to', 'promotion']
-        return all(m1.get(k) == m2.get(k) for k in keys)
+    def _unmake(self, undo):
+        m, piece, captured, self.castling, self.ep_square, self.current_player, self.zobrist = undo
+        f, t = m & 63, (m >> 6) & 63
+        sq = self.squares
+        bbs = self.bitboards
+        occ = self.occupancy
+        color = piece // 6
+        fbit, tbit = 1 << f, 1 << t
+        bbs[sq[t]] ^= tbit
+        occ[color] ^= tbit
+        bbs[piece] |= fbit
+        occ[color] |= fbit
+        sq[f] = piece
+        sq[t] = None
+        if m & MOVE_CASTLE:
+            rf, rt = (f + 3, f + 1) if t > f else (f - 4, f - 1)
+            rook = sq[rt]
+            if rook is not None:
+                rbits = (1 << rf) | (1 << rt)
+                bbs[rook] ^= rbits
+                occ[color] ^= rbits
+                sq[rf], sq[rt] = rook, None
+        elif m & MOVE_EP:
+            cap = (f & ~7) | (t & 7)
+            pawn = (1 - color) * 6 + PAWN
+            bbs[pawn] |= 1 << cap
+            occ[1 - color] |= 1 << cap
+            sq[cap] = pawn
+        elif captured is not None:
+            bbs[captured] |= tbit
+            occ[1 - color] |= tbit
+            sq[t] = captured
+
+    def is_legal_move(self, move):
+        if isinstance(move, dict):
+            move = self.encode_move(move)
+        return move in self.legal_move_set(self.current_player)
 
     def is_path_clear(self, from_x, from_y, to_x, to_y):
         # 检查(from_x, from_y)到(to_x, to_y)之间是否无阻挡
@@ -204,12 +450,7 @@ class ChessGame:
 
     def is_checkmate(self, player):
         # 简化：只判定王是否被吃
-        for i in range(8):
-            for j in range(8):
-                p = self.get_piece(i, j)
-                if p == player + 'K':
-                    return False
-        return True
+        return not self.bitboards[(0 if player == 'w' else 1) * 6 + KING]
 
     def to_dict(self):
         return {
@@ -235,29 +476,89 @@ class ChessGame:
         lm = data.get('last_move')
         if isinstance(lm, dict) and 'from' in lm and 'to' in lm:
             obj.last_move = {
-                'from': tuple(int(x) for x in lm['from']),
-                'to': tuple(int(x) for x in lm['to']),
+                'from': _to_square(lm['from']),
+                'to': _to_square(lm['to']),
                 **{k: v for k, v in lm.items() if k not in ('from', 'to')}
             }
         elif isinstance(lm, list) and len(lm) == 2:
-            obj.last_move = {'from': tuple(int(x) for x in lm[0]), 'to': tuple(int(x) for x in lm[1])}
+            obj.last_move = {'from': _to_square(lm[0]), 'to': _to_square(lm[1])}
         else:
             obj.last_move = None
         obj.move_history = []
         for m in data.get('move_history', []):
             if isinstance(m, dict) and 'from' in m and 'to' in m:
                 obj.move_history.append({
-                    'from': tuple(int(x) for x in m['from']),
-                    'to': tuple(int(x) for x in m['to']),
+                    'from': _to_square(m['from']),
+                    'to': _to_square(m['to']),
                     **{k: v for k, v in m.items() if k not in ('from', 'to')}
                 })
             elif isinstance(m, list) and len(m) == 2:
-                obj.move_history.append({'from': tuple(int(x) for x in m[0]), 'to': tuple(int(x) for x in m[1])})
+                obj.move_history.append({'from': _to_square(m[0]), 'to': _to_square(m[1])})
         obj.castling_rights = data.get('castling_rights', {'wK': True, 'wQ': True, 'bK': True, 'bQ': True})
         obj.en_passant = tuple(data.get('en_passant')) if data.get('en_passant') else None
-        obj.position_history = data.get('position_history', [])
+        obj.zobrist = obj.compute_zobrist()
+        history = data.get('position_history', [])
+        if any(isinstance(h, str) for h in history):
+            # 老存档存的是md5串，和现在的Zobrist哈希对不上，按走法记录重放一遍重新计算
+            history = obj._replay_position_history()
+        obj.position_history = history
+        obj.position_counts = Counter(history)
         return obj
 
+    def _replay_position_history(self):
+        # 从初始局面重放move_history，返回每步之后的局面哈希；重放不出当前局面时放弃历史
+        game = ChessGame(must_capture=self.must_capture)
+        history = []
+        for move in self.move_history:
+            m = game.encode_move(move)
+            if m is None or game.squares[m & 63] is None:
+                return [self.zobrist]
+            game._make(m)
+            history.append(game.zobrist)
+        if game.squares != self.squares:
+            return [self.zobrist] if self.move_history else []
+        if history:
+            history[-1] = self.zobrist  # 终局时当前方没有切换，以存档为准
+        return history
+
+    @classmethod
+    def from_fen(cls, fen, must_capture=False):
+        # 从FEN串构造局面，半回合计数和回合数忽略
+        parts = fen.split()
+        rows = []
+        for rank in parts[0].split('/'):
+            row = []
+            for ch in rank:
+                if ch.isdigit():
+                    row += [None] * int(ch)
+                else:
+                    row.append(('w' if ch.isupper() else 'b') + ch.upper())
+            rows.append(row)
+        obj = cls(must_capture=must_capture)
+        obj.board = rows
+        obj.current_player = parts[1] if len(parts) > 1 else 'w'
+        castling = parts[2] if len(parts) > 2 and not must_capture else '-'
+        obj.castling_rights = {'wK': 'K' in castling, 'wQ': 'Q' in castling, 'bK': 'k' in castling, 'bQ': 'q' in castling}
+        ep = parts[3] if len(parts) > 3 else '-'
+        obj.en_passant = None if ep == '-' else (8 - int(ep[1]), ord(ep[0]) - ord('a'))
+        obj.zobrist = obj.compute_zobrist()
+        return obj
+
+    def to_bytes(self):
+        return game_codec.pack_chess(self.to_dict())
+
+    def pack_move(self, move):
+        # move_history里的一步 -> 16位整数（起点、终点、升变），见game_history
+        (fx, fy), (tx, ty) = move['from'], move['to']
+        return encode_move_tuple(fx * 8 + fy, tx * 8 + ty, move.get('promotion'))
+
+    def play_packed(self, m):
+        return self.move(decode_move(m))
+
+    @classmethod
+    def from_bytes(cls, buf):
+        return cls.from_dict(game_codec.unpack_chess(buf))
+
     def draw_board(self, path=None):
         cell_size = 60
         margin = 40
@@ -312,195 +613,377 @@ class ChessGame:
         return path
 
     def is_capture_move(self, move, player):
-        tx, ty = move['to']
-        fx, fy = move['from']
-        piece = self.get_piece(fx, fy)
-        target = self.get_piece(tx, ty)
-        # 普通吃子
-        if target and target[0] != player:
-            return True
-        # 吃过路兵
-        if piece and piece[1] == 'P' and self.en_passant and (tx, ty) == self.en_passant and abs(fy - ty) == 1 and abs(fx - tx) == 1 and target is None:
-            return True
-        return False
+        if isinstance(move, dict):
+            move = self.encode_move(move)
+        t = (move >> 6) & 63
+        target = self.squares[t]
+        # 普通吃子 / 吃过路兵
+        return (target is not None and PIECE_STR[target][0] != player) or bool(move & MOVE_EP)
 
     def is_in_check(self, player):
         # 判断player是否被将军
-        # 找到王的位置
-        king_pos = None
-        for i in range(8):
-            for j in range(8):
-                if self.get_piece(i, j) == player + 'K':
-                    king_pos = (i, j)
-                    break
-            if king_pos:
-                break
-        if not king_pos:
+        color = 0 if player == 'w' else 1
+        king = self.bitboards[color * 6 + KING]
+        if not king:
             return True  # 王已被吃
-        # 检查对方所有走法是否能吃到王
-        opp = 'b' if player == 'w' else 'w'
-        for i in range(8):
-            for j in range(8):
-                piece = self.get_piece(i, j)
-                if piece and piece[0] == opp:
-                    moves = self._piece_moves(i, j, opp, piece[1])
-                    for m in moves:
-                        if m['to'] == king_pos:
-                            return True
+        return self.is_attacked(king.bit_length() - 1, 1 - color)
+
+    def is_attacked(self, sq, by, occ=None):
+        # 格子sq是否被by方攻击：从sq出发查马、王、兵的攻击表和直线/斜线射线
+        # occ可以传入修改过的占位（比如拿掉王），用来判断王走到sq是否安全
+        bbs = self.bitboards
+        base = by * 6
+        if KNIGHT_ATTACKS[sq] & bbs[base + KNIGHT]:
+            return True
+        if KING_ATTACKS[sq] & bbs[base + KING]:
+            return True
+        if PAWN_ATTACKS[1 - by][sq] & bbs[base + PAWN]:
+            return True
+        if occ is None:
+            occ = self.occupancy[0] | self.occupancy[1]
+        rooks = bbs[base + ROOK] | bbs[base + QUEEN]
+        if rooks and slide_attacks(sq, occ, ROOK_DIRS) & rooks:
+            return True
+        bishops = bbs[base + BISHOP] | bbs[base + QUEEN]
+        if bishops and slide_attacks(sq, occ, BISHOP_DIRS) & bishops:
+            return True
         return False
 
-    def _piece_moves(self, i, j, player, kind):
-        # 只生成(i,j)这个棋子的所有伪合法走法（不考虑送王）
+    def attackers(self, sq, by):
+        # by方攻击格子sq的所有棋子（位棋盘）
+        bbs = self.bitboards
+        base = by * 6
+        occ = self.occupancy[0] | self.occupancy[1]
+        return ((KNIGHT_ATTACKS[sq] & bbs[base + KNIGHT])
+                | (KING_ATTACKS[sq] & bbs[base + KING])
+                | (PAWN_ATTACKS[1 - by][sq] & bbs[base + PAWN])
+                | (slide_attacks(sq, occ, ROOK_DIRS) & (bbs[base + ROOK] | bbs[base + QUEEN]))
+                | (slide_attacks(sq, occ, BISHOP_DIRS) & (bbs[base + BISHOP] | bbs[base + QUEEN])))
+
+    def check_and_pins(self, color):
+        # 从王的位置向外发射线，返回(将军子位棋盘, 可走目标掩码, {被牵制子格子: 允许的目标掩码})
+        bbs = self.bitboards
+        king = bbs[color * 6 + KING].bit_length() - 1
+        opp = 1 - color
+        own = self.occupancy[color]
+        occ = own | self.occupancy[opp]
+        checkers = self.attackers(king, opp)
+        if not checkers:
+            check_mask = -1
+        elif checkers & (checkers - 1):
+            check_mask = 0  # 双将只能走王
+        else:
+            c = checkers.bit_length() - 1
+            check_mask = checkers | BETWEEN[king][c]
+        pins = {}
+        straight = bbs[opp * 6 + ROOK] | bbs[opp * 6 + QUEEN]
+        diagonal = bbs[opp * 6 + BISHOP] | bbs[opp * 6 + QUEEN]
+        for d in range(8):
+            sliders = straight if d in ROOK_DIRS else diagonal
+            ray = RAYS[d][king]
+            if not ray & sliders:
+                continue
+            blockers = ray & occ
+            if not blockers:
+                continue
+            first = (blockers & -blockers).bit_length() - 1 if d < 4 else blockers.bit_length() - 1
+            if not (own >> first) & 1:
+                continue
+            rest = RAYS[d][first] & occ
+            if not rest:
+                continue
+            second = (rest & -rest).bit_length() - 1 if d < 4 else rest.bit_length() - 1
+            if (sliders >> second) & 1:
+                pins[first] = BETWEEN[king][second] | (1 << second)
+        return checkers, check_mask, pins
+
+    def pseudo_move_ints(self, color):
+        # 生成color方所有伪合法走法（不考虑送王），返回打包整数列表
         moves = []
-        if kind == 'P':
-            direction = -1 if player == 'w' else 1
-            start_row = 6 if player == 'w' else 1
-            # 前进一步
-            x, y = i + direction, j
-            if self.in_board(x, y) and not self.get_piece(x, y):
-                # 升变
-                if x == 0 or x == 7:
-                    for promo in ['Q', 'R', 'B', 'N']:
-                        moves.append({'from': (i, j), 'to': (x, y), 'promotion': promo})
+        add = moves.append
+        bbs = self.bitboards
+        own = self.occupancy[color]
+        opp = self.occupancy[1 - color]
+        occ = own | opp
+        base = color * 6
+        # 兵
+        step = -8 if color == WHITE else 8
+        start_row = 6 if color == WHITE else 1
+        pawns = bbs[base + PAWN]
+        ep_bit = 0 if self.ep_square is None else 1 << self.ep_square
+        ep_pawn = (1 - color) * 6 + PAWN
+        while pawns:
+            low = pawns & -pawns
+            pawns ^= low
+            f = low.bit_length() - 1
+            targets = PAWN_ATTACKS[color][f] & opp
+            t = f + step
+            if 0 <= t < 64 and not (occ >> t) & 1:
+                targets |= 1 << t
+                t2 = t + step
+                if f >> 3 == start_row and not (occ >> t2) & 1:
+                    add(f | (t2 << 6) | MOVE_DOUBLE)
+            while targets:
+                low = targets & -targets
+                targets ^= low
+                t = low.bit_length() - 1
+                if t < 8 or t >= 56:
+                    # 升变
+                    for kind in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        add(f | (t << 6) | (kind << 12))
                 else:
-                    moves.append({'from': (i, j), 'to': (x, y)})
-                # 首次前进两步
-                if i == start_row:
-                    x2 = i + 2 * direction
-                    if self.in_board(x2, y) and not self.get_piece(x2, y):
-                        moves.append({'from': (i, j), 'to': (x2, y)})
-            # 吃子
-            for dy in [-1, 1]:
-                x, y2 = i + direction, j + dy
-                if self.in_board(x, y2):
-                    target = self.get_piece(x, y2)
-                    if target and target[0] != player:
-                        if x == 0 or x == 7:
-                            for promo in ['Q', 'R', 'B', 'N']:
-                                moves.append({'from': (i, j), 'to': (x, y2), 'promotion': promo})
-                        else:
-                            moves.append({'from': (i, j), 'to': (x, y2)})
-            # 吃过路兵
-            if self.en_passant:
-                ep_x, ep_y = self.en_passant
-                if abs(ep_y - j) == 1 and ep_x == i + direction:
-                    moves.append({'from': (i, j), 'to': (ep_x, ep_y)})
-        elif kind == 'N':  # 马
-            for dx, dy in [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]:
-                x, y = i + dx, j + dy
-                if self.in_board(x, y):
-                    target = self.get_piece(x, y)
-                    if not target or target[0] != player:
-                        moves.append({'from': (i, j), 'to': (x, y)})
-        elif kind == 'B':  # 象
-            for dx, dy in [(-1, -1), (-1, 1), (1, -1), (1, 1)]:
-                for step in range(1, 8):
-                    x, y = i + dx * step, j + dy * step
-                    if not self.in_board(x, y):
-                        break
-                    target = self.get_piece(x, y)
-                    if not target:
-                        moves.append({'from': (i, j), 'to': (x, y)})
-                    elif target[0] != player:
-                        moves.append({'from': (i, j), 'to': (x, y)})
-                        break
-                    else:
-                        break
-        elif kind == 'R':  # 车
-            for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                for step in range(1, 8):
-                    x, y = i + dx * step, j + dy * step
-                    if not self.in_board(x, y):
-                        break
-                    target = self.get_piece(x, y)
-                    if not target:
-                        moves.append({'from': (i, j), 'to': (x, y)})
-                    elif target[0] != player:
-                        moves.append({'from': (i, j), 'to': (x, y)})
-                        break
-                    else:
-                        break
-        elif kind == 'Q':  # 后
-            for dx, dy in [(-1, -1), (-1, 1), (1, -1), (1, 1), (-1, 0), (1, 0), (0, -1), (0, 1)]:
-                for step in range(1, 8):
-                    x, y = i + dx * step, j + dy * step
-                    if not self.in_board(x, y):
-                        break
-                    target = self.get_piece(x, y)
-                    if not target:
-                        moves.append({'from': (i, j), 'to': (x, y)})
-                    elif target[0] != player:
-                        moves.append({'from': (i, j), 'to': (x, y)})
-                        break
-                    else:
-                        break
-        elif kind == 'K':  # 王
-            for dx in [-1, 0, 1]:
-                for dy in [-1, 0, 1]:
-                    if dx == 0 and dy == 0:
-                        continue
-                    x, y = i + dx, j + dy
-                    if self.in_board(x, y):
-                        target = self.get_piece(x, y)
-                        if not target or target[0] != player:
-                            moves.append({'from': (i, j), 'to': (x, y)})
-            # 王车易位
-            if self.castling_rights[player+'K']:
-                if all(self.get_piece(i, y) is None for y in range(j+1, 7)):
-                    moves.append({'from': (i, j), 'to': (i, j+2)})
-            if self.castling_rights[player+'Q']:
-                if all(self.get_piece(i, y) is None for y in range(1, j)):
-                    moves.append({'from': (i, j), 'to': (i, j-2)})
+                    add(f | (t << 6))
+            if PAWN_ATTACKS[color][f] & ep_bit and self.squares[(f & ~7) | (self.ep_square & 7)] == ep_pawn:
+                add(f | (self.ep_square << 6) | MOVE_EP)
+        # 马、象、车、后、王
+        for kind in (KNIGHT, BISHOP, ROOK, QUEEN, KING):
+            pieces = bbs[base + kind]
+            while pieces:
+                low = pieces & -pieces
+                pieces ^= low
+                f = low.bit_length() - 1
+                if kind == KNIGHT:
+                    targets = KNIGHT_ATTACKS[f]
+                elif kind == BISHOP:
+                    targets = slide_attacks(f, occ, BISHOP_DIRS)
+                elif kind == ROOK:
+                    targets = slide_attacks(f, occ, ROOK_DIRS)
+                elif kind == QUEEN:
+                    targets = slide_attacks(f, occ, BISHOP_DIRS) | slide_attacks(f, occ, ROOK_DIRS)
+                else:
+                    targets = KING_ATTACKS[f]
+                targets &= ~own
+                while targets:
+                    low = targets & -targets
+                    targets ^= low
+                    add(f | ((low.bit_length() - 1) << 6))
+        # 王车易位：王和车之间无子
+        if self.castling:
+            kings = bbs[base + KING]
+            if kings:
+                f = kings.bit_length() - 1
+                row = f & ~7
+                if self.castling & (1 << 2 * color):
+                    between = sum(1 << s for s in range(f + 1, row + 7))
+                    if not occ & between:
+                        add(f | ((f + 2) << 6) | MOVE_CASTLE)
+                if self.castling & (2 << 2 * color):
+                    between = sum(1 << s for s in range(row + 1, f))
+                    if not occ & between:
+                        add(f | ((f - 2) << 6) | MOVE_CASTLE)
         return moves
 
-    def _would_be_in_check(self, player, move):
-        # 判断执行move后player是否被将军
-        import copy
-        tmp = copy.deepcopy(self)
-        fx, fy = move['from']
-        tx, ty = move['to']
-        piece = tmp.get_piece(fx, fy)
-        tmp.board[tx][ty] = piece
-        tmp.board[fx][fy] = None
-        if 'promotion' in move:
-            tmp.board[tx][ty] = player + move['promotion']
-        return tmp.is_in_check(player)
-
-    def generate_legal_moves(self, player):
-        # 生成所有合法走法
-        all_moves = []
-        for i in range(8):
-            for j in range(8):
-                piece = self.get_piece(i, j)
-                if piece and piece[0] == player:
-                    kind = piece[1]
-                    pseudo_moves = self._piece_moves(i, j, player, kind)
-                    if self.must_capture:
-                        # 有吃必吃模式下，后续过滤吃子
-                        all_moves.extend(pseudo_moves)
-                    else:
-                        # 普通模式下，过滤送王
-                        for move in pseudo_moves:
-                            if not self._would_be_in_check(player, move):
-                                all_moves.append(move)
+    def _cached_legal(self, player):
+        # 按(局面哈希, 走棋方)缓存一个局面的合法走法，走棋后哈希变了自然失效
+        # 缓存内容：[哈希, 走棋方, 打包整数列表, 集合(懒生成), 走法字典列表(懒生成), 写法索引(懒生成)]
+        cache = self._legal_cache
+        if cache is None or cache[0] != self.zobrist or cache[1] != player:
+            cache = [self.zobrist, player, self._generate_legal_ints(player), None, None, None]
+            self._legal_cache = cache
+        return cache
+
+    def legal_move_ints(self, player):
+        # 所有合法走法的打包整数列表（缓存，调用方不要修改）
+        return self._cached_legal(player)[2]
+
+    def legal_move_set(self, player):
+        # 合法走法集合，O(1)判断合法性
+        cache = self._cached_legal(player)
+        if cache[3] is None:
+            cache[3] = set(cache[2])
+        return cache[3]
+
+    def move_index(self, player=None):
+        # 各种写法（坐标、SAN、LAN、中文棋子名）-> 走法的索引，每个局面只建一次
+        player = player or self.current_player
+        cache = self._cached_legal(player)
+        if cache[5] is None:
+            cache[5] = MoveIndex(self, cache[2])
+        return cache[5]
+
+    def _generate_legal_ints(self, player):
+        # 生成所有合法走法，返回打包整数列表
+        color = 0 if player == 'w' else 1
+        moves = self.pseudo_move_ints(color)
         if self.must_capture:
-            capture_moves = [m for m in all_moves if self.is_capture_move(m, player)]
-            if capture_moves:
-                # 有吃必吃模式下，如果有得吃，则只返回吃子走法
-                return capture_moves
-        return all_moves
+            # 有吃必吃模式下，如果有得吃，则只返回吃子走法
+            sq = self.squares
+            captures = [m for m in moves if sq[(m >> 6) & 63] is not None or m & MOVE_EP]
+            return captures or moves
+        # 普通模式下，过滤送王。用将军/牵制掩码直接判断，只有易位和吃过路兵才试走
+        king_index = color * 6 + KING
+        kings = self.bitboards[king_index]
+        if not kings:
+            return []
+        king = kings.bit_length() - 1
+        checkers, check_mask, pins = self.check_and_pins(color)
+        occ_without_king = (self.occupancy[0] | self.occupancy[1]) ^ (1 << king)
+        legal = []
+        for m in moves:
+            f = m & 63
+            t = (m >> 6) & 63
+            if m & (MOVE_CASTLE | MOVE_EP):
+                # 不能在被将军时易位，也不能经过被攻击的格子
+                if m & MOVE_CASTLE and (checkers or self.is_attacked((f + t) >> 1, 1 - color)):
+                    continue
+                undo = self._make(m)
+                if not self.is_attacked(self.bitboards[king_index].bit_length() - 1, 1 - color):
+                    legal.append(m)
+                self._unmake(undo)
+            elif f == king:
+                if not self.is_attacked(t, 1 - color, occ_without_king):
+                    legal.append(m)
+            elif (check_mask >> t) & 1 and (f not in pins or (pins[f] >> t) & 1):
+                legal.append(m)
+        return legal
+
+    def perft(self, depth):
+        # 从当前局面往下走depth层的叶子节点数，用来校验走法生成和测速
+        moves = self._generate_legal_ints(self.current_player)
+        if depth <= 1:
+            return len(moves) if depth == 1 else 1
+        nodes = 0
+        for m in moves:
+            undo = self._make(m)
+            nodes += self.perft(depth - 1)
+            self._unmake(undo)
+        return nodes
+
+    def generate_legal_moves(self, player=None):
+        # 生成所有合法走法（字典格式，供提示和机器人用），默认当前走棋方
+        cache = self._cached_legal(player or self.current_player)
+        if cache[4] is None:
+            cache[4] = [decode_move(m) for m in cache[2]]
+        return [dict(m) for m in cache[4]]
+
+# 电脑玩家，占players里的一个座位
+COMPUTER_PLAYER = Player('__computer__', '电脑')
+AI_TIME_LIMIT = 3  # 电脑每步思考秒数
+_engine_pool = None
+
+
+def engine_pool():
+    # 搜索放到子进程里跑，不阻塞事件循环
+    global _engine_pool
+    if _engine_pool is None:
+        _engine_pool = ProcessPoolExecutor(max_workers=2)
+    return _engine_pool
+
+
+class ChessRoom(Room):
+    __slots__ = ('draw_offer',)  # 提出和棋的一方 'w'/'b'
+
+    def __init__(self, game, history, players, status, clock=None):
+        super().__init__(game, history, players, status, clock)
+        self.draw_offer = None
+
+    def to_dict(self):
+        data = super().to_dict()
+        data['draw_offer'] = self.draw_offer
+        return data
+
+    @classmethod
+    def from_dict(cls, data, game, history):
+        room = super().from_dict(data, game, history)
+        room.draw_offer = data.get('draw_offer')
+        return room
+
 
 class ChessBot(ChessGameBase):
     def __init__(self):
-        super().__init__('chess', '681710445ebf6e703ce2a0ed')
+        super().__init__('chess', '681710445ebf6e703ce2a0ed', '国际象棋')
+
+    def make_room(self, game, players, status, clock=None):
+        return ChessRoom(game, GameHistory(game), players, status, clock)
+
+    def new_game(self, variant):
+        # 匹配的变体：'吃'有吃必吃，''普通
+        return ChessGame(must_capture=variant == '吃')
+
+    def variant_name(self, variant):
+        return '（有吃必吃模式）' if variant == '吃' else ''
+
+    def turn_index(self, room):
+        return 0 if room.game.current_player == 'w' else 1
+
+    def flag(self, room, idx):
+        room.game.game_over = True
+        room.game.winner = 'b' if idx == 0 else 'w'
 
-    async def send_board_image(self, game, room_id, msg):
+    def is_computer_turn(self, room):
+        game = room.game
+        idx = 0 if game.current_player == 'w' else 1
+        return len(room.players) == 2 and room.players[idx].id == COMPUTER_PLAYER.id
+
+    async def computer_move(self, room_id, room, msg):
+        import chess_engine
+        if room.thinking:
+            return
+        game = room.game
+        room.thinking = True
+        try:
+            loop = asyncio.get_running_loop()
+            move = await loop.run_in_executor(engine_pool(), chess_engine.think, game.to_bytes(), AI_TIME_LIMIT)
+        finally:
+            room.thinking = False
+        if room.status != RoomStatus.PLAYING or move is None:
+            return
+        response = game.move(move)
+        if not response['success']:
+            return
+        await msg.reply(f"电脑走{move_to_text(move)}。")
+        await self.report_move(room_id, room, response, msg)
+
+    async def report_move(self, room_id, room, response, msg):
+        # 走棋成功后的提示、终局处理；返回对局是否结束
+        game = room.game
+        room.history.record(game)
+        if response.get('repeat_count') == 2:
+            await msg.reply("警告：当前局面已出现两次，再次出现将自动判和！")
+        if response.get('repeat_draw'):
+            await msg.reply("三次重复局面，自动判和，游戏结束。")
+            await self.send_board_image(game, room_id, msg, broadcast=True)
+            room.status = RoomStatus.FINISHED
+            self.archive_game(room, room_id)
+            return True
+        if game.game_over:
+            winner = '白方' if game.winner == 'w' else '黑方' if game.winner else '和棋'
+            await msg.reply(f"{winner}胜利！游戏结束。" if game.winner else "和棋，游戏结束。")
+            await self.send_board_image(game, room_id, msg, broadcast=True)
+            room.status = RoomStatus.FINISHED
+            self.archive_game(room, room_id)
+            return True
+        self.clock_moved(room_id, room)
+        next_player = room.players[0 if game.current_player == 'w' else 1]
+        color = '白方' if game.current_player == 'w' else '黑方'
+        await msg.reply(f"落子成功，轮到{next_player.name}（{color}）{self.clock_text(room)}。")
+        await self.send_board_image(game, room_id, msg, broadcast=True)
+        return False
+
+    async def take_back(self, room_id, room, player, msg):
+        # player悔棋：退到player上一次走棋之前。对方已经应了一步的话退两步
+        plies = 1 if room.game.current_player != player else 2
+        game = room.game = room.history.undo(plies)
+        room.draw_offer = None
+        room.undo_offer = None
+        self.start_clock(room_id, room)
+        next_player = room.players[0 if game.current_player == 'w' else 1]
+        await msg.reply(f"悔棋成功，退回{plies}步，轮到{next_player.name}。")
+        await self.send_board_image(game, room_id, msg, broadcast=True)
+
+    async def send_board_image(self, game, room_id, msg, broadcast=False):
+        # broadcast: 对局里的新局面，同一张图也推给观战的人
         img_path = f"tmp/chess_{room_id}.png"
         game.draw_board(img_path)
+        url = None
         if hasattr(msg, 'reply_image'):
-            await msg.reply_image(img_path)
+            url = await msg.reply_image(img_path)
         else:
             await msg.reply("[图片功能未实现]")
+        if broadcast:
+            players = ' 对 '.join(p.name for p in self.rooms[room_id].players)
+            end = '，对局结束' if game.game_over else ''
+            self.broadcast(room_id, msg, url, f"【观战】国际象棋房间{room_id}（{players}），第{len(game.move_history)}步{end}")
 
     async def message_handler(self, msg):
         user_id = msg.talker_id
@@ -508,22 +991,32 @@ class ChessBot(ChessGameBase):
         # 开房
         if text.startswith('开房'):
             must_capture = False
-            if len(text.split()) > 1:
-                config = text[2:].strip()
+            vs_computer = False
+            clock, config = parse_time_control(text[2:].strip())
+            if config:
                 if '吃' in config:
                     must_capture = True
+                if '电脑' in config:
+                    vs_computer = True
             room_id = self.new_room_id()
-            self.rooms[room_id] = {
-                'game': ChessGame(must_capture=must_capture),
-                'players': [{'id': user_id, 'name': msg.talker_name}],
-                'status': 'waiting',
-                'draw_offer': None
-            }
-            self.user_room[user_id] = room_id
-            if must_capture:
-                await msg.reply(f"房间已创建（有吃必吃模式），房间号: {room_id}，等待其他玩家加入。")
-            else:
-                await msg.reply(f"房间已创建，房间号: {room_id}，等待其他玩家加入。")
+            if vs_computer:
+                players = [Player(user_id, msg.talker_name), COMPUTER_PLAYER]
+                random.shuffle(players)
+                room = self.rooms[room_id] = self.make_room(ChessGame(must_capture=must_capture), players, RoomStatus.PLAYING, clock)
+                self.members.join(user_id, room_id)
+                self.start_clock(room_id, room)
+                mode = ('（有吃必吃模式）' if must_capture else '') + describe_time_control(clock)
+                await msg.reply(f"房间{room_id}已创建{mode}，和电脑对战。{players[0].name}执白先手。")
+                await self.send_board_image(room.game, room_id, msg)
+                if self.is_computer_turn(room):
+                    await self.computer_move(room_id, room, msg)
+                return
+            players = [Player(user_id, msg.talker_name)]
+            room = self.rooms[room_id] = self.make_room(ChessGame(must_capture=must_capture), players, RoomStatus.WAITING, clock)
+            self.members.join(user_id, room_id)
+            self.room_waiting(room_id, room)
+            mode = ('（有吃必吃模式）' if must_capture else '') + describe_time_control(clock)
+            await msg.reply(f"房间已创建{mode}，房间号: {room_id}，等待其他玩家加入。")
         # 加入
         elif text.startswith('加入'):
             room_id = text[2:].strip()
@@ -534,25 +1027,26 @@ class ChessBot(ChessGameBase):
                 await msg.reply("没有这个房间号。")
                 return
             room = self.rooms[room_id]
-            if user_id in [p['id'] for p in room['players']]:
+            if room.seat(user_id) is not None:
                 if room_id == self.user_room.get(user_id):
                     await msg.reply("你丫的已经在这儿了，别瞎折腾了！")
                 else:
-                    self.user_room[user_id] = room_id
+                    self.members.activate(user_id, room_id)
                     await msg.reply("你蛄蛹到这儿了！")
                 return
-            if len(room['players']) >= 2:
+            if len(room.players) >= 2:
                 await msg.reply("没地儿咯！")
                 return
-            room['players'].append({'id': user_id, 'name': msg.talker_name})
-            self.user_room[user_id] = room_id
-            if len(room['players']) == 2:
+            room.add_player(Player(user_id, msg.talker_name))
+            self.members.join(user_id, room_id)
+            if len(room.players) == 2:
                 # 随机决定谁白
-                random.shuffle(room['players'])
-                response = f"加入房间{room_id}成功。游戏开始！{room['players'][0]['name']}先手。"
-                room['status'] = 'playing'
+                room.set_players(random.sample(room.players, 2))
+                response = f"加入房间{room_id}成功。游戏开始！{room.players[0].name}先手。"
+                room.status = RoomStatus.PLAYING
+                self.start_clock(room_id, room)
                 await msg.reply(response)
-                await self.send_board_image(room['game'], room_id, msg)
+                await self.send_board_image(room.game, room_id, msg)
             else:
                 await msg.reply(f"加入房间{room_id}成功，等待对手加入！")
         # 求和
@@ -561,15 +1055,17 @@ class ChessBot(ChessGameBase):
                 await msg.reply("你当前不在任何房间。"); return
             room_id = self.user_room[user_id]
             room = self.rooms.get(room_id)
-            if not room or room['status'] != 'playing':
+            if not room or room.status != RoomStatus.PLAYING:
                 await msg.reply("房间未开始游戏。"); return
-            idx = [p['id'] for p in room['players']].index(user_id)
+            idx = room.seat(user_id)
             player = 'w' if idx == 0 else 'b'
-            if room['game'].current_player != player:
+            if room.game.current_player != player:
                 await msg.reply("还没轮到你下棋。"); return
-            if room.get('draw_offer'):
+            if room.draw_offer:
                 await msg.reply("你已经提出过和棋申请，等待对方回应。"); return
-            room['draw_offer'] = player
+            if room.seat(COMPUTER_PLAYER.id) is not None:
+                await msg.reply("电脑不接受和棋，继续下吧。"); return
+            room.draw_offer = player
             await msg.reply(f"你已向对方提出和棋申请，请对方回复【同意】或【拒绝】。"); return
         # 同意
         elif text == '同意':
@@ -577,15 +1073,17 @@ class ChessBot(ChessGameBase):
                 await msg.reply("你当前不在任何房间。"); return
             room_id = self.user_room[user_id]
             room = self.rooms.get(room_id)
-            if not room or room['status'] != 'playing':
+            if not room or room.status != RoomStatus.PLAYING:
                 await msg.reply("房间未开始游戏。"); return
-            idx = [p['id'] for p in room['players']].index(user_id)
+            idx = room.seat(user_id)
             player = 'w' if idx == 0 else 'b'
-            if not room.get('draw_offer') or room['draw_offer'] == player:
+            if room.undo_offer and room.undo_offer != player:
+                await self.take_back(room_id, room, room.undo_offer, msg); return
+            if not room.draw_offer or room.draw_offer == player:
                 await msg.reply("当前没有对方提出的和棋申请。"); return
-            room['status'] = 'finished'
-            room['game'].game_over = True
-            room['game'].winner = None
+            room.status = RoomStatus.FINISHED
+            room.game.game_over = True
+            room.game.winner = None
             await msg.reply("双方同意和棋，游戏结束。")
             self.archive_game(room, room_id)
             return
@@ -595,60 +1093,76 @@ class ChessBot(ChessGameBase):
                 await msg.reply("你当前不在任何房间。"); return
             room_id = self.user_room[user_id]
             room = self.rooms.get(room_id)
-            if not room or room['status'] != 'playing':
+            if not room or room.status != RoomStatus.PLAYING:
                 await msg.reply("房间未开始游戏。"); return
-            idx = [p['id'] for p in room['players']].index(user_id)
+            idx = room.seat(user_id)
             player = 'w' if idx == 0 else 'b'
-            if not room.get('draw_offer') or room['draw_offer'] == player:
+            if room.undo_offer and room.undo_offer != player:
+                room.undo_offer = None
+                await msg.reply("你已拒绝悔棋申请，继续游戏。"); return
+            if not room.draw_offer or room.draw_offer == player:
                 await msg.reply("当前没有对方提出的和棋申请。"); return
-            room['draw_offer'] = None
+            room.draw_offer = None
             await msg.reply("你已拒绝和棋申请，继续游戏。"); return
+        # 悔棋：要对方同意，电脑直接同意
+        elif text == '悔棋':
+            if user_id not in self.user_room:
+                await msg.reply("你当前不在任何房间。"); return
+            room_id = self.user_room[user_id]
+            room = self.rooms.get(room_id)
+            if not room or room.status != RoomStatus.PLAYING:
+                await msg.reply("房间未开始游戏。"); return
+            if room.thinking:
+                await msg.reply("电脑正在思考，稍后再悔棋。"); return
+            idx = room.seat(user_id)
+            player = 'w' if idx == 0 else 'b'
+            plies = 1 if room.game.current_player != player else 2
+            if room.history.ply - plies < room.history.start:
+                await msg.reply("没有可以悔的棋。"); return
+            if room.draw_offer or room.undo_offer:
+                await msg.reply("还有没回应的申请，等对方回应。"); return
+            if room.seat(COMPUTER_PLAYER.id) is not None:
+                await self.take_back(room_id, room, player, msg); return
+            room.undo_offer = player
+            await msg.reply("你已向对方提出悔棋申请，请对方回复【同意】或【拒绝】。"); return
         # 落子
-        elif re.match(r'^[a-h][1-8][a-h][1-8][qrbn]?$', text.replace(' ', '').lower()):
+        elif MOVE_TEXT_RE.match(text.replace(' ', '')):
             if user_id not in self.user_room:
                 await msg.reply("你当前不在任何房间，请先'开房'或'加入 房间号'。")
                 return
             room_id = self.user_room[user_id]
             room = self.rooms.get(room_id)
-            if not room or room['status'] != 'playing':
+            if not room or room.status != RoomStatus.PLAYING:
                 await msg.reply("房间未开始游戏。"); return
             # 如果有和棋申请，且不是自己提出的，不能走棋
-            if room.get('draw_offer') and [p['id'] for p in room['players']].index(user_id) != (0 if room['draw_offer']=='w' else 1):
+            if room.draw_offer and room.seat(user_id) != (0 if room.draw_offer=='w' else 1):
                 await msg.reply("对方提出了和棋申请，请先回复【同意】或【拒绝】。"); return
-            game = room['game']
-            idx = [p['id'] for p in room['players']].index(user_id)
+            game = room.game
+            idx = room.seat(user_id)
             player = 'w' if idx == 0 else 'b'
+            if room.undo_offer and room.undo_offer != player:
+                await msg.reply("对方提出了悔棋申请，请先回复【同意】或【拒绝】。"); return
             if game.current_player != player:
-                await msg.reply("还没轮到你下棋。"); return
-            move = parse_move_from_text(text, game)
+                if self.is_computer_turn(room):
+                    await msg.reply("电脑正在思考。")
+                    await self.computer_move(room_id, room, msg)
+                else:
+                    await msg.reply("还没轮到你下棋。")
+                return
+            move, error = resolve_move_text(game, text)
             if not move:
-                await msg.reply("落子格式错误，应为: a2a4 或 a7a8Q")
+                await msg.reply(error)
                 return
-            # 走棋前清除和棋申请
-            room['draw_offer'] = None
+            # 走棋前清除和棋、悔棋申请
+            room.draw_offer = None
+            room.undo_offer = None
             response = game.move(move)
             if not response['success']:
                 await msg.reply(response['msg'])
                 return
-            if response.get('repeat_count') == 2:
-                await msg.reply("警告：当前局面已出现两次，再次出现将自动判和！")
-            if response.get('repeat_draw'):
-                await msg.reply("三次重复局面，自动判和，游戏结束。")
-                await self.send_board_image(game, room_id, msg)
-                room['status'] = 'finished'
-                self.archive_game(room, room_id)
-                return
-            if game.game_over:
-                winner = '白方' if game.winner == 'w' else '黑方' if game.winner else '和棋'
-                await msg.reply(f"{winner}胜利！游戏结束。" if game.winner else "和棋，游戏结束。")
-                await self.send_board_image(game, room_id, msg)
-                room['status'] = 'finished'
-                self.archive_game(room, room_id)
-            else:
-                next_player = room['players'][0 if game.current_player == 'w' else 1]
-                color = '白方' if game.current_player == 'w' else '黑方'
-                await msg.reply(f"落子成功，轮到{next_player['name']}（{color}）。")
-                await self.send_board_image(game, room_id, msg)
+            finished = await self.report_move(room_id, room, response, msg)
+            if not finished and self.is_computer_turn(room):
+                await self.computer_move(room_id, room, msg)
         # 查看棋盘
         elif text in ['棋盘', 'board']:
             if user_id not in self.user_room:
@@ -657,43 +1171,246 @@ class ChessBot(ChessGameBase):
             room = self.rooms.get(room_id)
             if not room:
                 await msg.reply("房间不存在。"); return
-            await self.send_board_image(room['game'], room_id, msg)
+            await self.send_board_image(room.game, room_id, msg)
+        # 回放：看第N步之后的局面
+        elif text.startswith('回放'):
+            if user_id not in self.user_room:
+                await msg.reply("你当前不在任何房间。"); return
+            room_id = self.user_room[user_id]
+            room = self.rooms.get(room_id)
+            if not room:
+                await msg.reply("房间不存在。"); return
+            history = room.history
+            n = text[2:].strip()
+            if not n.isdigit() or not history.start <= int(n) <= history.ply:
+                await msg.reply(f"发送【回放 步数】查看第几步之后的局面，可以看{history.start}到{history.ply}步。"); return
+            game = history.position(int(n))
+            last = f"，最后一步{move_to_text(game.last_move)}" if int(n) and game.last_move else ''
+            await msg.reply(f"第{n}步之后的局面（共{history.ply}步）{last}。")
+            await self.send_board_image(game, room_id, msg)
+        # 分析当前局面：少子残局查残局库，否则让引擎算一会儿
+        elif text == '分析':
+            import chess_engine
+            if user_id not in self.user_room:
+                await msg.reply("你当前不在任何房间。"); return
+            room = self.rooms.get(self.user_room[user_id])
+            if not room:
+                await msg.reply("房间不存在。"); return
+            if room.thinking:
+                await msg.reply("电脑正在思考，稍后再分析。"); return
+            loop = asyncio.get_running_loop()
+            move, desc = await loop.run_in_executor(engine_pool(), chess_engine.analyse,
+                                                    room.game.to_bytes(), AI_TIME_LIMIT)
+            if move is None:
+                await msg.reply(desc); return
+            await msg.reply(f"{desc}，推荐{move_to_text(move)}。")
+        # 匹配：【匹配】、【匹配 吃】
+        elif text.startswith('匹配'):
+            await self.enqueue_match(msg, '吃' if '吃' in text else '')
+        elif text == '取消匹配':
+            await self.cancel_match(msg)
+        # 同时在好几个房间时：列出来、换活动房间
+        elif text == '我的房间':
+            await self.my_rooms(msg)
+        elif text.startswith('切换'):
+            await self.switch_room(msg, text[2:].strip())
+        # 观战
+        elif text.startswith(('观战', '取消观战')):
+            await self.watch_handler(msg)
+        # 战绩/排行
+        elif text == '战绩':
+            await msg.reply(self.stats.format_record(user_id))
+        elif text == '排行':
+            await msg.reply(self.stats.format_leaderboard())
         elif text.lower() in ['说明', 'help', '帮助']:
-            await msg.reply("【开房】\n【开房 吃】有吃必吃\n【加入 xxxx】加入某个房间\n【棋盘】查看当前棋盘\n【求和】向对方提出和棋申请\n【同意/拒绝】同意/拒绝和棋\n走棋用起点终点坐标，例如a2a4\n升变：a7a8Q\n王车易位：直接指定王的起点终点坐标")
+            await msg.reply("【开房】\n【开房 吃】有吃必吃\n【开房 电脑】和电脑下（可加“吃”）\n【开房 10+5】每方10分钟，每步加5秒；【开房 每步30】每步限30秒（可以和别的一起用）\n【加入 xxxx】加入某个房间\n【匹配】按等级分自动找对手（可加“吃”），【取消匹配】退出\n【我的房间】列出你在的所有房间，【切换 xxxx】换到其中一个\n【棋盘】查看当前棋盘\n【分析】分析当前局面\n【求和】向对方提出和棋申请\n【悔棋】向对方提出悔棋申请\n【同意/拒绝】同意/拒绝和棋、悔棋\n【回放 N】查看第N步之后的局面\n【观战 xxxx】私聊推送某个房间的每一步（别的频道里用【观战 国际象棋 xxxx】推送到那里）\n【取消观战】\n【战绩】查看自己的战绩\n【排行】查看排行榜\n走棋用起点终点坐标（a2a4）或代数记谱（Nf3、exd5、O-O、e8=Q、马f3）\n升变：a7a8Q\n王车易位：王的起点终点坐标或O-O/O-O-O")
         else:
             pass
             # await msg.reply("指令无效。支持：\n开房\n加入 房间号\n[a2 a4]走法\n棋盘 查看棋盘")
 
-    def room_to_dict(self, room):
-        # 兼容新老格式，序列化draw_offer
-        d = {
-            'game': room['game'].to_dict(),
-            'players': room['players'],
-            'status': room['status'],
-            'draw_offer': room.get('draw_offer', None)
-        }
-        return d
+    def game_result(self, data):
+        # players[0]执白
+        # 和电脑下的不计等级分
+        if any(p['id'] == COMPUTER_PLAYER.id for p in data.get('players', [])):
+            return None
+        winner = data['game'].get('winner')
+        return 1 if winner == 'w' else 0 if winner == 'b' else 0.5
 
     def dict_to_room(self, data):
-        # 兼容新老格式，反序列化draw_offer
-        room = {
-            'game': ChessGame.from_dict(data['game']),
-            'players': data['players'],
-            'status': data['status'],
-            'draw_offer': data.get('draw_offer', None)
-        }
-        return room
+        game = ChessGame.from_dict(data['game'])
+        # 悔棋/回放的历史不存盘，读档时按走法记录重放出来
+        history = GameHistory.rebuild(ChessGame(must_capture=game.must_capture), game)
+        return ChessRoom.from_dict(data, game, history)
+
+def move_to_text(move):
+    # 走法字典 -> a7a8Q 这样的坐标写法
+    (fx, fy), (tx, ty) = move['from'], move['to']
+    text = f"{chr(ord('a') + fy)}{8 - fx}{chr(ord('a') + ty)}{8 - tx}"
+    return text + move.get('promotion', '')
 
 def parse_move_from_text(text, game):
-    # 支持 a7a8Q, a7a8, a7 a8 Q, a7 a8q, a7a8q 等格式
-    text = text.replace(' ', '').lower()
-    m = re.match(r'^([a-h][1-8])([a-h][1-8])([qrbn])?$', text)
-    if not m:
+    # 任意支持的写法 -> 走法字典，不合法或有歧义返回None
+    m, status, _ = game.move_index().resolve(text)
+    return decode_move(m) if status == 'ok' else None
+
+def resolve_move_text(game, text):
+    # 返回 (走法字典, None) 或 (None, 给玩家的提示)
+    m, status, names = game.move_index().resolve(text)
+    if status == 'ok':
+        return decode_move(m), None
+    if status == 'ambiguous':
+        return None, f"有歧义，你是想走{'、'.join(names)}？"
+    if names:
+        return None, f"走法不合法。你是不是想走{'、'.join(names)}？"
+    return None, "走法不合法！示例：a2a4、Nf3、exd5、O-O、e8=Q"
+
+SAN_LETTERS = {KNIGHT: 'N', BISHOP: 'B', ROOK: 'R', QUEEN: 'Q', KING: 'K'}
+SAN_KINDS = {v: k for k, v in SAN_LETTERS.items()}
+SAN_RE = re.compile(r'^([NBRQK])?([a-h])?([1-8])?(x)?([a-h][1-8])(?:=?([NBRQ]))?$')
+
+
+def square_name(sq):
+    return f"{chr(ord('a') + (sq & 7))}{8 - (sq >> 3)}"
+
+
+def move_to_san(game, m, legal=None):
+    # 打包走法 -> SAN（标准代数记谱），在走之前的局面上调用；legal为当前方合法走法，用于消歧
+    f, t = m & 63, (m >> 6) & 63
+    piece = game.squares[f]
+    kind = piece % 6
+    if m & MOVE_CASTLE:
+        san = 'O-O' if (t & 7) > (f & 7) else 'O-O-O'
+    elif kind == PAWN:
+        capture = game.squares[t] is not None or m & MOVE_EP
+        san = (square_name(f)[0] + 'x' if capture else '') + square_name(t)
+        if m & 0x7000:
+            san += '=' + PROMO_LETTERS[(m >> 12) & 7]
+    else:
+        disambig = ''
+        if game.bitboards[piece] & (game.bitboards[piece] - 1):
+            if legal is None:
+                legal = game.legal_move_ints(game.current_player)
+            others = [o & 63 for o in legal if (o >> 6) & 63 == t and o & 63 != f and game.squares[o & 63] == piece]
+            if others:
+                if all((o & 7) != (f & 7) for o in others):
+                    disambig = square_name(f)[0]
+                elif all((o >> 3) != (f >> 3) for o in others):
+                    disambig = square_name(f)[1]
+                else:
+                    disambig = square_name(f)
+        capture = 'x' if game.squares[t] is not None else ''
+        san = SAN_LETTERS[kind] + disambig + capture + square_name(t)
+    if not game.must_capture:
+        # 有吃必吃没有将军的说法，不加+/#
+        undo = game._make(m)
+        if game.is_in_check(game.current_player):
+            san += '#' if not game._generate_legal_ints(game.current_player) else '+'
+        game._unmake(undo)
+    return san
+
+
+def parse_san(game, text):
+    # SAN -> 当前方的合法打包走法，不合法或有歧义返回None
+    text = text.rstrip('+#!?').replace('0', 'O')
+    legal = game.legal_move_ints(game.current_player)
+    if text in ('O-O', 'O-O-O'):
+        for m in legal:
+            if m & MOVE_CASTLE and (((m >> 6) & 7) > (m & 7)) == (text == 'O-O'):
+                return m
         return None
-    from_sq, to_sq, promo = m.groups()
-    from_x, from_y = 8 - int(from_sq[1]), ord(from_sq[0]) - ord('a')
-    to_x, to_y = 8 - int(to_sq[1]), ord(to_sq[0]) - ord('a')
-    move = {'from': (from_x, from_y), 'to': (to_x, to_y)}
-    if promo:
-        move['promotion'] = promo.upper()
-    return move
+    match = SAN_RE.match(text)
+    if not match:
+        return None
+    letter, file_, rank, _, dest, promo = match.groups()
+    kind = SAN_KINDS[letter] if letter else PAWN
+    t = (8 - int(dest[1])) * 8 + ord(dest[0]) - ord('a')
+    promo_bits = PROMO_KINDS[promo] << 12 if promo else 0
+    found = None
+    for m in legal:
+        if (m >> 6) & 63 != t or m & MOVE_CASTLE or m & 0x7000 != promo_bits:
+            continue
+        f = m & 63
+        if game.squares[f] % 6 != kind:
+            continue
+        if file_ and (f & 7) != ord(file_) - ord('a'):
+            continue
+        if rank and (f >> 3) != 8 - int(rank):
+            continue
+        if found is not None:
+            return None
+        found = m
+    return found
+
+
+# 输入写法归一化：中文棋子名换成字母，去掉空格、连字符、吃子/升变/将军符号
+MOVE_TEXT_RE = re.compile(
+    r'^(?:[KQRBNPkqrbnp皇王厚后車车相象馬马兵卒]?[a-hA-H]?[1-8]?[x:\-]?[a-hA-H][1-8]'
+    r'(?:=?[QRBNqrbn厚后車车相象馬马])?|[Oo0]-?[Oo0](?:-?[Oo0])?|[长短]易位)[+#!?]*$')
+_MOVE_TEXT_TABLE = str.maketrans({
+    '皇': 'K', '王': 'K', '厚': 'Q', '后': 'Q', '車': 'R', '车': 'R',
+    '相': 'B', '象': 'B', '馬': 'N', '马': 'N', '兵': 'P', '卒': 'P', '0': 'O',
+})
+
+
+def normalize_move_text(text):
+    text = text.replace('短易位', 'OO').replace('长易位', 'OOO').translate(_MOVE_TEXT_TABLE)
+    text = re.sub(r'[\s\-x:=+#!?]', '', text)
+    if len(text) > 2 and text[0] in 'Pp' and text[1] in 'abcdefgh':
+        text = text[1:]  # Pe4 / 兵e4
+    return text
+
+
+class MoveIndex:
+    # 一个局面所有合法走法的各种写法 -> 走法；写法冲突时记为有歧义
+    __slots__ = ('exact', 'lower', 'names', 'moves')
+
+    def __init__(self, game, moves):
+        exact = {}
+        self.moves = moves
+        self.names = {}
+        for m in moves:
+            san = move_to_san(game, m, moves)
+            self.names[m] = san
+            f, t = m & 63, (m >> 6) & 63
+            fn, tn = square_name(f), square_name(t)
+            kind = game.squares[f] % 6
+            promo = PROMO_LETTERS[(m >> 12) & 7] if m & 0x7000 else ''
+            keys = {normalize_move_text(san), fn + tn + promo.lower(), fn + tn + promo}
+            if kind == PAWN:
+                if promo:
+                    # 升变不写兵种时列出所有升变供选择
+                    keys.add(fn + tn)
+                    keys.add(tn if fn[0] == tn[0] else fn[0] + tn)
+                if fn[0] != tn[0]:
+                    keys.add(fn + tn + promo)
+            else:
+                letter = SAN_LETTERS[kind]
+                keys.update((letter + tn, letter + fn[0] + tn, letter + fn[1] + tn, letter + fn + tn))
+            for key in keys:
+                exact.setdefault(key, set()).add(m)
+        lower = {}
+        for key, ms in exact.items():
+            lower.setdefault(key.lower(), set()).update(ms)
+        self.exact = exact
+        self.lower = lower
+
+    def resolve(self, text):
+        # 返回 (走法整数或None, 'ok'/'ambiguous'/'illegal', 候选走法的SAN列表)
+        key = normalize_move_text(text)
+        ms = self.exact.get(key) or self.lower.get(key.lower())
+        if ms:
+            if len(ms) == 1:
+                return next(iter(ms)), 'ok', []
+            return None, 'ambiguous', sorted(self.names[m] for m in ms)
+        return None, 'illegal', self.suggest(key)
+
+    def suggest(self, key, n=3):
+        # 猜玩家想走哪步：先找终点相同的走法，再按字面相似度找
+        dest = re.findall(r'[a-h][1-8]', key.lower())
+        if dest:
+            t = dest[-1]
+            same = [self.names[m] for m in self.moves if square_name((m >> 6) & 63) == t]
+            if same:
+                return sorted(same)[:n]
+        by_key = {normalize_move_text(name): name for name in self.names.values()}
+        return [by_key[k] for k in difflib.get_close_matches(key, list(by_key), n)]
@@ -1,32 +1,230 @@
+import asyncio
 import random
 import re
 import cv2
 import numpy as np
 import os
 import json
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 if __name__ == "__main__":
     import sys
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from chess_base import ChessGameBase
+from chess_base import ChessGameBase, parse_time_control, describe_time_control
+from game_history import GameHistory
+from room import Player, Room, RoomStatus
+import game_codec
+
+# 四个方向，顺序和continuous_num的返回值一致
+DIRECTIONS = [(1, 0), (0, 1), (1, 1), (1, -1)]
+PAD = 6  # 批量计算时棋盘四周补的空边；每侧最多数5个子，再看外面一格
+
+# 批量评估用的棋形分：按 [连子数(封顶5)][活头数0~2]
+POINT_SCORES = [
+    [0, 0, 0],
+    [0, 1, 4],
+    [0, 10, 40],
+    [0, 100, 1000],
+    [0, 2000, 10000],
+    [100000, 100000, 100000],
+]
+
+
+CELL_SIZE = 40
+MARGIN = 50  # 坐标写在离边线20像素以外，重画边上的格子时不会擦到
+VIEW_SIZE = 19    # 比这大的棋盘只画棋子附近VIEW_SIZE见方的一块
+VIEW_MARGIN = 3   # 显示区域至少在棋子外面留几格
+RENDER_CACHE_SIZE = 8  # 最近画过的几盘棋的图留在内存里，下次只重画变了的格子
+_render_cache = OrderedDict()  # id(game) -> (game, (显示区域, 是否画禁手点), 图)
+
+MAX_BOARD_SIZE = 255  # 存档里行数、列数各占1字节
+INFINITE_SIZE = MAX_BOARD_SIZE  # 【开房 无限】就用最大的棋盘，从中间开始下
+POINT_RE = re.compile(r'^([A-Za-z]{1,2})(\d{1,3})$')
+
+
+def row_label(x):
+    # 行坐标：A~Z之后接着AA、AB……
+    if x < 26:
+        return chr(ord('A') + x)
+    return chr(ord('A') + x // 26 - 1) + chr(ord('A') + x % 26)
+
+
+def point_name(x, y):
+    return f'{row_label(x)}{y + 1}'
+
+
+def parse_point(text):
+    # 'H8'、'ab12' -> (x, y)；格式不对返回None，越界交给move判断
+    m = POINT_RE.match(text.strip())
+    if not m:
+        return None
+    letters = m.group(1).upper()
+    x = ord(letters[-1]) - ord('A')
+    if len(letters) == 2:
+        x += (ord(letters[0]) - ord('A') + 1) * 26
+    return x, int(m.group(2)) - 1
+
+
+# 禁手判断查表：一条线上以落子点为中心的11格（左右各5格）决定这条线的棋形
+LINE_OFFSETS = [k for k in range(-5, 6) if k != 0]
+LINE_WEIGHTS = [3 ** (len(LINE_OFFSETS) - 1 - i) for i in range(len(LINE_OFFSETS))]  # 各偏移在line_key里的权
+FIVE, OVERLINE = 1, 2
+MAX_FORBIDDEN_DEPTH = 4
+_line_table = [None] * 3 ** len(LINE_OFFSETS)
+
+
+def _run_through(cells, i):
+    # cells是下标-5..5映射到0..10的列表，返回含i的黑子连续段 [l, r]
+    l = r = i
+    while l > 0 and cells[l - 1] == 1:
+        l -= 1
+    while r < 10 and cells[r + 1] == 1:
+        r += 1
+    return l, r
+
+
+def _five_points(cells):
+    # 补上就让中心所在段恰好成5的空点
+    points = []
+    for e in range(11):
+        if cells[e] != 0:
+            continue
+        cells[e] = 1
+        l, r = _run_through(cells, 5)
+        if r - l == 4 and l <= e <= r:
+            points.append(e)
+        cells[e] = 0
+    return points
+
+
+def _classify(key):
+    cells = []
+    for _ in LINE_OFFSETS:
+        cells.append(key % 3)
+        key //= 3
+    cells.reverse()
+    cells.insert(5, 1)
+    l, r = _run_through(cells, 5)
+    if r - l == 4:
+        return FIVE, 0, ()
+    if r - l >= 5:
+        return OVERLINE, 0, ()
+    fives = _five_points(cells)
+    if len(fives) == 2 and fives[1] - fives[0] == 5:
+        return 0, 1, ()  # 活四
+    if fives:
+        return 0, min(len(fives), 2), ()  # 冲四；一条线上两个冲四也算双四
+    # 活三：再下一子能成活四（两头都能恰好成5）的点
+    three_points = []
+    for e in range(1, 10):
+        if cells[e] != 0:
+            continue
+        cells[e] = 1
+        fives = _five_points(cells)
+        if len(fives) == 2 and fives[1] - fives[0] == 5:
+            three_points.append(e - 5)
+        cells[e] = 0
+    return 0, 0, tuple(three_points)
+
+
+def line_shape(key):
+    # 查表：(FIVE/OVERLINE/0, 这条线上四的个数, 能补成活四的点相对中心的偏移)；首次遇到时计算
+    shape = _line_table[key]
+    if shape is None:
+        shape = _line_table[key] = _classify(key)
+    return shape
+
+
+def renju_shape(keys):
+    # 4个方向（顺序同DIRECTIONS）的line_key → (结论, 活三列表)；结论为None表示有两个以上疑似活三，要递归确认
+    shapes = [(dx, dy) + line_shape(key) for (dx, dy), key in zip(DIRECTIONS, keys)]
+    if any(shape[2] == FIVE for shape in shapes):
+        return False, [] # 恰好成5，不禁手（同时长连也算赢）
+    if any(shape[2] == OVERLINE for shape in shapes):
+        return '长连', []
+    fours = 0
+    threes = []
+    for dx, dy, _, line_fours, three_points in shapes:
+        fours += line_fours
+        if three_points:
+            threes.append((dx, dy, three_points))
+    if fours >= 2:
+        return '双四', []
+    if len(threes) < 2:
+        return False, []
+    return None, threes
+
 
 class GomokuGame:
-    def __init__(self, forbidden_rule=False):
-        self.board_size = (15, 15)
-        self.board = [[0] * self.board_size[0] for _ in range(self.board_size[1])] # 0: 空, 1: 黑棋, 2: 白棋
+    def __init__(self, forbidden_rule=False, board_size=(15, 15)):
+        self._clear(board_size) # 0: 空, 1: 黑棋, 2: 白棋
         self.current_player = 1 # 1: 黑棋, 2: 白棋
         self.game_over = False
         self.winner = None
+
         self.last_move = None
         self.forbidden_rule = forbidden_rule
-    
-    def move(self, player, x, y):
+        self.move_history = []  # [(x, y), ...]，黑先，轮流落子
+
+    @property
+    def board(self):
+        # 稠密数组只给批量计算用：第一次访问时由stone_map生成，之后落子同步更新
+        if self._board is None:
+            board = np.zeros(self.board_size, dtype=np.int8)
+            for (x, y), v in self.stone_map.items():
+                board[x, y] = v
+            self._board = board
+        return self._board
+
+    @board.setter
+    def board(self, board):
+        # 接受二维list或数组，整盘换掉
+        board = np.array(board, dtype=np.int8)
+        self._clear(board.shape)
+        for x, y in np.argwhere(board):
+            self._put(int(x), int(y), int(board[x, y]))
+        self._board = board
+
+    def _clear(self, board_size):
+        # 空棋盘；棋子存在稀疏的stone_map里，落子、判胜负、禁手、画图都只和附近的棋子有关
+        self.board_size = tuple(board_size)
+        self.stone_map = {}  # (x, y) -> 1/2
+        self.stones = 0
+        self.bounds = None  # 所有棋子的外接矩形 (x0, y0, x1, y1)，含端点
+        self._dirty = set()  # 上次画图之后变过的格子，见draw_board
+        self._forbidden = None  # 禁手点缓存，见forbidden_points
+        self._board = None
+
+    def _put(self, x, y, player):
+        # 摆一个子（player为0表示拿掉），只维护棋子表、外接矩形和脏格子，不管规则
+        if player:
+            self.stones += (x, y) not in self.stone_map
+            self.stone_map[(x, y)] = player
+            if self.bounds is None:
+                self.bounds = (x, y, x, y)
+            else:
+                x0, y0, x1, y1 = self.bounds
+                self.bounds = (min(x0, x), min(y0, y), max(x1, x), max(y1, y))
+        elif self.stone_map.pop((x, y), None):
+            self.stones -= 1
+        if self._board is not None:
+            self._board[x, y] = player
+        self._dirty.add((x, y))
+
+    def set_stone(self, x, y, player):
+        # 不按规则直接摆子/拿掉子（摆局面、测试用）；禁手点缓存作废
+        self._put(x, y, player)
+        self._forbidden = None
+
+    def move(self, player, x, y, replay=False):
         # return: {'success': bool, 'winner': int-0/1/2, 'msg': str}
+        # replay: 重放记录里判过禁手的落子，不再判（刚恢复的局面不用为一步把整盘禁手点算出来）
         # 是否越界
         if not (0 <= x < self.board_size[0] and 0 <= y < self.board_size[1]):
             return {'success': False, 'winner': 0, 'msg': '你聋啊？这都跑棋盘外边儿了！'}
         # 是否已有棋子
-        if self.board[x][y] != 0:
+        if (x, y) in self.stone_map:
             return {'success': False, 'winner': 0, 'msg': '你瞎呀？这儿已经有子儿了！'}
         # 是否轮到当前玩家
         if self.current_player != player:
@@ -34,19 +232,18 @@ class GomokuGame:
         # 禁手判断
         is_forbidden = False
         forbidden_type = ''
-        win = False
-        if self.forbidden_rule and player == 1:
-            # 先假设落子
-            self.board[x][y] = player
-            win = self.check_win(player, x, y, exact_five=True)
-            self.board[x][y] = 0
-            forbidden_type = self.check_forbidden(x, y)
-            if forbidden_type and not win:
-                self.board[x][y] = 0
+        if self.forbidden_rule and player == 1 and not replay:
+            forbidden_type = self.forbidden_points().get((x, y))
+            if forbidden_type:
                 return {'success': False, 'winner': 0, 'msg': f'黑方禁手[{forbidden_type}]，禁止落子！'}
         # 真正落子
-        self.board[x][y] = player
+        self._put(x, y, player)
+        if self.forbidden_rule:
+            self._update_forbidden(x, y)
+        if self.last_move:
+            self._dirty.add(self.last_move[1:])  # 上一步的标记要擦掉
         self.last_move = (player, x, y)
+        self.move_history.append((x, y))
         if self.check_win(player, x, y):
             self.game_over = True
             self.winner = player
@@ -59,248 +256,498 @@ class GomokuGame:
             self.current_player = 2 if player == 1 else 1
             return {'success': True, 'winner': 0, 'msg': ''}
 
+    # 过x,y的4条直线（数组视图，不拷贝）及x,y在各条线上的下标，方向顺序同DIRECTIONS
+    def lines_through(self, x, y):
+        b = self.board
+        w = b.shape[1]
+        return [
+            (b[:, y], x),
+            (b[x, :], y),
+            (b.diagonal(y - x), min(x, y)),
+            (b[:, ::-1].diagonal(w - 1 - y - x), min(x, w - 1 - y)),
+        ]
+
+    def run_length(self, x, y, dx, dy, player):
+        # 沿(dx, dy)数含x,y的player连子数（x,y按player算），只查棋子表
+        get = self.stone_map.get
+        n = 1
+        for d in (1, -1):
+            nx, ny = x + dx * d, y + dy * d
+            while get((nx, ny)) == player:
+                n += 1
+                nx, ny = nx + dx * d, ny + dy * d
+        return n
+
     # 包含x,y，4个方向的最长连续个数，返回list，每个方向一个数
     def continuous_num(self, x, y, player):
-        if self.board[x][y] != player:
+        if self.stone_map.get((x, y)) != player:
             return [0, 0, 0, 0] # 如果x,y不是player，还连个锤子
-        directions = [(1, 0), (0, 1), (1, 1), (1, -1)]
-        counts = []
-        for dx, dy in directions:
-            count = 0
-            for d in [1, -1]: # 1 正方向，-1 反方向
-                nx, ny = x, y
-                while True:
-                    nx, ny = nx + dx * d, ny + dy * d
-                    if 0 <= nx < self.board_size[0] and 0 <= ny < self.board_size[1] and self.board[nx][ny] == player:
-                        count += 1
-                    else:
-                        break
-            counts.append(count+1) # 包含x,y本身
-        return counts
-    
+        return [self.run_length(x, y, dx, dy, player) for dx, dy in DIRECTIONS]
+
     def check_win(self, player, x, y, exact_five=False):
-        # 检查8个方向，是否有连续5子
-        counts = self.continuous_num(x, y, player)
-        if exact_five:
-            return 5 in counts
-        else:
-            return max(counts) >= 5
-    
+        # 过x,y的线上是否成5（x,y按已落子算）；exact_five时必须恰好5个，长连不算
+        for dx, dy in DIRECTIONS:
+            n = self.run_length(x, y, dx, dy, player)
+            if n == 5 or (n > 5 and not exact_five):
+                return True
+        return False
+
+    def line_key(self, x, y, dx, dy):
+        # 以x,y为中心、沿(dx,dy)的11格窗口编码成查表下标（中心格不编码，出界按白子算）
+        h, w = self.board_size
+        get = self.stone_map.get
+        key = 0
+        for k in LINE_OFFSETS:
+            nx, ny = x + dx * k, y + dy * k
+            v = get((nx, ny), 0) if 0 <= nx < h and 0 <= ny < w else 2
+            key = key * 3 + v
+        return key
+
+    def forbidden_shape(self, x, y, keys=None):
+        # 只看x,y所在4条线的棋形，见renju_shape；keys是4个方向的line_key，已知时直接传进来
+        if keys is None:
+            keys = [self.line_key(x, y, dx, dy) for dx, dy in DIRECTIONS]
+        return renju_shape(keys)
+
     def check_forbidden(self, x, y, depth=0): # False表示不禁手，否则返回禁手类型字符串
-        # 检查禁手：双活三、双四、长连
-        indent = '  ' * depth
-        #print(f"{indent}check_forbidden: 检查({x},{y}) depth={depth}")
-        temp = self.board[x][y]
-        self.board[x][y] = 1 # 模拟落子
-        counts = self.continuous_num(x, y, 1)
-        if 5 in counts:
-            result = False # 恰好成5，不禁手
-            print(f"{indent}  -> 恰好成5，不禁手")
-        elif max(counts) >= 6:
-            result = '长连'
-            print(f"{indent}  -> 长连")
-        elif self.four_count(x, y) >= 2:
-            print('four_count', self.four_count(x, y))
-            result = '双四'
-            print(f"{indent}  -> 双四")
-        elif self.live_three_count(x, y, depth=depth+1) >= 2:
-            result = '双活三'
-            print(f"{indent}  -> 双活三")
+        # 黑棋在x,y落子是否禁手：每条线查表得到棋形，只有疑似双活三时才递归确认活三是真的
+        result, threes = self.forbidden_shape(x, y)
+        if result is not None:
+            return result
+        if depth >= MAX_FORBIDDEN_DEPTH:
+            return False
+        # 活三要能下成真活四：补成活四的那一点本身不能是禁手
+        stone_map = self.stone_map
+        temp = stone_map.get((x, y))
+        stone_map[(x, y)] = 1
+        real = 0
+        for dx, dy, points in threes:
+            for k in points:
+                if not self.check_forbidden(x + dx * k, y + dy * k, depth + 1):
+                    real += 1
+                    break
+        if temp is None:
+            del stone_map[(x, y)]
         else:
-            result = False
-            print(f"{indent}  -> 非禁手")
-        self.board[x][y] = temp # 恢复
+            stone_map[(x, y)] = temp
+        return '双活三' if real >= 2 else False
+
+    def forbidden_points(self):
+        # 当前黑棋的禁手点 {(x, y): 禁手类型}；第一次调用时算一遍，之后每步落子增量更新
+        if self._forbidden is None:
+            self._line_keys = [{} for _ in DIRECTIONS]  # (x, y) -> line_key，用到时才算，落子时原地更新
+            self._forbidden = {}
+            self._double_threes = set()
+            # 禁手点的窗口里一定有黑子，只看黑子周围（各条线上11格窗口够得着）的空点
+            points = set()
+            for (x, y), v in self.stone_map.items():
+                if v == 1:
+                    points.update(p for p, _, _ in self._window_points(x, y))
+            for x, y in points:
+                if (x, y) not in self.stone_map:
+                    self._update_forbidden_point(x, y)
+        return self._forbidden
+
+    def _window_points(self, x, y):
+        # 窗口里含x,y的点，及x,y在它窗口里的方向下标和权：[((nx, ny), 方向下标, 权), ...]
+        h, w = self.board_size
+        result = []
+        for d, (dx, dy) in enumerate(DIRECTIONS):
+            for k, weight in zip(LINE_OFFSETS, LINE_WEIGHTS):
+                # 对中心在x,y反方向k格处的点来说，x,y在它窗口的偏移k处
+                nx, ny = x - dx * k, y - dy * k
+                if 0 <= nx < h and 0 <= ny < w:
+                    result.append(((nx, ny), d, weight))
         return result
-    
-    # 沿一条直线，判断黑棋在x,y落子后，能形成几个四
-    def four_count_one_line(self, x, y, dx, dy):
-        zero_position = None # 记录能成5的0的位置，最后再看一下是否有两个0间隔4，如果有则说明是活四，而不是双死四
-        all_four_count = 0
-        live_four_count = 0
-        # 每个方向
-        for d in [1, -1]:
-            for i in range(1, 5): # 往前最多看4个，1, 2, 3, 4
-                nx, ny = x + dx * i * d, y + dy * i * d
-                if 0 <= nx < self.board_size[0] and 0 <= ny < self.board_size[1]:
-                    if self.board[nx][ny] == 0:
-                        # 找到空白，判断填上后是否恰好成5
-                        temp = self.board[nx][ny]
-                        self.board[nx][ny] = 1
-                        counts = self.continuous_num(nx, ny, 1)
-                        if 5 in counts:
-                            all_four_count += 1
-                            # 正方向记录0的位置，反方向时查找是否有记录且间隔4（距离5）
-                            if d == 1:
-                                zero_position = i
-                            else:
-                                if zero_position is not None and zero_position + i == 5:
-                                    # 活四
-                                    live_four_count += 1
-                                    all_four_count -= 1 # 如果是活四，死四会被多算一次
-                                else:
-                                    pass # 无事发生
-                        self.board[nx][ny] = temp # 恢复
-                        break # 找到空白，可以停止
-                    elif self.board[nx][ny] == 2:
-                        break # 遇到白棋，可以停止
-                else:
-                    break # 越界，可以停止
-        return all_four_count, live_four_count
-
-    # 黑在x,y落子后成了几个四（all_four_count），几个活四（live_four_count）
-    def four_count(self, x, y):
-        # 8个方向查找，看到0则判断：如果把这个0填上，是否恰好成5，然后停止当前方向查找
-        directions = [(1, 0), (0, 1), (1, 1), (1, -1)]
-        all_four_count = 0
-        live_four_count = 0
-        for dx, dy in directions:
-            all_four_count_one_line, live_four_count_one_line = self.four_count_one_line(x, y, dx, dy)
-            all_four_count += all_four_count_one_line
-            live_four_count += live_four_count_one_line
-        # return all_four_count, live_four_count
-        return all_four_count # 只返回all_four_count
-
-    def live_three_count(self, x, y, depth=0):
-        indent = '  ' * depth
-        # print(f"{indent}live_three_count: 检查({x},{y}) depth={depth}")
-        directions = [(1, 0), (0, 1), (1, 1), (1, -1)] # 4条直线
-        live_three_count = 0
-        for dx, dy in directions:
-            flag = False # 一个方向最多一个活三，找到就换下一个方向
-            # 每个方向
-            for d in [1, -1]:
-                if flag:
-                    break
-                for i in range(1, 4): # 往前最多看3个，1, 2, 3
-                    if flag:
-                        break
-                    nx, ny = x + dx * i * d, y + dy * i * d
-                    if 0 <= nx < self.board_size[0] and 0 <= ny < self.board_size[1]:
-                        if self.board[nx][ny] == 0:
-                            # 找到空白，然后：
-                            # 1.判断填上后是否恰好成活四，如果是，说明是形式活三
-                            temp = self.board[nx][ny]
-                            self.board[nx][ny] = 1
-                            # 只需要live_four_count
-                            _, live_four_count = self.four_count_one_line(nx, ny, dx, dy)
-                            self.board[nx][ny] = temp # 恢复
-                            if live_four_count >= 1:
-                                # 2. 判断该点是否禁手
-                                if not self.check_forbidden(nx, ny, depth=depth+1):
-                                    live_three_count += 1
-                                    flag = True
-                                    print(f"{indent}  -> 方向({dx},{dy}) {d}步{i} 形成活三")
-                            break # 找到空白，可以停止
-                        elif self.board[nx][ny] == 2:
-                            break # 遇到白棋，可以停止
-                    else:
-                        break # 越界，可以停止
-        print(f"{indent}live_three_count: ({x},{y}) 结果={live_three_count}")
-        return live_three_count
-    
+
+    def _update_forbidden_point(self, x, y):
+        keys = []
+        for (dx, dy), cache in zip(DIRECTIONS, self._line_keys):
+            key = cache.get((x, y))
+            if key is None:
+                key = cache[(x, y)] = self.line_key(x, y, dx, dy)
+            keys.append(key)
+        result, threes = self.forbidden_shape(x, y, keys)
+        if result is None:
+            self._double_threes.add((x, y))
+            result = self.check_forbidden(x, y)
+        else:
+            self._double_threes.discard((x, y))
+        if result != self._forbidden.get((x, y), False):
+            self._dirty.add((x, y))  # 禁手标记变了
+        if result:
+            self._forbidden[(x, y)] = result
+        else:
+            self._forbidden.pop((x, y), None)
+
+    def _update_forbidden(self, x, y):
+        # x,y刚落了子：只有过x,y的4条线上、11格窗口够得着的空点棋形会变；
+        # 疑似双活三的点还要看补四点是不是禁手，可能受别的线影响，这些点（很少）每步都重算
+        if self._forbidden is None:
+            return
+        self._forbidden.pop((x, y), None)
+        self._double_threes.discard((x, y))
+        v = self.stone_map[(x, y)]
+        points = set(self._double_threes)
+        for point, d, weight in self._window_points(x, y):
+            keys = self._line_keys[d]
+            if point in keys:
+                keys[point] += v * weight
+            if point not in self.stone_map:
+                points.add(point)
+        for nx, ny in points:
+            self._update_forbidden_point(nx, ny)
+
     def is_full(self):
-        for row in self.board:
-            if 0 in row:
-                return False
-        return True
+        return self.stones >= self.board_size[0] * self.board_size[1]
+
+    def _padded(self, mask):
+        # 四周补PAD格False，之后平移就是切片视图
+        h, w = mask.shape
+        padded = np.zeros((h + 2 * PAD, w + 2 * PAD), dtype=bool)
+        padded[PAD:PAD + h, PAD:PAD + w] = mask
+        return padded
+
+    def line_runs(self, player):
+        # 批量：假设每个格子落player，各方向上两侧连着的player子数和活头数
+        # 返回 (runs, opens)，形状都是 (4, h, w)；runs含落子本身
+        h, w = self.board.shape
+        own = self._padded(self.board == player)
+        empty = self._padded(self.board == 0)
+        runs = np.ones((4, h, w), dtype=np.int8)
+        opens = np.zeros((4, h, w), dtype=np.int8)
+        for d, (dx, dy) in enumerate(DIRECTIONS):
+            for sign in (1, -1):
+                alive = np.ones((h, w), dtype=bool)
+                run = np.zeros((h, w), dtype=np.int8)
+                for k in range(1, PAD):
+                    ox, oy = PAD + sign * dx * k, PAD + sign * dy * k
+                    alive &= own[ox:ox + h, oy:oy + w]
+                    run += alive
+                # 连续段外面一格是否为空
+                end = np.zeros((h, w), dtype=bool)
+                for k in range(1, PAD + 1):
+                    ox, oy = PAD + sign * dx * k, PAD + sign * dy * k
+                    end |= (run == k - 1) & empty[ox:ox + h, oy:oy + w]
+                runs[d] += run
+                opens[d] += end
+        return runs, opens
+
+    def winning_points(self, player, exact_five=False):
+        # 批量：落下就成五的空点，布尔数组 (h, w)
+        runs, _ = self.line_runs(player)
+        hit = (runs == 5) if exact_five else (runs >= 5)
+        return hit.any(axis=0) & (self.board == 0)
+
+    def evaluate_points(self, player):
+        # 批量给所有空点打分（进攻分+防守分），已有子的点为-1，给提示和AI挑候选点用
+        table = np.array(POINT_SCORES, dtype=np.int64)
+        score = np.zeros(self.board.shape, dtype=np.int64)
+        for who, weight in ((player, 2), (3 - player, 1)):
+            runs, opens = self.line_runs(who)
+            score += weight * table[np.minimum(runs, 5), opens].sum(axis=0)
+        score[self.board != 0] = -1
+        return score
+
+    def view_region(self):
+        # 要显示的区域 (x0, y0, x1, y1)，不含x1、y1：小棋盘显示整盘；大棋盘显示VIEW_SIZE见方的一块，
+        # 尽量沿用上次的区域（图可以只重画变了的格子），装不下棋子时再挪到棋子（或最后一步）附近
+        h, w = self.board_size
+        if h <= VIEW_SIZE and w <= VIEW_SIZE:
+            return 0, 0, h, w
+        rows, cols = min(h, VIEW_SIZE), min(w, VIEW_SIZE)
+        if self.bounds is None:
+            x0, y0 = (h - rows) // 2, (w - cols) // 2
+            self._view = (x0, y0, x0 + rows, y0 + cols)
+            return self._view
+        bx0, by0, bx1, by1 = self.bounds
+        want = (max(0, bx0 - VIEW_MARGIN), max(0, by0 - VIEW_MARGIN),
+                min(h - 1, bx1 + VIEW_MARGIN), min(w - 1, by1 + VIEW_MARGIN))
+        view = getattr(self, '_view', None)
+        if view and view[0] <= want[0] and view[1] <= want[1] and want[2] < view[2] and want[3] < view[3]:
+            return view
+        if want[2] - want[0] < rows and want[3] - want[1] < cols:
+            cx, cy = (want[0] + want[2]) // 2, (want[1] + want[3]) // 2
+        else:
+            cx, cy = self.last_move[1:] if self.last_move else ((bx0 + bx1) // 2, (by0 + by1) // 2)
+        x0 = min(max(0, cx - rows // 2), h - rows)
+        y0 = min(max(0, cy - cols // 2), w - cols)
+        self._view = (x0, y0, x0 + rows, y0 + cols)
+        return self._view
 
     def get_board_str(self):
-        # 横坐标1~15，纵坐标A~O
-        numbers = [str(i+1) for i in range(self.board_size[1])]
-        letters = [chr(ord('A') + i) for i in range(self.board_size[0])]
-        board_str = '   ' + ' '.join(numbers) + '\n'
-        for i in range(self.board_size[0]):
-            board_str += f'{letters[i]:2s} ' + ' '.join([str(cell) for cell in self.board[i]]) + '\n'
+        # 横坐标是列号，纵坐标是行字母；大棋盘只输出view_region
+        x0, y0, x1, y1 = self.view_region()
+        get = self.stone_map.get
+        board_str = '   ' + ' '.join(str(j + 1) for j in range(y0, y1)) + '\n'
+        for i in range(x0, x1):
+            board_str += f'{row_label(i):2s} ' + ' '.join(str(get((i, j), 0)) for j in range(y0, y1)) + '\n'
         return board_str
 
-    def draw_board(self, path=None):
-        cell_size = 40
-        margin = 40
-        board_pixel = cell_size * (self.board_size[1] - 1) + margin * 2
-        img = np.ones((board_pixel, board_pixel, 3), dtype=np.uint8) * 240
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        font_scale = 0.6
-        thickness = 1
-        # 画网格线（交替颜色）
-        for i in range(self.board_size[0]):
-            color = (0, 0, 0) if i % 2 == 0 else (180, 180, 180)
-            pt1 = (margin, margin + i * cell_size)
-            pt2 = (margin + cell_size * (self.board_size[1] - 1), margin + i * cell_size)
-            cv2.line(img, pt1, pt2, color, 1)
-        for j in range(self.board_size[1]):
-            color = (0, 0, 0) if j % 2 == 0 else (180, 180, 180)
-            pt1 = (margin + j * cell_size, margin)
-            pt2 = (margin + j * cell_size, margin + cell_size * (self.board_size[0] - 1))
-            cv2.line(img, pt1, pt2, color, 1)
-        # 画棋子
-        for i in range(self.board_size[0]):
-            for j in range(self.board_size[1]):
-                if self.board[i][j] == 1:
-                    center = (margin + j * cell_size, margin + i * cell_size)
-                    cv2.circle(img, center, cell_size // 2 - 2, (0, 0, 0), -1)
-                elif self.board[i][j] == 2:
-                    center = (margin + j * cell_size, margin + i * cell_size)
-                    cv2.circle(img, center, cell_size // 2 - 2, (255, 255, 255), -1)
-                    cv2.circle(img, center, cell_size // 2 - 2, (0, 0, 0), 1)
-        # 标记最后一步
-        if self.last_move:
-            player, x, y = self.last_move
-            center = (margin + y * cell_size, margin + x * cell_size)
-            cv2.circle(img, center, cell_size // 4, (0, 0, 255), 2)
-        # 四周加坐标
-        numbers = [str(i+1) for i in range(self.board_size[1])]
-        letters = [chr(ord('A') + i) for i in range(self.board_size[0])]
-        for j in range(self.board_size[1]):
-            # 上
-            cv2.putText(img, numbers[j], (margin + j * cell_size - 8, margin - 10), font, font_scale, (0, 0, 200), thickness, cv2.LINE_AA)
-            # 下
-            cv2.putText(img, numbers[j], (margin + j * cell_size - 8, board_pixel - margin + 25), font, font_scale, (0, 0, 200), thickness, cv2.LINE_AA)
-        for i in range(self.board_size[0]):
-            # 左
-            cv2.putText(img, letters[i], (margin - 30, margin + i * cell_size + 8), font, font_scale, (0, 0, 200), thickness, cv2.LINE_AA)
-            # 右
-            cv2.putText(img, letters[i], (board_pixel - margin + 10, margin + i * cell_size + 8), font, font_scale, (0, 0, 200), thickness, cv2.LINE_AA)
+    def draw_board(self, path=None, show_forbidden=False):
+        # show_forbidden：在黑棋禁手点上画红叉（仅禁手对局）
+        # 上次画的图还在缓存里、显示区域没变时，只重画之后变过的格子（落子、上一步标记、禁手点变化）
+        view = self.view_region()
+        show_forbidden = show_forbidden and self.forbidden_rule
+        cached = _render_cache.get(id(self))
+        if cached and cached[0] is self and cached[1] == (view, show_forbidden):
+            img = cached[2]
+            _render_cache.move_to_end(id(self))
+            x0, y0, x1, y1 = view
+            for x, y in self._dirty:
+                if x0 <= x < x1 and y0 <= y < y1:
+                    self._draw_cell(img, view, x, y, show_forbidden)
+        else:
+            img = self._draw_view(view, show_forbidden)
+            _render_cache[id(self)] = (self, (view, show_forbidden), img)
+            while len(_render_cache) > RENDER_CACHE_SIZE:
+                _render_cache.popitem(last=False)
+        self._dirty = set()
         # 保存图片
         if path is None:
             path = '/tmp/gomoku_board.png'
         cv2.imwrite(path, img)
         return path
 
+    def _draw_view(self, view, show_forbidden):
+        x0, y0, x1, y1 = view
+        rows, cols = x1 - x0, y1 - y0
+        img = np.ones((CELL_SIZE * (rows - 1) + MARGIN * 2, CELL_SIZE * (cols - 1) + MARGIN * 2, 3), dtype=np.uint8) * 240
+        # 画网格线（交替颜色）
+        for i in range(x0, x1):
+            color = (0, 0, 0) if i % 2 == 0 else (180, 180, 180)
+            py = MARGIN + (i - x0) * CELL_SIZE
+            cv2.line(img, (MARGIN, py), (MARGIN + CELL_SIZE * (cols - 1), py), color, 1)
+        for j in range(y0, y1):
+            color = (0, 0, 0) if j % 2 == 0 else (180, 180, 180)
+            px = MARGIN + (j - y0) * CELL_SIZE
+            cv2.line(img, (px, MARGIN), (px, MARGIN + CELL_SIZE * (rows - 1)), color, 1)
+        # 画棋子和标记
+        marked = set(self.forbidden_points()) if show_forbidden else set()
+        if self.last_move:
+            marked.add(self.last_move[1:])
+        for x, y in marked.union(self.stone_map):
+            if x0 <= x < x1 and y0 <= y < y1:
+                self._draw_marks(img, view, x, y, show_forbidden)
+        # 四周加坐标
+        self._draw_labels(img, view, range(x0, x1), range(y0, y1))
+        return img
+
+    def _draw_cell(self, img, view, x, y, show_forbidden):
+        # 把以交叉点为中心的一格擦成空白、补上网格线，再画棋子和标记
+        x0, y0, x1, y1 = view
+        px, py = MARGIN + (y - y0) * CELL_SIZE, MARGIN + (x - x0) * CELL_SIZE
+        half = CELL_SIZE // 2
+        left, right = max(px - half, MARGIN), min(px + half - 1, MARGIN + (y1 - y0 - 1) * CELL_SIZE)
+        top, bottom = max(py - half, MARGIN), min(py + half - 1, MARGIN + (x1 - x0 - 1) * CELL_SIZE)
+        img[py - half:py + half, px - half:px + half] = 240
+        cv2.line(img, (left, py), (right, py), (0, 0, 0) if x % 2 == 0 else (180, 180, 180), 1)
+        cv2.line(img, (px, top), (px, bottom), (0, 0, 0) if y % 2 == 0 else (180, 180, 180), 1)
+        self._draw_marks(img, view, x, y, show_forbidden)
+
+    def _draw_marks(self, img, view, x, y, show_forbidden):
+        x0, y0 = view[:2]
+        center = (MARGIN + (y - y0) * CELL_SIZE, MARGIN + (x - x0) * CELL_SIZE)
+        v = self.stone_map.get((x, y))
+        if v == 1:
+            cv2.circle(img, center, CELL_SIZE // 2 - 2, (0, 0, 0), -1)
+        elif v == 2:
+            cv2.circle(img, center, CELL_SIZE // 2 - 2, (255, 255, 255), -1)
+            cv2.circle(img, center, CELL_SIZE // 2 - 2, (0, 0, 0), 1)
+        elif show_forbidden and (x, y) in self.forbidden_points():
+            # 标记禁手点
+            r = CELL_SIZE // 5
+            cx, cy = center
+            cv2.line(img, (cx - r, cy - r), (cx + r, cy + r), (0, 0, 220), 2)
+            cv2.line(img, (cx - r, cy + r), (cx + r, cy - r), (0, 0, 220), 2)
+        # 标记最后一步
+        if self.last_move and self.last_move[1:] == (x, y):
+            cv2.circle(img, center, CELL_SIZE // 4, (0, 0, 255), 2)
+
+    def _draw_labels(self, img, view, rows, cols):
+        x0, y0 = view[:2]
+        height, width = img.shape[:2]
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        for j in cols:
+            text = str(j + 1)
+            (tw, _), _ = cv2.getTextSize(text, font, 0.6, 1)
+            px = MARGIN + (j - y0) * CELL_SIZE - tw // 2
+            # 上、下
+            cv2.putText(img, text, (px, MARGIN - 22), font, 0.6, (0, 0, 200), 1, cv2.LINE_AA)
+            cv2.putText(img, text, (px, height - MARGIN + 36), font, 0.6, (0, 0, 200), 1, cv2.LINE_AA)
+        for i in rows:
+            text = row_label(i)
+            (tw, _), _ = cv2.getTextSize(text, font, 0.6, 1)
+            py = MARGIN + (i - x0) * CELL_SIZE + 8
+            # 左、右
+            cv2.putText(img, text, (MARGIN - 22 - tw, py), font, 0.6, (0, 0, 200), 1, cv2.LINE_AA)
+            cv2.putText(img, text, (width - MARGIN + 22, py), font, 0.6, (0, 0, 200), 1, cv2.LINE_AA)
+
     def to_dict(self):
         return {
             'board_size': self.board_size,
-            'board': self.board,
+            'stones': [[x, y, v] for (x, y), v in sorted(self.stone_map.items())],  # 稀疏存，老存档是整盘的board
             'current_player': self.current_player,
             'game_over': self.game_over,
             'winner': self.winner,
             'last_move': self.last_move,
             'forbidden_rule': self.forbidden_rule,
+            'move_history': self.move_history,
         }
 
     @classmethod
     def from_dict(cls, data):
-        obj = cls(data.get('forbidden_rule', False))
-        obj.board_size = tuple(data.get('board_size', (15, 15)))
-        obj.board = data.get('board', [[0]*15 for _ in range(15)])
+        obj = cls(data.get('forbidden_rule', False), tuple(data.get('board_size', (15, 15))))
+        if 'board' in data:
+            obj.board = data['board']
+        for x, y, v in data.get('stones', []):
+            obj._put(x, y, v)
         obj.current_player = data.get('current_player', 1)
         obj.game_over = data.get('game_over', False)
         obj.winner = data.get('winner', None)
         obj.last_move = tuple(data.get('last_move')) if data.get('last_move') else None
         obj.forbidden_rule = data.get('forbidden_rule', False)
+        obj.move_history = [tuple(m) for m in data.get('move_history', [])]  # 老存档没有落子顺序
         return obj
 
+    def to_bytes(self):
+        return game_codec.pack_gomoku(self.to_dict())
+
+    def pack_move(self, move):
+        # move_history里的一步 -> 格子编号，255路以内不超过16位，见game_history
+        x, y = move
+        return x * self.board_size[1] + y
+
+    def play_packed(self, c):
+        return self.move(self.current_player, *divmod(c, self.board_size[1]), replay=True)
+
+    @classmethod
+    def from_bytes(cls, buf):
+        return cls.from_dict(game_codec.unpack_gomoku(buf))
+
+
+# 电脑玩家，占players里的一个座位
+COMPUTER_PLAYER = Player('__computer__', '电脑')
+AI_TIME_LIMIT = 3  # 电脑每步思考秒数
+AI_GRACE = 2       # 子进程超出这么多秒还没回来就不等了，改用快速估值落子
+_engine_pool = None
+
+
+def engine_pool():
+    # 搜索放到子进程里跑，不阻塞事件循环
+    global _engine_pool
+    if _engine_pool is None:
+        _engine_pool = ProcessPoolExecutor(max_workers=2)
+    return _engine_pool
+
+
+def quick_move(game):
+    # 不搜索，按evaluate_points挑分最高的合法点；子进程超时时兜底。大棋盘只看棋子周围
+    import gomoku_engine
+    x0, y0, game = gomoku_engine.crop(game)
+    points = game.evaluate_points(game.current_player)
+    for c in np.argsort(points, axis=None)[::-1]:
+        x, y = divmod(int(c), game.board_size[1])
+        if points[x, y] < 0:
+            break
+        if not (game.forbidden_rule and game.current_player == 1 and game.check_forbidden(x, y)):
+            return x + x0, y + y0
+    return None
+
 
 class GomokuBot(ChessGameBase):
     def __init__(self):
-        super().__init__('gomoku', '6815cd855ebf6e703ce29395') # channel_id
-    
-    async def send_board_image(self, game, room_id, msg):
+        super().__init__('gomoku', '6815cd855ebf6e703ce29395', '五子棋') # channel_id
+
+    def make_room(self, game, players, status, clock=None):
+        return Room(game, GameHistory(game), players, status, clock)
+
+    def new_game(self, variant):
+        # 匹配的变体：'禁'带禁手，''不带；都是15路
+        return GomokuGame(forbidden_rule=variant == '禁')
+
+    def variant_name(self, variant):
+        return '（带禁手）' if variant == '禁' else ''
+
+    def turn_index(self, room):
+        return room.game.current_player - 1
+
+    def flag(self, room, idx):
+        room.game.game_over = True
+        room.game.winner = 2 if idx == 0 else 1
+
+    def is_computer_turn(self, room):
+        game = room.game
+        return len(room.players) == 2 and room.players[game.current_player - 1].id == COMPUTER_PLAYER.id
+
+    async def computer_move(self, room_id, room, msg):
+        import gomoku_engine
+        if room.thinking:
+            return
+        game = room.game
+        room.thinking = True
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(engine_pool(), gomoku_engine.think, game.to_bytes(), AI_TIME_LIMIT)
+            try:
+                move = await asyncio.wait_for(future, AI_TIME_LIMIT + AI_GRACE)
+            except asyncio.TimeoutError:
+                move = quick_move(game)
+        finally:
+            room.thinking = False
+        if room.status != RoomStatus.PLAYING or move is None:
+            return
+        x, y = move
+        response = game.move(game.current_player, x, y)
+        if not response['success']:
+            return
+        await msg.reply(f"电脑下{point_name(x, y)}。")
+        await self.report_move(room_id, room, response, msg)
+
+    async def report_move(self, room_id, room, response, msg):
+        # 落子成功后的提示、终局处理；返回对局是否结束
+        game = room.game
+        room.history.record(game)
+        await self.send_board_image(game, room_id, msg, broadcast=True)
+        if response['winner'] == 1 or response['winner'] == 2:
+            winner = '黑棋' if response['winner'] == 1 else '白棋'
+            room.status = RoomStatus.FINISHED
+            self.archive_game(room, room_id)
+            await msg.reply(f"{winner}胜利！游戏结束。")
+            return True
+        if response['winner'] == 0 and game.game_over:
+            room.status = RoomStatus.FINISHED
+            self.archive_game(room, room_id)
+            await msg.reply("和棋，棋盘已满，游戏结束。")
+            return True
+        self.clock_moved(room_id, room)
+        next_player = room.players[game.current_player-1]
+        await msg.reply(f"落子成功，轮到{next_player.name}{self.clock_text(room)}。")
+        return False
+
+    async def take_back(self, room_id, room, player, msg):
+        # player悔棋：退到player上一次落子之前。对方已经应了一手的话退两手
+        plies = 1 if room.game.current_player != player else 2
+        game = room.game = room.history.undo(plies)
+        room.undo_offer = None
+        self.start_clock(room_id, room)
+        next_player = room.players[game.current_player - 1]
+        await msg.reply(f"悔棋成功，退回{plies}手，轮到{next_player.name}。")
+        await self.send_board_image(game, room_id, msg, broadcast=True)
+
+    async def send_board_image(self, game, room_id, msg, show_forbidden=False, broadcast=False):
+        # broadcast: 对局里的新局面，同一张图也推给观战的人
         img_path = f"tmp/gomoku_{room_id}.png"
-        game.draw_board(img_path)
+        game.draw_board(img_path, show_forbidden)
+        url = None
         if hasattr(msg, 'reply_image'):
-            await msg.reply_image(img_path)
+            url = await msg.reply_image(img_path)
         else:
             await msg.reply("[图片功能未实现]")
+        if broadcast:
+            players = ' 对 '.join(p.name for p in self.rooms[room_id].players)
+            end = '，对局结束' if game.game_over else ''
+            self.broadcast(room_id, msg, url, f"【观战】五子棋房间{room_id}（{players}），第{len(game.move_history)}手{end}")
 
     async def message_handler(self, msg):
         user_id = msg.talker_id
@@ -308,17 +755,33 @@ class GomokuBot(ChessGameBase):
         # 开房
         if text.startswith('开房'):
             forbidden = '禁' in text
+            clock, text = parse_time_control(text)
+            # 棋盘大小：【开房 19】、【开房 无限】，默认15路
+            size = re.search(r'\d+', text)
+            size = INFINITE_SIZE if '无限' in text else int(size.group()) if size else 15
+            if not 5 <= size <= MAX_BOARD_SIZE:
+                await msg.reply(f"棋盘大小要在5到{MAX_BOARD_SIZE}之间。")
+                return
+            mode = ('（无限棋盘）' if '无限' in text else f'（{size}路）' if size != 15 else '') + ('（带禁手）' if forbidden else '') + describe_time_control(clock)
             room_id = self.new_room_id()
-            self.rooms[room_id] = {
-                'game': GomokuGame(forbidden_rule=forbidden),
-                'players': [{'id': user_id, 'name': msg.talker_name}],
-                'status': 'waiting',
-            }
-            self.user_room[user_id] = room_id
-            if forbidden:
-                await msg.reply(f"房间已创建（带禁手），房间号: {room_id}，等待其他玩家加入。")
-            else:
-                await msg.reply(f"房间已创建，房间号: {room_id}，等待其他玩家加入。")
+            if '电脑' in text:
+                players = [Player(user_id, msg.talker_name), COMPUTER_PLAYER]
+                random.shuffle(players)
+                game = GomokuGame(forbidden_rule=forbidden, board_size=(size, size))
+                room = self.rooms[room_id] = self.make_room(game, players, RoomStatus.PLAYING, clock)
+                self.members.join(user_id, room_id)
+                self.start_clock(room_id, room)
+                await msg.reply(f"房间{room_id}已创建{mode}，和电脑对战。{players[0].name}执黑先手。")
+                await self.send_board_image(room.game, room_id, msg)
+                if self.is_computer_turn(room):
+                    await self.computer_move(room_id, room, msg)
+                return
+            game = GomokuGame(forbidden_rule=forbidden, board_size=(size, size))
+            players = [Player(user_id, msg.talker_name)]
+            room = self.rooms[room_id] = self.make_room(game, players, RoomStatus.WAITING, clock)
+            self.members.join(user_id, room_id)
+            self.room_waiting(room_id, room)
+            await msg.reply(f"房间已创建{mode}，房间号: {room_id}，等待其他玩家加入。")
         # 加入
         elif text.startswith('加入'):
             room_id = text[2:].strip()
@@ -329,28 +792,29 @@ class GomokuBot(ChessGameBase):
                 await msg.reply("扯王八犊子呢？没这房儿。")
                 return
             room = self.rooms[room_id]
-            if user_id in [p['id'] for p in room['players']]:
+            if room.seat(user_id) is not None:
                 # 如果用户已经在房间里，则返回提示
                 if room_id == self.user_room.get(user_id):
                     await msg.reply("你丫的已经在这儿了，别瞎折腾了！")
                 else:
-                    self.user_room[user_id] = room_id
+                    self.members.activate(user_id, room_id)
                     await msg.reply("你蛄蛹到这儿了！")
                 return
-            if len(room['players']) >= 2:
+            if len(room.players) >= 2:
                 await msg.reply("没地儿咯！")
                 return
-            room['players'].append({'id': user_id, 'name': msg.talker_name})
-            self.user_room[user_id] = room_id
-            if len(room['players']) == 2:
+            room.add_player(Player(user_id, msg.talker_name))
+            self.members.join(user_id, room_id)
+            if len(room.players) == 2:
                 # 随机决定谁黑
-                random.shuffle(room['players'])
-                response = f"加入房间{room_id}成功。游戏开始！{room['players'][0]['name']}先手。"
-                room['status'] = 'playing'
+                room.set_players(random.sample(room.players, 2))
+                response = f"加入房间{room_id}成功。游戏开始！{room.players[0].name}先手。"
+                room.status = RoomStatus.PLAYING
+                self.start_clock(room_id, room)
                 await msg.reply(response)
-                await self.send_board_image(room['game'], room_id, msg)
+                await self.send_board_image(room.game, room_id, msg)
             else:
-                await msg.reply(f"加入房间{room_id}成功，{len(room['players'])}={2-len(room['players'])}！")
+                await msg.reply(f"加入房间{room_id}成功，{len(room.players)}={2-len(room.players)}！")
         
             # 暂时不支持离开和退出
             """
@@ -368,77 +832,153 @@ class GomokuBot(ChessGameBase):
                 room_id = self.user_room[user_id]
                 room = self.rooms.get(room_id)
                 if room:
-                    if user_id in [p['id'] for p in room['players']]:
-                        room['players'].remove({'id': user_id, 'name': msg.talker_name})
-                    if not room['players']:
+                    if room.seat(user_id) is not None:
+                        room.set_players([p for p in room.players if p.id != user_id])
+                    if not room.players:
                         del self.rooms[room_id]
-                del self.user_room[user_id]
+                self.members.leave(user_id, room_id)
                 return f"你已退出房间{room_id}。"
             """
 
         # 落子
-        elif re.match(r'^[A-Oa-o](1[0-5]|[1-9])$', text.strip()):
+        elif parse_point(text):
             # 应该是落子
             if user_id not in self.user_room:
                 await msg.reply("你当前不在任何房间，请先'开房'或'加入 房间号'。")
                 return
             room_id = self.user_room[user_id]
             room = self.rooms.get(room_id)
-            if not room or room['status'] != 'playing':
+            if not room or room.status != RoomStatus.PLAYING:
                 await msg.reply("房间未开始游戏。")
                 return
-            game = room['game']
-            idx = [p['id'] for p in room['players']].index(user_id)
+            game = room.game
+            idx = room.seat(user_id)
             player = idx + 1 # 玩家1/2
-            if game.current_player != player:
-                await msg.reply("还没轮到你下棋。")
+            if room.undo_offer and room.undo_offer != player:
+                await msg.reply("对方提出了悔棋申请，请先回复【同意】或【拒绝】。")
                 return
-            try:
-                row = text[0].upper()
-                col = int(text[1:])
-                x = ord(row) - ord('A')
-                y = col - 1
-            except Exception:
-                await msg.reply("落子格式错误，应为: A1 ~ O15")
+            if game.current_player != player:
+                if self.is_computer_turn(room):
+                    await msg.reply("电脑正在思考。")
+                    await self.computer_move(room_id, room, msg)
+                else:
+                    await msg.reply("还没轮到你下棋。")
                 return
+            x, y = parse_point(text)
             response = game.move(player, x, y)
             if not response['success']:
                 await msg.reply(response['msg'])
                 return
+            room.undo_offer = None
             # 落子成功
-            await self.send_board_image(game, room_id, msg)
-            if response['winner'] == 1 or response['winner'] == 2:
-                winner = '黑棋' if response['winner'] == 1 else '白棋'
-                response_msg = f"{winner}胜利！游戏结束。"
-                room['status'] = 'finished'
-                self.archive_game(room, room_id)
-                await msg.reply(response_msg)
-            elif response['winner'] == 0 and game.game_over:
-                response_msg = "和棋，棋盘已满，游戏结束。"
-                room['status'] = 'finished'
-                self.archive_game(room, room_id)
-                await msg.reply(response_msg)
+            if not await self.report_move(room_id, room, response, msg) and self.is_computer_turn(room):
+                await self.computer_move(room_id, room, msg)
+        # 悔棋：要对方同意，电脑直接同意
+        elif text == '悔棋':
+            room_id = self.user_room.get(user_id)
+            room = self.rooms.get(room_id)
+            if not room or room.status != RoomStatus.PLAYING:
+                await msg.reply("房间未开始游戏。")
+                return
+            if room.thinking:
+                await msg.reply("电脑正在思考，稍后再悔棋。")
+                return
+            player = room.seat(user_id) + 1
+            plies = 1 if room.game.current_player != player else 2
+            if room.history.ply - plies < room.history.start:
+                await msg.reply("没有可以悔的棋。")
+                return
+            if room.undo_offer:
+                await msg.reply("已经有悔棋申请了，等对方回应。")
+                return
+            if room.seat(COMPUTER_PLAYER.id) is not None:
+                await self.take_back(room_id, room, player, msg)
+                return
+            room.undo_offer = player
+            await msg.reply("你已向对方提出悔棋申请，请对方回复【同意】或【拒绝】。")
+        elif text in ('同意', '拒绝'):
+            room_id = self.user_room.get(user_id)
+            room = self.rooms.get(room_id)
+            if not room or room.status != RoomStatus.PLAYING:
+                await msg.reply("房间未开始游戏。")
+                return
+            player = room.seat(user_id) + 1
+            if not room.undo_offer or room.undo_offer == player:
+                await msg.reply("当前没有对方提出的悔棋申请。")
+                return
+            if text == '同意':
+                await self.take_back(room_id, room, room.undo_offer, msg)
             else:
-                next_player = room['players'][game.current_player-1]
-                color = '黑棋' if game.current_player == 1 else '白棋'
-                await msg.reply(f"落子成功，轮到{next_player['name']}。")
+                room.undo_offer = None
+                await msg.reply("你已拒绝悔棋申请，继续游戏。")
+        # 回放：看第N手之后的局面
+        elif text.startswith('回放'):
+            room_id = self.user_room.get(user_id)
+            room = self.rooms.get(room_id)
+            if not room:
+                await msg.reply("你当前不在任何房间。")
+                return
+            history = room.history
+            n = text[2:].strip()
+            if not n.isdigit() or not history.start <= int(n) <= history.ply:
+                await msg.reply(f"发送【回放 手数】查看第几手之后的局面，可以看{history.start}到{history.ply}手。")
+                return
+            game = history.position(int(n))
+            last = f"，最后一手{point_name(*game.last_move[1:])}" if int(n) and game.last_move else ''
+            await msg.reply(f"第{n}手之后的局面（共{history.ply}手）{last}。")
+            await self.send_board_image(game, room_id, msg)
+        # 禁手点
+        elif text == '禁手点':
+            room = self.rooms.get(self.user_room.get(user_id))
+            if not room:
+                await msg.reply("你当前不在任何房间。")
+                return
+            game = room.game
+            if not game.forbidden_rule:
+                await msg.reply("这局不带禁手。")
+                return
+            points = game.forbidden_points()
+            if not points:
+                await msg.reply("黑棋当前没有禁手点。")
+                return
+            names = [f"{point_name(x, y)}({t})" for (x, y), t in sorted(points.items())]
+            await msg.reply("黑棋禁手点：" + '、'.join(names))
+            await self.send_board_image(game, self.user_room[user_id], msg, show_forbidden=True)
+        # 匹配：【匹配】、【匹配 禁】
+        elif text.startswith('匹配'):
+            await self.enqueue_match(msg, '禁' if '禁' in text else '')
+        elif text == '取消匹配':
+            await self.cancel_match(msg)
+        # 同时在好几个房间时：列出来、换活动房间
+        elif text == '我的房间':
+            await self.my_rooms(msg)
+        elif text.startswith('切换'):
+            await self.switch_room(msg, text[2:].strip())
+        # 观战
+        elif text.startswith(('观战', '取消观战')):
+            await self.watch_handler(msg)
+        # 战绩/排行
+        elif text == '战绩':
+            await msg.reply(self.stats.format_record(user_id))
+        elif text == '排行':
+            await msg.reply(self.stats.format_leaderboard())
 
-    def room_to_dict(self, room):
-        return {
-            'game': room['game'].to_dict(),
-            'players': room['players'],
-            'status': room['status']
-        }
+    def game_result(self, data):
+        # players[0]执黑
+        # 和电脑下的不计等级分
+        if any(p['id'] == COMPUTER_PLAYER.id for p in data.get('players', [])):
+            return None
+        winner = data['game'].get('winner')
+        return 1 if winner == 1 else 0 if winner == 2 else 0.5
 
     def dict_to_room(self, data):
-        return {
-            'game': GomokuGame.from_dict(data['game']),
-            'players': data['players'],
-            'status': data['status']
-        }
+        game = GomokuGame.from_dict(data['game'])
+        # 悔棋/回放的历史不存盘，读档时按落子顺序重放出来
+        history = GameHistory.rebuild(GomokuGame(game.forbidden_rule, game.board_size), game)
+        return Room.from_dict(data, game, history)
 
 if __name__ == "__main__":
-    # 测试禁手规则
+    # 测试禁手规则，更多局面见bench/renju_corpus.py
     # 0空1黑2白
     board = [[0]*15 for _ in range(15)]
     board[8][3] = 1
@@ -453,22 +993,10 @@ if __name__ == "__main__":
     board[9][5] = 1
     game = GomokuGame(forbidden_rule=True)
     game.board = board
-    forbidden_points = []
-    for x in range(15):
-        for y in range(15):
-            if game.board[x][y] == 0:
-                # game.board[x][y] = 1
-                # 检查黑方在(x, y)落子是否禁手
-                forbidden_type = game.check_forbidden(x, y)
-                if forbidden_type:
-                    forbidden_points.append((x, y, forbidden_type))
     # 打印棋盘
     print("当前棋盘：")
-    letters = [chr(ord('A') + i) for i in range(15)]
-    print('   ' + ' '.join([str(i+1) for i in range(15)]))
-    for i in range(15):
-        print(f'{letters[i]:2s} ' + ' '.join(str(cell) for cell in board[i]))
+    print(game.get_board_str(), end='')
     # 打印禁手点
     print("禁手点（行列/类型）：")
-    for x, y, t in forbidden_points:
-        print(f"{letters[x]}{y+1} : {t}")
+    for (x, y), t in sorted(game.forbidden_points().items()):
+        print(f"{point_name(x, y)} : {t}")
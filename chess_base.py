@@ -1,13 +1,89 @@
+import asyncio
 import json
+import random
+import re
 from pathlib import Path
 import time
+from logger import get_logger
+from matchmaking import MatchQueue, MATCH_TIMEOUT
+from membership import Membership
+from player_stats import PlayerStats, INITIAL_RATING
+from room import Player, RoomStatus
+from timer_wheel import TimerWheel
+
+WATCH_TIMEOUT = 10       # 给一个观战的人推送最多等这么多秒
+WATCH_MAX_FAILURES = 3   # 连续推送失败这么多次就不再推给他
+
+# 房间的期限，都挂在每个bot一个的时间轮上（每个房间同时只有一个期限）
+WAITING_TIMEOUT = 30 * 60    # 等人加入的房间多久没人来就关掉
+IDLE_TIMEOUT = 24 * 3600     # 不计时的对局多久没人走就关掉（不判胜负、不归档）
+FINISHED_TTL = 10 * 60       # 结束的对局在内存里再留多久（回放、观战收尾），之后清掉
+
+
+def parse_time_control(text):
+    """从开房的配置里拿出计时：【10+5】每方10分钟、每走一步加5秒（Fischer加秒），【每步30】每步限30秒，可以同时用
+
+    返回(计时dict或None, 去掉计时之后的文字)
+    """
+    clock = {}
+    m = re.search(r'(\d+)\+(\d+)', text)
+    if m:
+        clock['base'] = int(m.group(1)) * 60
+        clock['increment'] = int(m.group(2))
+        text = text[:m.start()] + text[m.end():]
+    m = re.search(r'每步(\d+)', text)
+    if m:
+        clock['per_move'] = int(m.group(1))
+        text = text[:m.start()] + text[m.end():]
+    if not clock:
+        return None, text
+    base = clock.get('base')
+    clock.update({
+        'base': base,
+        'increment': clock.get('increment', 0),
+        'per_move': clock.get('per_move'),
+        'remaining': [base, base] if base else None,  # 每方剩余秒数，players的顺序
+        'turn_start': None,  # 轮到的一方从什么时候开始想
+    })
+    return clock, text
+
+
+def describe_time_control(clock):
+    if not clock:
+        return ''
+    parts = []
+    if clock['base']:
+        parts.append(f"{clock['base'] // 60}+{clock['increment']}")
+    if clock['per_move']:
+        parts.append(f"每步{clock['per_move']}秒")
+    return '（' + '，'.join(parts) + '）'
+
+
+def format_seconds(seconds):
+    seconds = max(0, round(seconds))
+    return f'{seconds // 60}:{seconds % 60:02d}'
 
 class ChessGameBase:
-    def __init__(self, game_type, channel_id):
+    def __init__(self, game_type, channel_id, game_name=None):
         self.game_type = game_type
         self.channel_id = channel_id
-        self.rooms = {} # 房间号 -> {game, players, 状态}
-        self.user_room = {} # 这个表示用户当前在哪个房间活动。一个用户可以同时在多个room的players列表中，但至多只能在一个房间活动。
+        self.game_name = game_name or game_type  # 在别的频道观战时用来指明是哪个游戏
+        self.log = get_logger(game_type)  # rocket.chess、rocket.gomoku，级别见logger.LOG_LEVELS
+        self.rooms = {} # 房间号 -> Room
+        # 一个用户可以同时在多个房间的players里，但至多只在一个房间活动。成员关系和活动房间都由members维护，
+        # user_room是活动房间的表（用户id -> 房间号），只读，改要走members.join/activate/leave
+        self.members = Membership()
+        self.user_room = self.members.active
+        # 观战：房间号 -> {推送目标(Rocket.Chat房间号，私聊或别的频道): 连续失败次数}
+        self.watchers = {}
+        self._broadcast_latest = {}  # 房间号 -> 还没推出去的最新局面 (client, 图片地址, 说明)
+        self._broadcast_tasks = {}   # 房间号 -> 正在推送的task
+        # 所有房间的期限（等人、走棋计时、没人走、结束后清理）共用一个时间轮，由main里的循环统一推进
+        self.timers = TimerWheel(time.time())
+        self.client = None  # Rocket.Chat客户端，main里设置；超时之类不是由消息触发的通知要用
+        # 匹配：每个变体（比如带不带禁手）一个队列；排队的人重新配对的时间也挂在时间轮上，key是('match', 用户id)
+        self.match_queues = {}   # 变体 -> MatchQueue
+        self.match_variant = {}  # 用户id -> 在排哪个变体
         self.data_dir = Path(f'data/{game_type}')
         self.data_dir.mkdir(parents=True, exist_ok=True)
         # 读取房间号儿，如果文件不存在，则创建文件并设置房间号为1000
@@ -16,6 +92,7 @@ class ChessGameBase:
                 f.write('1000') 
         with open(self.data_dir / 'room_id.txt', 'r', encoding='utf-8') as f:
             self.room_id_counter = int(f.read())
+        self.stats = PlayerStats(self.data_dir / 'player_stats.dat')  # 不用.json后缀，避免被当成房间加载
 
     def new_room_id(self):
         while True:
@@ -27,7 +104,7 @@ class ChessGameBase:
     def save_all_rooms(self):
         self.data_dir.mkdir(parents=True, exist_ok=True)
         for room_id, room in self.rooms.items():
-            if room.get('status') == 'finished':
+            if room.status == RoomStatus.FINISHED:
                 continue
             data = self.room_to_dict(room)
             with open(self.data_dir / f'{room_id}.json', 'w', encoding='utf-8') as f:
@@ -35,38 +112,340 @@ class ChessGameBase:
         # 保存房间号
         with open(self.data_dir / 'room_id.txt', 'w', encoding='utf-8') as f:
             f.write(str(self.room_id_counter))
+        self.stats.save()
+        self.members.save(self.data_dir / 'members.dat')  # 不用.json后缀，避免被当成房间加载
 
     def load_all_rooms(self):
         # 读取房间号
         with open(self.data_dir / 'room_id.txt', 'r', encoding='utf-8') as f:
             self.room_id_counter = int(f.read())
+        self.stats.load()
         self.rooms = {}
-        self.user_room = {}
+        self.members.clear()
         if not self.data_dir.exists():
             return
+        now = time.time()
         for file in self.data_dir.glob('*.json'):
             with open(file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
+                # 房间文件最后一次存盘之后bot就没在跑了，这段时间不算谁的用时，期限整体往后挪
+                downtime = max(0, now - file.stat().st_mtime)
                 if data.get('status') == 'finished':
                     continue
                 room = self.dict_to_room(data)
                 room_id = file.stem
                 self.rooms[room_id] = room
-                for p in room['players']:
-                    self.user_room[p['id']] = room_id
+                for p in room.players:
+                    self.members.join(p.id, room_id, activate=False)
+                # 期限是绝对时间，挪过之后还过了的下一个tick就处理；老存档没有期限的从现在开始算
+                if room.deadline is not None:
+                    room.deadline += downtime
+                    if room.clock and room.clock['turn_start'] is not None:
+                        room.clock['turn_start'] += downtime
+                elif room.status == RoomStatus.WAITING:
+                    room.deadline = now + WAITING_TIMEOUT
+                else:
+                    self.start_clock(room_id, room)
+                    continue
+                self.timers.schedule(room_id, room.deadline)
+        self.members.load(self.data_dir / 'members.dat')
+
+    def turn_index(self, room):
+        """子类实现：轮到players里的第几个走"""
+        raise NotImplementedError('请在子类中实现turn_index')
+
+    def flag(self, room, idx):
+        """子类实现：players[idx]超时，设置对局结果"""
+        raise NotImplementedError('请在子类中实现flag')
+
+    def set_deadline(self, room_id, room, deadline):
+        room.deadline = deadline
+        if deadline is None:
+            self.timers.cancel(room_id)
+        else:
+            self.timers.schedule(room_id, deadline)
+
+    def room_waiting(self, room_id, room):
+        # 新开的房间等人加入
+        self.set_deadline(room_id, room, time.time() + WAITING_TIMEOUT)
+
+    def start_clock(self, room_id, room):
+        # 对局开始，或者悔棋之后：轮到的一方从现在开始计时
+        now = time.time()
+        clock = room.clock
+        if clock:
+            clock['turn_start'] = now
+        self.set_deadline(room_id, room, now + self.time_left(room, now))
+
+    def clock_moved(self, room_id, room):
+        # 走完一步（对局没结束）：刚走的一方扣掉用时再加秒，轮到对方计时
+        now = time.time()
+        clock = room.clock
+        if clock and clock['remaining']:
+            mover = 1 - self.turn_index(room)
+            left = clock['remaining'][mover] - (now - clock['turn_start'])
+            clock['remaining'][mover] = max(0, left) + clock['increment']
+        self.start_clock(room_id, room)
+
+    def time_left(self, room, now):
+        # 轮到的一方还能想多久
+        clock = room.clock
+        if not clock:
+            return IDLE_TIMEOUT
+        limits = []
+        if clock['remaining']:
+            limits.append(clock['remaining'][self.turn_index(room)])
+        if clock['per_move']:
+            limits.append(clock['per_move'])
+        return min(limits) - (now - clock['turn_start'])
+
+    def clock_text(self, room):
+        # 走棋提示后面跟的剩余时间
+        clock = room.clock
+        if not clock or not clock['remaining']:
+            return ''
+        now = time.time()
+        turn = self.turn_index(room)
+        left = [r - (now - clock['turn_start']) if i == turn else r for i, r in enumerate(clock['remaining'])]
+        return '，剩余时间 ' + ' / '.join(f"{p.name} {format_seconds(t)}" for p, t in zip(room.players, left))
+
+    async def tick(self, now):
+        """main里每秒调一次：处理到期的房间和该重新配对的排队玩家"""
+        for key in self.timers.advance(now):
+            try:
+                if isinstance(key, tuple):
+                    await self.match_recheck(key[1], now)
+                elif key in self.rooms:
+                    await self.on_deadline(key, self.rooms[key])
+            except Exception as e:
+                self.log.exception('%s期限处理失败: %s', key, e)
+
+    async def on_deadline(self, room_id, room):
+        if room.status == RoomStatus.WAITING:
+            self.remove_room(room_id)
+            await self.notify(f"房间{room_id}等了{WAITING_TIMEOUT // 60}分钟没人加入，已关闭。")
+        elif room.status == RoomStatus.PLAYING and not room.clock:
+            # 不计时的对局没人走了：只是清掉，不判输赢，也不计等级分
+            self.remove_room(room_id)
+            await self.notify(f"房间{room_id}已经{IDLE_TIMEOUT // 3600}小时没人走棋，关闭了（不计胜负）。")
+        elif room.status == RoomStatus.PLAYING:
+            idx = self.turn_index(room)
+            self.flag(room, idx)
+            room.status = RoomStatus.FINISHED
+            loser, winner = room.players[idx].name, room.players[1 - idx].name
+            await self.notify(f"房间{room_id}：{loser}超时判负，{winner}胜利！")
+            self.archive_game(room, room_id)
+        else:
+            self.remove_room(room_id)
+
+    def remove_room(self, room_id):
+        self.rooms.pop(room_id, None)
+        self.timers.cancel(room_id)
+        self.watchers.pop(room_id, None)
+        (self.data_dir / f'{room_id}.json').unlink(missing_ok=True)
+        self.members.drop_room(room_id)
+
+    def new_game(self, variant):
+        """子类实现：按匹配的变体新开一局"""
+        raise NotImplementedError('请在子类中实现new_game')
+
+    def make_room(self, game, players, status, clock=None):
+        """子类实现：新房间（Room或其子类）"""
+        raise NotImplementedError('请在子类中实现make_room')
+
+    def variant_name(self, variant):
+        """子类可覆盖：变体在提示里的写法"""
+        return variant
+
+    async def enqueue_match(self, msg, variant):
+        # 【匹配】：按等级分排队，能马上配上就直接开房
+        user_id = msg.talker_id
+        if user_id in self.match_variant:
+            await msg.reply("你已经在排队了，发送【取消匹配】退出。")
+            return
+        now = time.time()
+        rec = self.stats.players.get(user_id)
+        rating = rec.rating if rec else INITIAL_RATING
+        queue = self.match_queues.setdefault(variant, MatchQueue())
+        queue.push(Player(user_id, msg.talker_name), rating, now)
+        self.match_variant[user_id] = variant
+        if await self.try_match(variant, user_id, now, msg):
+            return
+        self.timers.schedule(('match', user_id), queue.next_widen(user_id, now))
+        await msg.reply(f"开始匹配{self.variant_name(variant)}（等级分{rating:.0f}），排队{len(queue)}人。发送【取消匹配】退出。")
+
+    async def cancel_match(self, msg):
+        variant = self.match_variant.pop(msg.talker_id, None)
+        if variant is None:
+            await msg.reply("你没有在排队。")
+            return
+        self.match_queues[variant].remove(msg.talker_id)
+        self.timers.cancel(('match', msg.talker_id))
+        await msg.reply("已退出匹配。")
+
+    async def try_match(self, variant, user_id, now, msg=None):
+        pair = self.match_queues[variant].pair(user_id, now)
+        if pair is None:
+            return False
+        players = list(pair)
+        random.shuffle(players)
+        for p in players:
+            del self.match_variant[p.id]
+            self.timers.cancel(('match', p.id))
+        room_id = self.new_room_id()
+        room = self.rooms[room_id] = self.make_room(self.new_game(variant), players, RoomStatus.PLAYING)
+        for p in players:
+            self.members.join(p.id, room_id)
+        self.start_clock(room_id, room)
+        text = f"匹配成功！房间{room_id}{self.variant_name(variant)}：{players[0].name} 对 {players[1].name}，{players[0].name}先手。"
+        if msg:
+            await msg.reply(text)
+        else:
+            await self.notify(text)
+        return True
+
+    async def match_recheck(self, user_id, now):
+        # 窗口放宽了一档，再找一次；排太久就退出
+        variant = self.match_variant.get(user_id)
+        if variant is None:
+            return
+        queue = self.match_queues[variant]
+        if queue.waited(user_id, now) >= MATCH_TIMEOUT:
+            player = queue.remove(user_id)
+            del self.match_variant[user_id]
+            await self.notify(f"{player.name}排了{MATCH_TIMEOUT // 60}分钟没匹配到，已退出队列。")
+            return
+        if not await self.try_match(variant, user_id, now):
+            self.timers.schedule(('match', user_id), queue.next_widen(user_id, now))
+
+    async def my_rooms(self, msg):
+        # 【我的房间】：只看这个人自己在的房间
+        user_id = msg.talker_id
+        room_ids = sorted(self.members.rooms_of(user_id), key=lambda r: (len(r), r))
+        if not room_ids:
+            await msg.reply("你当前不在任何房间。")
+            return
+        status_text = {RoomStatus.WAITING: '等人加入', RoomStatus.PLAYING: '对局中', RoomStatus.FINISHED: '已结束'}
+        lines = []
+        for room_id in room_ids:
+            room = self.rooms[room_id]
+            others = '、'.join(p.name for p in room.players if p.id != user_id)
+            line = f"房间{room_id}：{status_text[room.status]}" + (f"，对手{others}" if others else '')
+            if room_id == self.user_room.get(user_id):
+                line += '（当前）'
+            lines.append(line)
+        await msg.reply('\n'.join(lines) + "\n发送【切换 房间号】换到别的房间。")
+
+    async def switch_room(self, msg, room_id):
+        # 【切换 房间号】：换活动房间，之后的走棋、求和等都对这个房间
+        if not room_id:
+            await msg.reply("切到哪儿啊？发送【切换 房间号】，发送【我的房间】看你在哪些房间。")
+            return
+        if not self.members.activate(msg.talker_id, room_id):
+            await msg.reply(f"你不在房间{room_id}里。")
+            return
+        await msg.reply(f"已切换到房间{room_id}。")
+
+    async def notify(self, text):
+        # 往游戏频道发消息
+        if self.client:
+            await self.client.send_message(self.channel_id, text)
 
     def room_to_dict(self, room):
-        """子类可覆盖，默认直接返回room（需可序列化）"""
-        return room
+        """存盘/归档用的dict"""
+        return room.to_dict()
 
     def dict_to_room(self, data):
-        """子类可覆盖，默认直接返回data"""
-        return data
+        """子类实现：room_to_dict的逆，还原出game和history交给Room.from_dict"""
+        raise NotImplementedError('请在子类中实现dict_to_room')
+
+    def game_result(self, data):
+        """子类可覆盖，根据room_to_dict的结果返回players[0]的得分（1胜 0负 0.5和），未知返回None"""
+        return None
 
     async def message_handler(self, msg):
         """每个子类都应实现自己的消息处理逻辑"""
         raise NotImplementedError('请在子类中实现message_handler')
 
+    async def watch_handler(self, msg, in_game_channel=True):
+        """【观战 房间号】/【取消观战 房间号】/【取消观战】
+
+        游戏频道里发：推送到发消息的人的私聊；别的频道或私聊里发要带游戏名（【观战 五子棋 1000】），推送到发消息的地方
+        """
+        parts = msg.text.split()
+        if not in_game_channel:
+            if len(parts) < 2 or parts[1] != self.game_name:
+                return
+            del parts[1]
+            target = msg.room_id
+        else:
+            target = await msg.bot.dm_room(msg.talker_id)
+            if target is None:
+                await msg.reply("私聊发不过去，观战失败。")
+                return
+        room_id = parts[1] if len(parts) > 1 else None
+        if parts[0] == '取消观战':
+            rooms = [room_id] if room_id else [rid for rid, targets in self.watchers.items() if target in targets]
+            for rid in rooms:
+                targets = self.watchers.get(rid, {})
+                targets.pop(target, None)
+                if not targets:
+                    self.watchers.pop(rid, None)
+            await msg.reply("已取消观战。" if rooms else "你没有在观战。")
+            return
+        if parts[0] != '观战':
+            return
+        if not room_id:
+            await msg.reply("看哪儿啊？发送【观战 房间号】" + ("" if in_game_channel else f"，别的频道里要带上游戏名：【观战 {self.game_name} 房间号】"))
+            return
+        room = self.rooms.get(room_id)
+        if not room:
+            await msg.reply("没有这个房间号。")
+            return
+        if room.status == RoomStatus.FINISHED:
+            await msg.reply("这局已经结束了。")
+            return
+        self.watchers.setdefault(room_id, {})[target] = 0
+        where = '私聊' if in_game_channel else '这里'
+        await msg.reply(f"已开始观战{self.game_name}房间{room_id}，之后每一步都会推送到{where}。发送【取消观战】取消。")
+
+    def broadcast(self, room_id, msg, image_url, caption):
+        """把刚发给对局双方的棋盘图（已上传，按地址引用）推给观战的人
+
+        在后台推送，不耽误对局双方；推送跟不上时中间的局面会跳过，只推最新的
+        """
+        if not self.watchers.get(room_id) or not image_url:
+            return
+        self._broadcast_latest[room_id] = (msg.bot, image_url, caption)
+        task = self._broadcast_tasks.get(room_id)
+        if task is None or task.done():
+            self._broadcast_tasks[room_id] = asyncio.create_task(self._fan_out(room_id))
+
+    async def _fan_out(self, room_id):
+        while room_id in self._broadcast_latest:
+            client, image_url, caption = self._broadcast_latest.pop(room_id)
+            targets = self.watchers.get(room_id, {})
+            sent = list(targets)
+            results = await asyncio.gather(*(
+                asyncio.wait_for(client.send_message(target, caption, image_url), WATCH_TIMEOUT)
+                for target in sent
+            ), return_exceptions=True)
+            for target, ok in zip(sent, results):
+                if target not in targets:  # 推送途中取消了观战
+                    continue
+                if ok is True:
+                    targets[target] = 0
+                    continue
+                targets[target] += 1
+                if targets[target] >= WATCH_MAX_FAILURES:
+                    self.log.warning('房间%s观战推送到%s连续失败，不再推送', room_id, target)
+                    del targets[target]
+            room = self.rooms.get(room_id)
+            if not targets or not room or room.status == RoomStatus.FINISHED:
+                self.watchers.pop(room_id, None)
+                self._broadcast_latest.pop(room_id, None)
+        self._broadcast_tasks.pop(room_id, None)
+
     def archive_game(self, room, room_id=None):
         """将对局归档到archive/xxx/目录，文件名为时间戳_房间号.json"""
         archive_dir = Path(f'archive/{self.game_type}')
@@ -74,7 +453,17 @@ class ChessGameBase:
         ts = int(time.time())
         if room_id is None:
             room_id = 'unknown'
+        if room_id not in self._broadcast_latest:  # 最后一步还没推完的话推完再清
+            self.watchers.pop(room_id, None)
+        # 存档已经进了archive，房间在内存里再留一会儿就清掉
+        if self.rooms.get(room_id) is room:
+            self.set_deadline(room_id, room, time.time() + FINISHED_TTL)
+        (self.data_dir / f'{room_id}.json').unlink(missing_ok=True)
         data = self.room_to_dict(room)
         file_path = archive_dir / f'{ts}_{room_id}.json'
         with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2) 
\ No newline at end of file
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        # 更新战绩
+        score = self.game_result(data)
+        if score is not None and len(data.get('players', [])) == 2:
+            self.stats.record_game(data['players'], score, ts)
\ No newline at end of file
@@ -0,0 +1,305 @@
+import time
+import tablebase
+from bots.chess import ChessGame, MOVE_EP, decode_move
+
+# 国际象棋AI：迭代加深的alpha-beta搜索，置换表、MVV-LVA/杀手/历史启发排序、静态搜索
+# 搜索在子进程里跑（见ChessBot），这里只管给定局面和时间算出一步
+
+PIECE_VALUES = [100, 320, 330, 500, 900, 20000]
+MATE = 100000
+MATE_BOUND = MATE - 1000
+MAX_PLY = 64
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# 子力位置表，白方视角，下标是格子编号（第0行是第8横线），黑方用 sq ^ 56 镜像
+PST = [
+    [0, 0, 0, 0, 0, 0, 0, 0,
+     50, 50, 50, 50, 50, 50, 50, 50,
+     10, 10, 20, 30, 30, 20, 10, 10,
+     5, 5, 10, 25, 25, 10, 5, 5,
+     0, 0, 0, 20, 20, 0, 0, 0,
+     5, -5, -10, 0, 0, -10, -5, 5,
+     5, 10, 10, -20, -20, 10, 10, 5,
+     0, 0, 0, 0, 0, 0, 0, 0],
+    [-50, -40, -30, -30, -30, -30, -40, -50,
+     -40, -20, 0, 0, 0, 0, -20, -40,
+     -30, 0, 10, 15, 15, 10, 0, -30,
+     -30, 5, 15, 20, 20, 15, 5, -30,
+     -30, 0, 15, 20, 20, 15, 0, -30,
+     -30, 5, 10, 15, 15, 10, 5, -30,
+     -40, -20, 0, 5, 5, 0, -20, -40,
+     -50, -40, -30, -30, -30, -30, -40, -50],
+    [-20, -10, -10, -10, -10, -10, -10, -20,
+     -10, 0, 0, 0, 0, 0, 0, -10,
+     -10, 0, 5, 10, 10, 5, 0, -10,
+     -10, 5, 5, 10, 10, 5, 5, -10,
+     -10, 0, 10, 10, 10, 10, 0, -10,
+     -10, 10, 10, 10, 10, 10, 10, -10,
+     -10, 5, 0, 0, 0, 0, 5, -10,
+     -20, -10, -10, -10, -10, -10, -10, -20],
+    [0, 0, 0, 0, 0, 0, 0, 0,
+     5, 10, 10, 10, 10, 10, 10, 5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     0, 0, 0, 5, 5, 0, 0, 0],
+    [-20, -10, -10, -5, -5, -10, -10, -20,
+     -10, 0, 0, 0, 0, 0, 0, -10,
+     -10, 0, 5, 5, 5, 5, 0, -10,
+     -5, 0, 5, 5, 5, 5, 0, -5,
+     0, 0, 5, 5, 5, 5, 0, -5,
+     -10, 5, 5, 5, 5, 5, 0, -10,
+     -10, 0, 5, 0, 0, 0, 0, -10,
+     -20, -10, -10, -5, -5, -10, -10, -20],
+    [-30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -20, -30, -30, -40, -40, -30, -30, -20,
+     -10, -20, -20, -20, -20, -20, -20, -10,
+     20, 20, 0, 0, 0, 0, 20, 20,
+     20, 30, 10, 0, 0, 10, 30, 20],
+]
+
+
+class TimeUp(Exception):
+    pass
+
+
+def evaluate(game):
+    # 静态评估，返回当前走棋方视角的分数
+    bbs = game.bitboards
+    if game.must_capture:
+        # 有吃必吃：子越少越好
+        own = 0 if game.current_player == 'w' else 1
+        score = 100 * (bin(game.occupancy[1 - own]).count('1') - bin(game.occupancy[own]).count('1'))
+        return score
+    score = 0
+    for piece in range(12):
+        bb = bbs[piece]
+        kind = piece % 6
+        table = PST[kind]
+        value = PIECE_VALUES[kind]
+        white = piece < 6
+        while bb:
+            low = bb & -bb
+            bb ^= low
+            sq = low.bit_length() - 1
+            if white:
+                score += value + table[sq]
+            else:
+                score -= value + table[sq ^ 56]
+    return score if game.current_player == 'w' else -score
+
+
+class Searcher:
+    def __init__(self, game, time_limit, use_tablebase=True):
+        # 在副本上搜索，超时中途抛异常也不会弄乱原局面
+        self.game = ChessGame.from_bytes(game.to_bytes())
+        self.tablebase = tablebase.get_tablebase() if use_tablebase and not game.must_capture else None
+        self.tb_pieces = self.tablebase.max_pieces if self.tablebase else 0
+        self.deadline = time.monotonic() + time_limit
+        self.tt = {}  # zobrist -> (深度, 分数, 类型, 最佳走法)
+        self.killers = [[0, 0] for _ in range(MAX_PLY + 1)]
+        self.history = [0] * 4096  # 按(起点, 终点)记录
+        self.nodes = 0
+        self.path = []  # 搜索路径上的局面哈希，判断重复
+
+    def check_time(self):
+        self.nodes += 1
+        if self.nodes & 1023 == 0 and time.monotonic() > self.deadline:
+            raise TimeUp()
+
+    def is_capture(self, m):
+        return self.game.squares[(m >> 6) & 63] is not None or m & MOVE_EP
+
+    def order(self, moves, tt_move, ply):
+        sq = self.game.squares
+        killers = self.killers[ply]
+        history = self.history
+
+        def score(m):
+            if m == tt_move:
+                return 1 << 30
+            victim = sq[(m >> 6) & 63]
+            if victim is not None or m & MOVE_EP:
+                # MVV-LVA：先吃价值高的，再用价值低的子去吃
+                v = PIECE_VALUES[victim % 6] if victim is not None else 100
+                return (1 << 24) + v * 16 - PIECE_VALUES[sq[m & 63] % 6] // 100
+            if m & 0x7000:
+                return (1 << 23) + ((m >> 12) & 7)
+            if m == killers[0] or m == killers[1]:
+                return 1 << 22
+            return history[m & 4095]
+        moves.sort(key=score, reverse=True)
+        return moves
+
+    def terminal_score(self, ply):
+        # 没有合法走法时的分数（走棋方视角）
+        game = self.game
+        if game.must_capture:
+            return MATE - ply  # 无子可动的人赢
+        if game.is_in_check(game.current_player):
+            return -(MATE - ply)
+        return 0
+
+    def negamax(self, depth, alpha, beta, ply):
+        self.check_time()
+        game = self.game
+        if game.must_capture:
+            own = 0 if game.current_player == 'w' else 1
+            if not game.occupancy[own]:
+                return MATE - ply
+            if not game.occupancy[1 - own]:
+                return -(MATE - ply)
+        key = game.zobrist
+        if ply and (key in self.path or game.position_counts.get(key, 0) >= 2):
+            return 0
+        if ply and bin(game.occupancy[0] | game.occupancy[1]).count('1') <= self.tb_pieces:
+            probed = self.tablebase.probe(game)
+            if probed is not None:
+                result, plies = probed
+                return result * (MATE - ply - plies) if result else 0
+        if depth <= 0 or ply >= MAX_PLY:
+            return self.quiesce(alpha, beta, ply, 0)
+        alpha_orig = alpha
+        tt_move = 0
+        entry = self.tt.get(key)
+        if entry:
+            e_depth, e_score, e_flag, tt_move = entry
+            if e_depth >= depth and ply:
+                if e_score > MATE_BOUND:
+                    e_score -= ply
+                elif e_score < -MATE_BOUND:
+                    e_score += ply
+                if e_flag == EXACT:
+                    return e_score
+                if e_flag == LOWER and e_score >= beta:
+                    return e_score
+                if e_flag == UPPER and e_score <= alpha:
+                    return e_score
+        moves = game._generate_legal_ints(game.current_player)
+        if not moves:
+            return self.terminal_score(ply)
+        best_score = -MATE - 1
+        best_move = moves[0]
+        self.path.append(key)
+        for m in self.order(moves, tt_move, ply):
+            undo = game._make(m)
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            game._unmake(undo)
+            if score > best_score:
+                best_score = score
+                best_move = m
+                if ply == 0:
+                    self.root_best = m
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if not self.is_capture(m):
+                    killers = self.killers[ply]
+                    if killers[0] != m:
+                        killers[1] = killers[0]
+                        killers[0] = m
+                    self.history[m & 4095] += depth * depth
+                break
+        self.path.pop()
+        flag = UPPER if best_score <= alpha_orig else LOWER if best_score >= beta else EXACT
+        stored = best_score
+        if stored > MATE_BOUND:
+            stored += ply
+        elif stored < -MATE_BOUND:
+            stored -= ply
+        self.tt[key] = (depth, stored, flag, best_move)
+        return best_score
+
+    def quiesce(self, alpha, beta, ply, qply):
+        # 静态搜索：只看吃子（有吃必吃模式下被迫吃子时继续往下算）
+        self.check_time()
+        game = self.game
+        moves = game._generate_legal_ints(game.current_player)
+        if not moves:
+            return self.terminal_score(ply)
+        if game.must_capture:
+            if not game.occupancy[0 if game.current_player == 'w' else 1]:
+                return MATE - ply
+            forced = self.is_capture(moves[0])
+            if not forced or qply >= 8 or ply >= MAX_PLY:
+                return evaluate(game)
+            captures = moves
+        else:
+            stand_pat = evaluate(game)
+            if stand_pat >= beta or qply >= 8 or ply >= MAX_PLY:
+                return stand_pat
+            if stand_pat > alpha:
+                alpha = stand_pat
+            captures = [m for m in moves if self.is_capture(m) or m & 0x7000]
+            if not captures:
+                return stand_pat
+        best = alpha if not game.must_capture else -MATE - 1
+        for m in self.order(captures, 0, ply):
+            undo = game._make(m)
+            score = -self.quiesce(-beta, -alpha, ply + 1, qply + 1)
+            game._unmake(undo)
+            if score > best:
+                best = score
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+        return best
+
+    def search(self, max_depth=MAX_PLY):
+        # 迭代加深，超时后返回最后一轮完整搜索的结果
+        game = self.game
+        moves = game._generate_legal_ints(game.current_player)
+        if not moves:
+            return None, 0, 0
+        best, best_score, completed = moves[0], 0, 0
+        if len(moves) == 1:
+            return best, best_score, completed
+        for depth in range(1, max_depth + 1):
+            self.root_best = best
+            try:
+                best_score = self.negamax(depth, -MATE - 1, MATE + 1, 0)
+            except TimeUp:
+                break
+            best = self.root_best
+            completed = depth
+            if abs(best_score) > MATE_BOUND and MATE - abs(best_score) <= depth:
+                break  # 搜索范围内的杀棋不会再变；残局库给出的远距离杀棋继续加深找更短的
+        return best, best_score, completed
+
+
+def think(game_bytes, time_limit):
+    # 进程池入口：传入ChessGame.to_bytes()，返回走法字典（没有合法走法返回None）
+    game = ChessGame.from_bytes(game_bytes)
+    if not game.must_capture:
+        probed = tablebase.get_tablebase().best_move(game)
+        if probed is not None:
+            return decode_move(probed[0])
+    best, _, _ = Searcher(game, time_limit).search()
+    return None if best is None else decode_move(best)
+
+
+def analyse(game_bytes, time_limit):
+    # 分析命令用：残局库里有就直接给出结论，否则搜索；返回 (走法字典, 描述)
+    game = ChessGame.from_bytes(game_bytes)
+    if not game.must_capture:
+        probed = tablebase.get_tablebase().best_move(game)
+        if probed is not None:
+            m, result, plies = probed
+            return decode_move(m), '残局库：' + tablebase.describe(result, plies, game.current_player)
+    best, score, depth = Searcher(game, time_limit).search()
+    if best is None:
+        return None, '没有合法走法'
+    if game.current_player == 'b':
+        score = -score
+    if abs(score) > MATE_BOUND:
+        plies = MATE - abs(score)
+        text = f'{"白方" if score > 0 else "黑方"}{(plies + 1) // 2}步内将死'
+    else:
+        text = f'评估 {score / 100:+.2f}（白方视角）'
+    return decode_move(best), f'搜索深度{depth}：{text}'
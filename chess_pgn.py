@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from pathlib import Path
+if __name__ == '__main__':
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from bots.chess import ChessGame, move_to_san, parse_san, decode_move
+
+# 国际象棋存档和PGN互转，都是流式的：一次只读/写一盘，内存占用和存档数量无关
+#   python chess_pgn.py export [archive/chess] > games.pgn
+#   python chess_pgn.py import games.pgn [--archive archive/chess]
+# 导入的对局不计入战绩，需要的话之后跑一遍 python player_stats.py chess 重建
+
+ARCHIVE_DIR = Path('archive/chess')
+RESULTS = {'1-0', '0-1', '1/2-1/2', '*'}
+MOVE_NUMBER_RE = re.compile(r'^\d+\.+')
+MUST_CAPTURE_VARIANT = 'MustCapture'
+TAG_ESCAPE_RE = re.compile(r'\\(["\\])')
+
+
+def escape_tag(value):
+    # PGN标签值里的 \ 和 " 要加反斜杠转义，不然名字里带引号的导出来就读不回去
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def result_of(data):
+    game = data['game']
+    if not game.get('game_over'):
+        return '*'
+    winner = game.get('winner')
+    return '1-0' if winner == 'w' else '0-1' if winner == 'b' else '1/2-1/2'
+
+
+def record_to_pgn(data, ts=None):
+    # 一条存档记录（room_to_dict的结果）-> 一盘PGN文本
+    game_data = data['game']
+    players = data.get('players', [])
+    names = [p.get('name', '?') for p in players] + ['?', '?']
+    result = result_of(data)
+    tags = [
+        ('Event', 'rocket'),
+        ('Site', '?'),
+        ('Date', time.strftime('%Y.%m.%d', time.localtime(ts)) if ts else '????.??.??'),
+        ('Round', '-'),
+        ('White', names[0]),
+        ('Black', names[1]),
+        ('Result', result),
+    ]
+    if game_data.get('must_capture'):
+        tags.append(('Variant', MUST_CAPTURE_VARIANT))
+    game = ChessGame(must_capture=game_data.get('must_capture', False))
+    tokens = []
+    for i, move in enumerate(game_data.get('move_history', [])):
+        if isinstance(move, list):
+            move = {'from': move[0], 'to': move[1]}
+        m = game.encode_move({**move, 'from': tuple(move['from']), 'to': tuple(move['to'])})
+        if m is None or game.squares[m & 63] is None:
+            break  # 存档和初始局面对不上，只导出能重放的部分
+        if i % 2 == 0:
+            tokens.append(f'{i // 2 + 1}.')
+        tokens.append(move_to_san(game, m))
+        game._make(m)
+    tokens.append(result)
+    lines = [f'[{k} "{escape_tag(v)}"]' for k, v in tags]
+    lines.append('')
+    # 着法部分每行不超过80个字符
+    line = ''
+    for token in tokens:
+        if len(line) + len(token) + 1 > 80:
+            lines.append(line)
+            line = token
+        else:
+            line = f'{line} {token}' if line else token
+    lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+def export_archive(archive_dir=ARCHIVE_DIR):
+    # 逐个读存档文件，逐盘产出PGN文本
+    for path in sorted(Path(archive_dir).glob('*.json')):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        stem = path.stem.split('_')[0]
+        yield record_to_pgn(data, int(stem) if stem.isdigit() else None)
+
+
+def read_pgn(stream):
+    # 从文本流里逐盘读出 (标签字典, 着法文本)
+    tags = {}
+    movetext = []
+    for line in stream:
+        line = line.strip()
+        if line.startswith('[') and line.endswith(']'):
+            if movetext:
+                yield tags, '\n'.join(movetext)
+                tags, movetext = {}, []
+            m = re.match(r'^\[(\w+)\s+"(.*)"\]$', line)
+            if m:
+                tags[m.group(1)] = TAG_ESCAPE_RE.sub(r'\1', m.group(2))
+        elif line and not line.startswith('%'):
+            movetext.append(line)
+    if tags or movetext:
+        yield tags, '\n'.join(movetext)
+
+
+def san_tokens(movetext):
+    # 去掉注释、变着、NAG和回合数，产出SAN着法；最后一个结果标记也会去掉
+    depth = 0
+    i = 0
+    n = len(movetext)
+    token = []
+    while i <= n:
+        ch = movetext[i] if i < n else ' '
+        if ch == '{':
+            end = movetext.find('}', i)
+            i = n if end < 0 else end
+            ch = ' '
+        elif ch == ';':
+            end = movetext.find('\n', i)
+            i = n if end < 0 else end
+            ch = ' '
+        elif ch == '(':
+            depth += 1
+            ch = ' '
+        elif ch == ')':
+            depth -= 1
+            ch = ' '
+        if ch.isspace():
+            if token and depth == 0:
+                word = MOVE_NUMBER_RE.sub('', ''.join(token))
+                if word and not word.startswith('$') and word not in RESULTS:
+                    yield word
+            token = []
+        elif depth == 0:
+            token.append(ch)
+        i += 1
+
+
+def pgn_to_game(tags, movetext):
+    # 按着法在ChessGame上重放；遇到不合法的着法抛ValueError
+    game = ChessGame(must_capture=tags.get('Variant') == MUST_CAPTURE_VARIANT)
+    for san in san_tokens(movetext):
+        m = parse_san(game, san)
+        if m is None:
+            raise ValueError(f'第{len(game.move_history) + 1}步着法不合法: {san}')
+        response = game.move(decode_move(m))
+        if not response['success']:
+            raise ValueError(f'第{len(game.move_history) + 1}步着法不合法: {san}')
+    result = tags.get('Result', '*')
+    if not game.game_over and result != '*':
+        # 认输、协议和棋等不在着法里体现的结果
+        game.game_over = True
+        game.winner = 'w' if result == '1-0' else 'b' if result == '0-1' else None
+    return game
+
+
+def pgn_to_record(tags, movetext):
+    # PGN -> 存档记录，和ChessBot.room_to_dict的格式一致
+    game = pgn_to_game(tags, movetext)
+    players = [{'id': f"pgn:{tags.get(side, '?')}", 'name': tags.get(side, '?')} for side in ('White', 'Black')]
+    return {
+        'game': game.to_dict(),
+        'players': players,
+        'status': 'finished' if game.game_over else 'playing',
+        'draw_offer': None,
+    }
+
+
+def import_pgn(stream, archive_dir=ARCHIVE_DIR):
+    # 逐盘导入到存档目录，文件名沿用 时间戳_房间号.json，返回 (成功数, 失败数)
+    archive_dir = Path(archive_dir)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    ok = failed = 0
+    now = int(time.time())
+    for n, (tags, movetext) in enumerate(read_pgn(stream)):
+        try:
+            record = pgn_to_record(tags, movetext)
+        except ValueError as e:
+            print(f"第{n + 1}盘导入失败: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        try:
+            ts = int(time.mktime(time.strptime(tags.get('Date', ''), '%Y.%m.%d')))
+        except ValueError:
+            ts = now
+        # 文件名带上导入时间，同一天的对局、再导一次都不会重名；万一还是重名就加后缀，不覆盖已有的存档
+        stem = f'{ts}_pgn{now}-{n + 1}'
+        k = 0
+        while True:
+            try:
+                f = open(archive_dir / f"{stem}{f'-{k}' if k else ''}.json", 'x', encoding='utf-8')
+                break
+            except FileExistsError:
+                k += 1
+        with f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+        ok += 1
+    return ok, failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('export')
+    p.add_argument('archive', nargs='?', default=str(ARCHIVE_DIR))
+    p = sub.add_parser('import')
+    p.add_argument('pgn')
+    p.add_argument('--archive', default=str(ARCHIVE_DIR))
+    args = parser.parse_args()
+    if args.command == 'export':
+        for text in export_archive(args.archive):
+            sys.stdout.write(text + '\n')
+    else:
+        with open(args.pgn, 'r', encoding='utf-8', errors='replace') as f:
+            ok, failed = import_pgn(f, args.archive)
+        print(f'导入{ok}盘，失败{failed}盘')
@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+if __name__ == '__main__':
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import chess_engine
+import gomoku_engine
+from bots.chess import ChessGame, move_to_san
+from bots.gomoku import GomokuGame, point_name
+
+# 赛后批量分析：重放archive/<游戏>/下的每盘棋，标出败着、漏掉的杀棋（国际象棋）和漏掉的VCF（五子棋）
+# 结果追加写到同目录的analysis.jsonl，每盘一行；已分析过的存档重跑时跳过，中断后接着跑即可
+#   python game_analysis.py chess [--workers 4] [--chunk 16]
+#   python game_analysis.py gomoku
+
+ANALYSIS_FILE = 'analysis.jsonl'
+CHESS_DEPTH = 2          # 每步搜索的深度（另有静态搜索）
+BLUNDER_CP = 300         # 比最佳着法差这么多分算败着
+SCORE_CLAMP = 2000       # 比较分差时把杀棋分截断
+
+
+def _clamp(score):
+    return max(-SCORE_CLAMP, min(SCORE_CLAMP, score))
+
+
+def _search_score(game):
+    # 固定深度搜索，返回 (走棋方视角的分数, 最佳走法整数)；只有一步可走时也照常搜索
+    searcher = chess_engine.Searcher(game, time_limit=3600)
+    game = searcher.game
+    if not game._generate_legal_ints(game.current_player):
+        return searcher.terminal_score(0), None
+    score = 0
+    for depth in range(1, CHESS_DEPTH + 1):
+        searcher.root_best = None
+        score = searcher.negamax(depth, -chess_engine.MATE - 1, chess_engine.MATE + 1, 0)
+        if abs(score) > chess_engine.MATE_BOUND:
+            break
+    return score, searcher.root_best
+
+
+def analyse_chess(data):
+    # 返回注释列表：[半回合序号, 类型, 实战着法, 推荐着法, 分差或几步杀]
+    record = ChessGame.from_dict(data['game'])
+    game = ChessGame(must_capture=record.must_capture)
+    notes = []
+    prev = None  # 上一个局面的 (分数, 推荐着法SAN, 实战着法SAN)
+    for ply, move in enumerate(record.move_history):
+        m = game.encode_move(move)
+        if m is None or game.squares[m & 63] is None:
+            break
+        score, best = _search_score(game)
+        played = move_to_san(game, m)
+        best_san = move_to_san(game, best) if best is not None else played
+        if prev is not None:
+            _note(notes, ply - 1, prev, score)
+        prev = (score, best_san, played)
+        if not game.move(move)['success']:
+            break
+    if prev is not None:
+        score = _search_score(game)[0] if not game.game_over else _final_score(game)
+        _note(notes, len(record.move_history) - 1, prev, score)
+    return notes
+
+
+def _final_score(game):
+    # 终局时ChessGame不切换走棋方（current_player是刚走完的一方），这里给出对手视角的分数
+    if game.winner is None:
+        return 0
+    return -chess_engine.MATE if game.winner == game.current_player else chess_engine.MATE
+
+
+def _note(notes, ply, prev, next_score):
+    # prev是走这一步之前的搜索结果，next_score是走完之后对手视角的分数
+    score, best_san, played = prev
+    after = -next_score
+    if played == best_san:
+        return
+    mate = chess_engine.MATE_BOUND
+    if score > mate and after <= mate:
+        notes.append([ply, 'missed_mate', played, best_san, (chess_engine.MATE - score + 1) // 2])
+    elif _clamp(score) - _clamp(after) >= BLUNDER_CP:
+        notes.append([ply, 'blunder', played, best_san, _clamp(score) - _clamp(after)])
+
+
+def analyse_gomoku(data):
+    # 返回注释列表：[手数序号, 'missed_vcf', 实战落子, VCF第一步, VCF步数]
+    record = GomokuGame.from_dict(data['game'])
+    # 大棋盘只在全部棋子周围的一块上算
+    x0, y0, h, w = gomoku_engine.crop_region(record.board_size, record.bounds)
+    cells = [0] * (h * w)
+    solver = gomoku_engine.VCFSolver(cells, h, w, record.forbidden_rule)
+    notes = []
+    for ply, (x, y) in enumerate(record.move_history):
+        player = 1 if ply % 2 == 0 else 2
+        c = (x - x0) * w + y - y0
+        line = solver.solve(player)
+        if line and not _keeps_vcf(solver, player, c):
+            first = divmod(line[0], w)
+            notes.append([ply, 'missed_vcf', point_name(x, y), point_name(first[0] + x0, first[1] + y0), (len(line) + 1) // 2])
+        cells[c] = player
+    return notes
+
+
+def _keeps_vcf(solver, player, c):
+    # 实战这一步是否仍在某条VCF上：直接成五，或者冲四后（对方堵住）还有VCF
+    cells = solver.cells
+    if c in gomoku_engine.five_points(cells, solver.wins, player, solver.exact(player)):
+        return True
+    cells[c] = player
+    try:
+        lines = gomoku_engine._line_fives(cells, solver.by_cell, c, player, solver.exact(player))
+        if not lines:
+            return False
+        defences = set().union(*lines.values())
+        if len(defences) >= 2:
+            return True
+        d = defences.pop()
+        cells[d] = 3 - player
+        line = solver.solve(player)
+        cells[d] = 0
+        return line is not None
+    finally:
+        cells[c] = 0
+
+
+ANALYSERS = {'chess': analyse_chess, 'gomoku': analyse_gomoku}
+
+
+def analyse_chunk(game_type, paths):
+    # 子进程入口：分析一批存档文件，返回 [(文件名, 注释或None, 错误信息或None), ...]
+    analyse = ANALYSERS[game_type]
+    results = []
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            results.append((Path(path).name, analyse(data), None))
+        except Exception as e:
+            results.append((Path(path).name, None, repr(e)))
+    return results
+
+
+def load_done(out_path):
+    done = set()
+    if out_path.exists():
+        with open(out_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)['file'])
+                except (ValueError, KeyError):
+                    continue  # 上次中断时写了半行
+    return done
+
+
+def run(game_type, archive_dir=None, workers=None, chunk=16):
+    archive_dir = Path(archive_dir or f'archive/{game_type}')
+    out_path = archive_dir / ANALYSIS_FILE
+    done = load_done(out_path)
+    paths = [str(p) for p in sorted(archive_dir.glob('*.json')) if p.name not in done]
+    total = len(paths)
+    print(f'{archive_dir}: 已分析{len(done)}盘，待分析{total}盘')
+    if not total:
+        return
+    chunks = [paths[i:i + chunk] for i in range(0, total, chunk)]
+    start = time.time()
+    finished = flagged = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(out_path, 'a', encoding='utf-8') as out:
+        futures = [pool.submit(analyse_chunk, game_type, c) for c in chunks]
+        for future in as_completed(futures):
+            for name, notes, error in future.result():
+                if error:
+                    failed += 1
+                    print(f'{name} 分析失败: {error}', file=sys.stderr)
+                    continue
+                out.write(json.dumps({'file': name, 'notes': notes}, ensure_ascii=False, separators=(',', ':')) + '\n')
+                flagged += bool(notes)
+            out.flush()  # 每批写完就落盘，中断后从这里继续
+            finished += len(future.result())
+            elapsed = time.time() - start
+            rate = finished / elapsed if elapsed else 0
+            eta = (total - finished) / rate if rate else 0
+            print(f'\r{finished}/{total}盘 {rate:.1f}盘/秒 预计还需{eta:.0f}秒', end='', flush=True)
+    print(f'\n完成：{finished}盘，其中{flagged}盘有标注，{failed}盘失败，用时{time.time() - start:.1f}秒')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('game', choices=sorted(ANALYSERS))
+    parser.add_argument('--archive', default=None, help='存档目录，默认archive/<游戏>')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk', type=int, default=16, help='每个任务分析几盘')
+    args = parser.parse_args()
+    run(args.game, args.archive, args.workers, args.chunk)
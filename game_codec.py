@@ -0,0 +1,218 @@
+import struct
+
+# 紧凑二进制编码，和to_dict/from_dict的字典格式一一对应，可精确往返
+# 格式：1字节类型标记 + 1字节格式版本 + 正文
+
+CHESS_TAG = 0x43  # 'C'
+GOMOKU_TAG = 0x47  # 'G'
+FORMAT_VERSION = 1         # 国际象棋
+# 五子棋格式每改一次加1，读的时候老版本都认：
+#   1 整盘棋盘  2 后面接落子顺序  3 flags的0x40位表示棋盘存成稀疏的子列表
+GOMOKU_FORMAT_VERSION = 3
+
+# 国际象棋棋子 <-> 4bit编码，0表示空格
+_PIECE_CODES = {}
+for _i, _kind in enumerate('PNBRQK'):
+    _PIECE_CODES['w' + _kind] = 1 + _i
+    _PIECE_CODES['b' + _kind] = 9 + _i
+_CODE_PIECES = {v: k for k, v in _PIECE_CODES.items()}
+
+_PROMO_CODES = {None: 0, 'Q': 1, 'R': 2, 'B': 3, 'N': 4}
+_CODE_PROMOS = {v: k for k, v in _PROMO_CODES.items()}
+_NO_MOVE = 0xFFFF
+
+_WINNER_CODES = {None: 0, 'w': 1, 'b': 2}
+_CODE_WINNERS = {v: k for k, v in _WINNER_CODES.items()}
+_CASTLING_KEYS = ('wK', 'wQ', 'bK', 'bQ')
+
+
+class CodecError(ValueError):
+    pass
+
+
+def _write_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(buf, pos):
+    n = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _check_header(buf, tag, newest=FORMAT_VERSION):
+    # 返回数据的格式版本
+    if len(buf) < 2 or buf[0] != tag:
+        raise CodecError('不是该游戏的存档数据')
+    if not 1 <= buf[1] <= newest:
+        raise CodecError(f'不支持的存档格式版本: {buf[1]}')
+    return buf[1]
+
+
+# 走法打包成16位：0-5位起点，6-11位终点，12-14位升变
+def _pack_move(m):
+    if m is None:
+        return _NO_MOVE
+    if isinstance(m, dict):
+        (fx, fy), (tx, ty), promo = m['from'], m['to'], m.get('promotion')
+    else:
+        (fx, fy), (tx, ty), promo = m[0], m[1], None
+    return (fx * 8 + fy) | ((tx * 8 + ty) << 6) | (_PROMO_CODES[promo] << 12)
+
+
+def _unpack_move(v):
+    if v == _NO_MOVE:
+        return None
+    f, t, promo = v & 0x3F, (v >> 6) & 0x3F, _CODE_PROMOS[v >> 12]
+    m = {'from': (f >> 3, f & 7), 'to': (t >> 3, t & 7)}
+    if promo:
+        m['promotion'] = promo
+    return m
+
+
+def _pack_hash(h, width):
+    if isinstance(h, int):
+        return h.to_bytes(width, 'big')
+    return bytes.fromhex(h)
+
+
+def pack_chess(data):
+    out = bytearray((CHESS_TAG, FORMAT_VERSION))
+    flags = (
+        (data.get('current_player', 'w') == 'b')
+        | (bool(data.get('game_over')) << 1)
+        | (bool(data.get('must_capture')) << 2)
+        | (_WINNER_CODES[data.get('winner')] << 3)
+    )
+    cr = data.get('castling_rights', {})
+    castling = 0
+    for i, k in enumerate(_CASTLING_KEYS):
+        castling |= bool(cr.get(k)) << i
+    ep = data.get('en_passant')
+    out += bytes((flags, castling, 0xFF if not ep else ep[0] * 8 + ep[1]))
+    # 棋盘：每格4bit，共32字节
+    cells = [_PIECE_CODES.get(p, 0) for row in data['board'] for p in row]
+    out += bytes(cells[i] | (cells[i + 1] << 4) for i in range(0, 64, 2))
+    out += struct.pack('<H', _pack_move(data.get('last_move')))
+    history = data.get('move_history', [])
+    _write_varint(out, len(history))
+    out += struct.pack(f'<{len(history)}H', *(_pack_move(m) for m in history))
+    # 局面哈希：md5十六进制串存16字节，整数哈希存8字节
+    positions = data.get('position_history', [])
+    width = 16 if positions and isinstance(positions[0], str) else 8
+    out.append(width)
+    _write_varint(out, len(positions))
+    for h in positions:
+        out += _pack_hash(h, width)
+    return bytes(out)
+
+
+def unpack_chess(buf):
+    _check_header(buf, CHESS_TAG)
+    flags, castling, ep = buf[2], buf[3], buf[4]
+    cells = []
+    for b in buf[5:37]:
+        cells.append(_CODE_PIECES.get(b & 0x0F))
+        cells.append(_CODE_PIECES.get(b >> 4))
+    pos = 37
+    last_move = _unpack_move(struct.unpack_from('<H', buf, pos)[0])
+    n, pos = _read_varint(buf, pos + 2)
+    history = [_unpack_move(v) for v in struct.unpack_from(f'<{n}H', buf, pos)]
+    pos += 2 * n
+    width = buf[pos]
+    n, pos = _read_varint(buf, pos + 1)
+    if width == 16:
+        positions = [buf[pos + i * 16:pos + (i + 1) * 16].hex() for i in range(n)]
+    else:
+        positions = [int.from_bytes(buf[pos + i * 8:pos + (i + 1) * 8], 'big') for i in range(n)]
+    return {
+        'board': [cells[i * 8:(i + 1) * 8] for i in range(8)],
+        'current_player': 'b' if flags & 1 else 'w',
+        'game_over': bool(flags & 2),
+        'winner': _CODE_WINNERS[(flags >> 3) & 3],
+        'last_move': last_move,
+        'move_history': history,
+        'castling_rights': {k: bool(castling >> i & 1) for i, k in enumerate(_CASTLING_KEYS)},
+        'en_passant': None if ep == 0xFF else (ep >> 3, ep & 7),
+        'must_capture': bool(flags & 4),
+        'position_history': positions,
+    }
+
+
+# 五子棋winner可能是None/0/1/2
+_GOMOKU_WINNER_CODES = {None: 3, 0: 0, 1: 1, 2: 2}
+_GOMOKU_CODE_WINNERS = {v: k for k, v in _GOMOKU_WINNER_CODES.items()}
+
+
+def pack_gomoku(data):
+    h, w = data.get('board_size', (15, 15))
+    out = bytearray((GOMOKU_TAG, GOMOKU_FORMAT_VERSION, h, w))
+    flags = (
+        (data.get('current_player', 1) == 2)
+        | (bool(data.get('game_over')) << 1)
+        | (bool(data.get('forbidden_rule')) << 2)
+        | (_GOMOKU_WINNER_CODES[data.get('winner')] << 3)
+        | ((data.get('last_move') is not None) << 5)
+        | (('stones' in data) << 6)
+    )
+    out.append(flags)
+    lm = data.get('last_move')
+    out += bytes(lm) if lm is not None else b'\x00\x00\x00'
+    if 'stones' in data:
+        # 稀疏棋盘：子数 + 每子3字节 (行, 列, 颜色)
+        _write_varint(out, len(data['stones']))
+        for stone in data['stones']:
+            out += bytes(stone)
+    else:
+        # 整盘棋盘（老格式）：每格2bit，一字节4格
+        cells = [c for row in data['board'] for c in row]
+        cells += [0] * (-len(cells) % 4)
+        out += bytes(
+            cells[i] | (cells[i + 1] << 2) | (cells[i + 2] << 4) | (cells[i + 3] << 6)
+            for i in range(0, len(cells), 4)
+        )
+    # 落子顺序接在棋盘后面，每步2字节（版本2起）
+    history = data.get('move_history', [])
+    _write_varint(out, len(history))
+    for x, y in history:
+        out += bytes((x, y))
+    return bytes(out)
+
+
+def unpack_gomoku(buf):
+    version = _check_header(buf, GOMOKU_TAG, GOMOKU_FORMAT_VERSION)
+    h, w, flags = buf[2], buf[3], buf[4]
+    last_move = tuple(buf[5:8]) if flags & 0x20 else None
+    if version >= 3 and flags & 0x40:
+        n, pos = _read_varint(buf, 8)
+        board = {'stones': [list(buf[pos + 3 * i:pos + 3 * i + 3]) for i in range(n)]}
+        end = pos + 3 * n
+    else:
+        cells = []
+        end = 8 + (h * w + 3) // 4
+        for b in buf[8:end]:
+            cells += (b & 3, (b >> 2) & 3, (b >> 4) & 3, b >> 6)
+        board = {'board': [cells[i * w:(i + 1) * w] for i in range(h)]}
+    history = []
+    if version >= 2:
+        n, pos = _read_varint(buf, end)
+        history = [(buf[pos + 2 * i], buf[pos + 2 * i + 1]) for i in range(n)]
+    return {
+        'board_size': (h, w),
+        **board,
+        'current_player': 2 if flags & 1 else 1,
+        'game_over': bool(flags & 2),
+        'winner': _GOMOKU_CODE_WINNERS[(flags >> 3) & 3],
+        'last_move': last_move,
+        'forbidden_rule': bool(flags & 4),
+        'move_history': history,
+    }
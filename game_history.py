@@ -0,0 +1,60 @@
+from array import array
+
+# 对局历史，悔棋和回放用：每隔CHECKPOINT_INTERVAL手存一份完整局面（game.to_bytes()），
+# 中间每手只记一个16位整数（game.pack_move）。回到第n手 = 从n之前最近的存档点恢复局面，
+# 再重放不到CHECKPOINT_INTERVAL手，和对局长短无关
+# 对局类要提供: move_history、to_bytes/from_bytes、pack_move(move_history里的一步) -> int、
+# play_packed(int) -> move()的返回值
+CHECKPOINT_INTERVAL = 16
+
+
+class GameHistory:
+    def __init__(self, game):
+        # game是记录的起点，一般是开局；从中途开始记的话更早的局面回不去
+        self.game_class = type(game)
+        self.start = len(game.move_history)
+        self.checkpoints = [game.to_bytes()]  # checkpoints[i]是第start + i*CHECKPOINT_INTERVAL手之后的局面
+        self.moves = array('H')
+
+    @classmethod
+    def rebuild(cls, start, game):
+        # 从开局start按game.move_history重放一遍（读存档时用）；
+        # 重放不出game的局面（老存档没有完整走法记录等）就只从当前局面开始记
+        history = cls(start)
+        for move in game.move_history:
+            if not start.play_packed(start.pack_move(move))['success']:
+                return cls(game)
+            history.record(start)
+        if start.to_bytes() != game.to_bytes():
+            return cls(game)
+        return history
+
+    @property
+    def ply(self):
+        # 当前是第几手
+        return self.start + len(self.moves)
+
+    def record(self, game):
+        # 对局每走成一步调用一次
+        self.moves.append(game.pack_move(game.move_history[-1]))
+        if len(self.moves) % CHECKPOINT_INTERVAL == 0:
+            self.checkpoints.append(game.to_bytes())
+
+    def position(self, ply):
+        # 第ply手之后的局面（新对象）；不在记录范围内返回None
+        if not self.start <= ply <= self.ply:
+            return None
+        i = (ply - self.start) // CHECKPOINT_INTERVAL
+        game = self.game_class.from_bytes(self.checkpoints[i])
+        for m in self.moves[i * CHECKPOINT_INTERVAL:ply - self.start]:
+            game.play_packed(m)
+        return game
+
+    def undo(self, plies):
+        # 悔plies手：返回退回去之后的局面，之后的记录丢掉；退不了返回None
+        ply = self.ply - plies
+        game = self.position(ply)
+        if game is not None:
+            del self.moves[ply - self.start:]
+            del self.checkpoints[(ply - self.start) // CHECKPOINT_INTERVAL + 1:]
+        return game
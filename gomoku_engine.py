@@ -0,0 +1,623 @@
+import random
+import time
+
+# 五子棋搜索：VCF（连续冲四取胜），以及电脑对手用的VCT和alpha-beta
+# 棋盘摊平成一维列表 cells[x*w + y]，0空1黑2白；所有“五连窗口”按棋盘大小预先算好
+
+MAX_VCF_DEPTH = 12   # 最多连冲几步
+VCF_NODE_LIMIT = 3000
+
+_windows_cache = {}
+
+
+def windows(h, w):
+    # 每个窗口: (5个格子, 窗口前一格, 窗口后一格)，前后没有格子时为-1
+    key = (h, w)
+    if key not in _windows_cache:
+        result = []
+        for dx, dy in ((1, 0), (0, 1), (1, 1), (1, -1)):
+            for x in range(h):
+                for y in range(w):
+                    ex, ey = x + 4 * dx, y + 4 * dy
+                    if not (0 <= ex < h and 0 <= ey < w):
+                        continue
+                    cells = tuple((x + i * dx) * w + y + i * dy for i in range(5))
+                    bx, by, ax, ay = x - dx, y - dy, ex + dx, ey + dy
+                    before = bx * w + by if 0 <= bx < h and 0 <= by < w else -1
+                    after = ax * w + ay if 0 <= ax < h and 0 <= ay < w else -1
+                    result.append((cells, before, after))
+        _windows_cache[key] = result
+    return _windows_cache[key]
+
+
+def flatten(board):
+    return [v for row in board for v in row]
+
+
+def five_points(cells, wins, player, exact=False):
+    # 下一手能成五的点；exact为黑棋禁手规则，长连不算
+    points = set()
+    for win, before, after in wins:
+        empty = -1
+        count = 0
+        for c in win:
+            v = cells[c]
+            if v == player:
+                count += 1
+            elif v == 0:
+                empty = c
+            else:
+                break
+        else:
+            if count == 4:
+                if exact and ((before >= 0 and cells[before] == player) or (after >= 0 and cells[after] == player)):
+                    continue
+                points.add(empty)
+    return points
+
+
+def four_points(cells, wins, player):
+    # 下一手能冲四的候选点：所在窗口里已有3子、其余为空
+    points = set()
+    for win, _, _ in wins:
+        count = 0
+        empties = []
+        for c in win:
+            v = cells[c]
+            if v == player:
+                count += 1
+            elif v == 0:
+                empties.append(c)
+            else:
+                break
+        else:
+            if count == 3:
+                points.update(empties)
+    return points
+
+
+def _line_fives(cells, wins_by_cell, c, player, exact):
+    # 落在c之后，经过c的各条线上形成的成五点；按方向分组，用来判四四
+    lines = {}
+    for win, before, after, direction in wins_by_cell[c]:
+        empty = -1
+        count = 0
+        for k in win:
+            v = cells[k]
+            if v == player:
+                count += 1
+            elif v == 0:
+                empty = k
+            else:
+                break
+        else:
+            if count == 4:
+                if exact and ((before >= 0 and cells[before] == player) or (after >= 0 and cells[after] == player)):
+                    continue
+                lines.setdefault(direction, set()).add(empty)
+    return lines
+
+
+_by_cell_cache = {}
+
+
+def windows_by_cell(h, w):
+    key = (h, w)
+    if key not in _by_cell_cache:
+        table = [[] for _ in range(h * w)]
+        for win, before, after in windows(h, w):
+            direction = win[1] - win[0]
+            for c in win:
+                table[c].append((win, before, after, direction))
+        _by_cell_cache[key] = table
+    return _by_cell_cache[key]
+
+
+_line_cells_cache = {}
+
+
+def line_cells(h, w):
+    # 每格4个方向上左右各5格的格子编号（出界为-1），方向和顺序同bots/gomoku的DIRECTIONS、LINE_OFFSETS，用来编line_key
+    key = (h, w)
+    if key not in _line_cells_cache:
+        table = []
+        for x in range(h):
+            for y in range(w):
+                table.append([
+                    tuple((x + dx * k) * w + y + dy * k if 0 <= x + dx * k < h and 0 <= y + dy * k < w else -1
+                          for k in range(-5, 6) if k)
+                    for dx, dy in ((1, 0), (0, 1), (1, 1), (1, -1))
+                ])
+        _line_cells_cache[key] = table
+    return _line_cells_cache[key]
+
+
+class VCFSolver:
+    def __init__(self, cells, h, w, forbidden_rule=False):
+        self.cells = cells
+        self.h, self.w = h, w
+        self.wins = windows(h, w)
+        self.by_cell = windows_by_cell(h, w)
+        self.forbidden_rule = forbidden_rule
+        if forbidden_rule:
+            from bots.gomoku import MAX_FORBIDDEN_DEPTH, renju_shape
+            self.lines = line_cells(h, w)
+            self.renju_shape = renju_shape
+            self.max_forbidden_depth = MAX_FORBIDDEN_DEPTH
+        self.nodes = 0
+
+    def exact(self, player):
+        return self.forbidden_rule and player == 1
+
+    def forbidden(self, c, depth=0):
+        # 黑棋落在c是否禁手，同GomokuGame.check_forbidden，只是直接在cells上编line_key（出界按白子算）
+        cells = self.cells
+        keys = []
+        for line in self.lines[c]:
+            key = 0
+            for k in line:
+                key = key * 3 + (cells[k] if k >= 0 else 2)
+            keys.append(key)
+        result, threes = self.renju_shape(keys)
+        if result is not None:
+            return result
+        if depth >= self.max_forbidden_depth:
+            return False
+        temp = cells[c]
+        cells[c] = 1
+        real = 0
+        for dx, dy, points in threes:
+            for k in points:
+                if not self.forbidden(c + (dx * self.w + dy) * k, depth + 1):
+                    real += 1
+                    break
+        cells[c] = temp
+        return '双活三' if real >= 2 else False
+
+    def solve(self, player, max_depth=MAX_VCF_DEPTH, node_limit=VCF_NODE_LIMIT):
+        # 返回攻方的取胜序列 [攻, 守, 攻, ...]（最后一步成五），找不到返回None
+        self.nodes = 0
+        self.node_limit = node_limit
+        return self._attack(player, max_depth)
+
+    def _attack(self, player, depth):
+        self.nodes += 1
+        cells = self.cells
+        opponent = 3 - player
+        own = five_points(cells, self.wins, player, self.exact(player))
+        if own:
+            return [min(own)]
+        if five_points(cells, self.wins, opponent, self.exact(opponent)):
+            return None  # 对方已经有四，冲四挡不住
+        if depth <= 0 or self.nodes > self.node_limit:
+            return None
+        for c in sorted(four_points(cells, self.wins, player)):
+            if cells[c] or (self.exact(player) and self.forbidden(c)):
+                continue  # 有子，或者黑棋禁手（一条线上的四四、四三三也算）
+            cells[c] = player
+            lines = _line_fives(cells, self.by_cell, c, player, self.exact(player))
+            if not lines:
+                cells[c] = 0
+                continue
+            defences = set().union(*lines.values())
+            if len(defences) >= 2:
+                cells[c] = 0
+                return [c, min(defences), min(defences - {min(defences)})]  # 活四或双四，堵不过来
+            d = defences.pop()
+            cells[d] = opponent
+            rest = self._attack(player, depth - 1)
+            cells[d] = 0
+            cells[c] = 0
+            if rest:
+                return [c, d] + rest
+        return None
+
+
+def find_vcf(board, player, forbidden_rule=False, max_depth=MAX_VCF_DEPTH, node_limit=VCF_NODE_LIMIT):
+    # board为二维棋盘，返回 [(x, y), ...] 取胜序列或None
+    h, w = len(board), len(board[0])
+    solver = VCFSolver(flatten(board), h, w, forbidden_rule)
+    line = solver.solve(player, max_depth, node_limit)
+    return None if line is None else [divmod(c, w) for c in line]
+
+
+# ---------------- 电脑对手 ----------------
+# 先找杀（成五、VCF、VCT），找不到再在已有棋子附近的候选点上做迭代加深的alpha-beta
+# 评估按五连窗口增量维护：每个窗口只有一方的子时，按子数计分；落子/提子只改经过该点的窗口
+# 搜索在子进程里跑（见GomokuBot），这里只管给定局面和时间算出一步
+
+WINDOW_SCORES = [0, 1, 12, 150, 2500, 0]  # 窗口里只有己方k个子时的分
+WIN = 10000000
+WIN_BOUND = WIN - 1000
+NEAR = 2              # 候选点：离已有棋子横竖斜不超过2格的空点
+MAX_CANDIDATES = 12   # alpha-beta每层最多展开的候选点
+MAX_PLY = 32
+VCT_DEPTH = 5         # VCT最多连续进攻几步
+VCT_NODE_LIMIT = 4000
+EXACT, LOWER, UPPER = 0, 1, 2
+CROP_AREA = 19 * 19   # 比这大的棋盘只搜棋子周围的一块
+CROP_MARGIN = 7       # 截出来的区域在棋子外面留几格
+CROP_MIN = 15
+
+_tables_cache = {}
+
+
+def _tables(h, w):
+    # (窗口列表, 每格经过的窗口下标, 每格NEAR范围内的邻格, Zobrist随机数[玩家][格子])
+    key = (h, w)
+    if key not in _tables_cache:
+        wins = windows(h, w)
+        cell_windows = [[] for _ in range(h * w)]
+        for i, (win, _, _) in enumerate(wins):
+            for c in win:
+                cell_windows[c].append(i)
+        neighbors = []
+        for x in range(h):
+            for y in range(w):
+                neighbors.append([
+                    nx * w + ny
+                    for nx in range(max(0, x - NEAR), min(h, x + NEAR + 1))
+                    for ny in range(max(0, y - NEAR), min(w, y + NEAR + 1))
+                    if (nx, ny) != (x, y)
+                ])
+        rng = random.Random(h * 1000 + w)
+        zobrist = [None] + [[rng.getrandbits(64) for _ in range(h * w)] for _ in range(2)]
+        _tables_cache[key] = (wins, cell_windows, neighbors, zobrist)
+    return _tables_cache[key]
+
+
+class TimeUp(Exception):
+    pass
+
+
+class Searcher:
+    def __init__(self, game, time_limit):
+        # 在副本上搜索；game是GomokuGame，禁手判断借用它的check_forbidden（棋盘和cells同步）
+        self.game = type(game).from_dict(game.to_dict())
+        self.h, self.w = self.game.board_size
+        self.forbidden_rule = self.game.forbidden_rule
+        self.wins, self.cell_windows, self.neighbors, self.zobrist = _tables(self.h, self.w)
+        n = self.h * self.w
+        self.cells = [0] * n
+        self.count = [None, [0] * len(self.wins), [0] * len(self.wins)]  # 每个窗口里各方的子数
+        self.score = [0, 0, 0]               # 各方所有活窗口的分之和
+        self.four_wins = [None, set(), set()]  # 差一子成五的窗口
+        self.near = [0] * n
+        self.hash = 0
+        for (x, y), v in self.game.stone_map.items():
+            self.place(x * self.w + y, v, mirror=False)
+        self.vcf = VCFSolver(self.cells, self.h, self.w, self.forbidden_rule)
+        self.deadline = time.monotonic() + time_limit
+        self.tt = {}  # hash -> (深度, 分数, 类型, 最佳点)
+        self.nodes = 0
+
+    def check_time(self):
+        self.nodes += 1
+        if self.nodes & 63 == 0 and time.monotonic() > self.deadline:
+            raise TimeUp()
+
+    def place(self, c, p, mirror=True):
+        q = 3 - p
+        own, other = self.count[p], self.count[q]
+        score = self.score
+        for i in self.cell_windows[c]:
+            a, b = own[i], other[i]
+            if b == 0:
+                score[p] += WINDOW_SCORES[a + 1] - WINDOW_SCORES[a]
+                if a == 3:
+                    self.four_wins[p].add(i)
+                elif a == 4:
+                    self.four_wins[p].discard(i)
+            elif a == 0:
+                score[q] -= WINDOW_SCORES[b]  # 对方的窗口被堵死
+                if b == 4:
+                    self.four_wins[q].discard(i)
+            own[i] = a + 1
+        self.cells[c] = p
+        self.hash ^= self.zobrist[p][c]
+        for k in self.neighbors[c]:
+            self.near[k] += 1
+        if mirror and self.forbidden_rule:
+            self.game.stone_map[divmod(c, self.w)] = p
+
+    def remove(self, c, p):
+        q = 3 - p
+        own, other = self.count[p], self.count[q]
+        score = self.score
+        for i in self.cell_windows[c]:
+            a, b = own[i] - 1, other[i]
+            own[i] = a
+            if b == 0:
+                score[p] -= WINDOW_SCORES[a + 1] - WINDOW_SCORES[a]
+                if a == 3:
+                    self.four_wins[p].discard(i)
+                elif a == 4:
+                    self.four_wins[p].add(i)
+            elif a == 0:
+                score[q] += WINDOW_SCORES[b]
+                if b == 4:
+                    self.four_wins[q].add(i)
+        self.cells[c] = 0
+        self.hash ^= self.zobrist[p][c]
+        for k in self.neighbors[c]:
+            self.near[k] -= 1
+        if self.forbidden_rule:
+            del self.game.stone_map[divmod(c, self.w)]
+
+    def exact(self, p):
+        return self.forbidden_rule and p == 1
+
+    def five_points(self, p):
+        # p下一手成五的点（黑棋禁手规则下长连不算）
+        points = set()
+        cells = self.cells
+        for i in self.four_wins[p]:
+            win, before, after = self.wins[i]
+            if self.exact(p) and ((before >= 0 and cells[before] == p) or (after >= 0 and cells[after] == p)):
+                continue
+            for c in win:
+                if not cells[c]:
+                    points.add(c)
+        return points
+
+    def forbidden(self, c, p):
+        return self.exact(p) and bool(self.game.check_forbidden(*divmod(c, self.w)))
+
+    def move_score(self, c, p):
+        # 在c落p的进攻分（己方窗口加分）+防守分（堵死对方窗口）
+        own, other = self.count[p], self.count[3 - p]
+        gain = 0
+        for i in self.cell_windows[c]:
+            a, b = own[i], other[i]
+            if b == 0:
+                gain += WINDOW_SCORES[a + 1] - WINDOW_SCORES[a]
+            elif a == 0:
+                gain += WINDOW_SCORES[b]
+        return gain
+
+    def candidates(self, p, limit=MAX_CANDIDATES):
+        cells, near = self.cells, self.near
+        points = [c for c in range(len(cells)) if near[c] and not cells[c]]
+        points.sort(key=lambda c: self.move_score(c, p), reverse=True)
+        result = []
+        for c in points:
+            if not self.forbidden(c, p):
+                result.append(c)
+                if len(result) >= limit:
+                    break
+        return result
+
+    def evaluate(self, p):
+        # 走棋方视角；轮到谁走谁的威胁更值钱
+        return self.score[p] * 3 // 2 - self.score[3 - p]
+
+    def negamax(self, depth, alpha, beta, p, ply):
+        self.check_time()
+        if self.five_points(p):
+            return WIN - ply
+        threats = self.five_points(3 - p)
+        if len(threats) >= 2:
+            return -(WIN - ply - 1)
+        if depth <= 0 and not threats:
+            return self.evaluate(p)
+        entry = self.tt.get(self.hash)
+        tt_move = -1
+        if entry is not None:
+            e_depth, e_score, e_flag, tt_move = entry
+            if e_depth >= depth and ply:
+                if e_flag == EXACT or (e_flag == LOWER and e_score >= beta) or (e_flag == UPPER and e_score <= alpha):
+                    return e_score
+        if threats:
+            moves = [c for c in threats if not self.forbidden(c, p)]
+            if not moves:
+                return -(WIN - ply - 1)  # 只能堵在禁手点上
+            depth = max(depth, 1)  # 被冲四时必须应，不算一层
+        else:
+            moves = self.candidates(p)
+            if not moves:
+                return 0
+            if tt_move in moves:
+                moves.remove(tt_move)
+                moves.insert(0, tt_move)
+        best, best_move = -WIN - 1, moves[0]
+        original_alpha = alpha
+        for c in moves:
+            self.place(c, p)
+            try:
+                score = -self.negamax(depth - 1, -beta, -alpha, 3 - p, ply + 1)
+            finally:
+                self.remove(c, p)
+            if score > best:
+                best, best_move = score, c
+                if ply == 0:
+                    self.root_best = c
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+        flag = UPPER if best <= original_alpha else LOWER if best >= beta else EXACT
+        self.tt[self.hash] = (depth, best, flag, best_move)
+        return best
+
+    # ---- VCT：每一步都是冲四或活三，对方只能应着；找到返回进攻方第一步 ----
+    def open_four_points(self, p):
+        # p下一手能成活四（或双四）的点
+        points = []
+        seen = set()
+        cells = self.cells
+        for i, (win, _, _) in enumerate(self.wins):
+            if self.count[p][i] != 3 or self.count[3 - p][i]:
+                continue
+            for c in win:
+                if cells[c] or c in seen:
+                    continue
+                seen.add(c)
+                if self.forbidden(c, p):
+                    continue
+                self.place(c, p)
+                if len(self.five_points(p)) >= 2:
+                    points.append(c)
+                self.remove(c, p)
+        return points
+
+    def vct(self, p, depth=VCT_DEPTH, node_limit=VCT_NODE_LIMIT):
+        self.vct_nodes = 0
+        self.vct_limit = node_limit
+        return self._vct_attack(p, depth)
+
+    def _vct_attack(self, p, depth):
+        self.check_time()
+        self.vct_nodes += 1
+        q = 3 - p
+        own = self.five_points(p)
+        if own:
+            return min(own)
+        threats = self.five_points(q)
+        if len(threats) >= 2 or depth <= 0 or self.vct_nodes > self.vct_limit:
+            return None
+        if threats:
+            moves = [c for c in threats if not self.forbidden(c, p)]  # 被对方冲四，先堵
+        else:
+            cells = self.cells
+            moves = set()
+            for i, (win, _, _) in enumerate(self.wins):
+                if self.count[p][i] >= 2 and not self.count[q][i]:
+                    moves.update(c for c in win if not cells[c])
+            moves = sorted(moves, key=lambda c: self.move_score(c, p), reverse=True)
+        for c in moves:
+            if self.forbidden(c, p):
+                continue
+            self.place(c, p)
+            try:
+                if threats or self.five_points(p) or self.open_four_points(p):
+                    if self._vct_defend(p, depth - 1 if not threats else depth):
+                        return c
+            finally:
+                self.remove(c, p)
+        return None
+
+    def _vct_defend(self, p, depth):
+        # 对方（q）应着：堵冲四、堵活三，或者反冲四；所有应着都挡不住才算成功
+        q = 3 - p
+        if self.five_points(q):
+            return False
+        fives = self.five_points(p)
+        if len(fives) >= 2:
+            return True
+        if fives:
+            replies = list(fives)
+        else:
+            fours = self.open_four_points(p)
+            if not fours:
+                return False
+            replies = set(fours)
+            cells = self.cells
+            # 把活三改成死三的点：活三窗口里的空点，逐个试
+            for i, (win, _, _) in enumerate(self.wins):
+                if self.count[p][i] == 3 and not self.count[q][i]:
+                    replies.update(c for c in win if not cells[c])
+                if self.count[q][i] == 3 and not self.count[p][i]:
+                    replies.update(c for c in win if not cells[c])  # 反冲四
+        for r in replies:
+            if self.forbidden(r, q):
+                continue
+            self.place(r, q)
+            try:
+                if not self.five_points(q) and not fives and not self.open_four_points(p):
+                    return False  # 这一手解除了威胁
+                if self._vct_attack(p, depth) is None:
+                    return False
+            finally:
+                self.remove(r, q)
+        return True
+
+    def search(self, max_depth=MAX_PLY):
+        # 迭代加深，超时后返回最后一轮完整搜索的结果
+        p = self.game.current_player
+        moves = self.candidates(p)
+        if not moves:
+            return None, 0, 0
+        best, best_score, completed = moves[0], 0, 0
+        for depth in range(1, max_depth + 1):
+            self.root_best = best
+            try:
+                best_score = self.negamax(depth, -WIN - 1, WIN + 1, p, 0)
+            except TimeUp:
+                break
+            best = self.root_best
+            completed = depth
+            if abs(best_score) > WIN_BOUND:
+                break
+        return best, best_score, completed
+
+    def think(self):
+        # 成五 > 堵对方的四 > VCF > VCT > alpha-beta；返回格子编号
+        p = self.game.current_player
+        q = 3 - p
+        if not any(self.cells):
+            return (self.h // 2) * self.w + self.w // 2
+        own = self.five_points(p)
+        if own:
+            return min(own)
+        threats = [c for c in self.five_points(q) if not self.forbidden(c, p)]
+        if threats:
+            return max(threats, key=lambda c: self.move_score(c, p))
+        try:
+            if not self.five_points(q):
+                line = self.vcf.solve(p)  # 黑棋的每一步冲四VCFSolver都判过禁手
+                if line:
+                    return line[0]
+                c = self.vct(p)
+                if c is not None:
+                    return c
+        except TimeUp:
+            pass
+        return self.search()[0]
+
+
+def crop_region(board_size, bounds):
+    # 大棋盘上要搜索/分析的区域 (x0, y0, h, w)：棋子外接矩形外扩CROP_MARGIN格，至少CROP_MIN见方
+    h, w = board_size
+    if h * w <= CROP_AREA:
+        return 0, 0, h, w
+    if bounds is None:
+        bounds = (h // 2, w // 2, h // 2, w // 2)
+    region = []
+    for lo, hi, n in ((bounds[0], bounds[2], h), (bounds[1], bounds[3], w)):
+        lo, hi = lo - CROP_MARGIN, hi + CROP_MARGIN
+        if hi - lo + 1 < CROP_MIN:
+            lo = (lo + hi + 1 - CROP_MIN) // 2
+            hi = lo + CROP_MIN - 1
+        lo, hi = max(0, lo), min(n - 1, hi)
+        region.append((lo, hi - lo + 1))
+    (x0, ch), (y0, cw) = region
+    return x0, y0, ch, cw
+
+
+def crop(game):
+    # 截出crop_region那一块作为一盘新棋，返回 (x0, y0, 新棋)；截出来的边当棋盘边
+    x0, y0, h, w = crop_region(game.board_size, game.bounds)
+    if (h, w) == tuple(game.board_size):
+        return 0, 0, game
+    sub = type(game)(game.forbidden_rule, (h, w))
+    for (x, y), v in game.stone_map.items():
+        sub._put(x - x0, y - y0, v)
+    sub.current_player = game.current_player
+    if game.last_move:
+        player, x, y = game.last_move
+        sub.last_move = (player, x - x0, y - y0)
+    return x0, y0, sub
+
+
+def think(game_bytes, time_limit):
+    # 进程池入口：传入GomokuGame.to_bytes()，返回 (x, y)（没有可下的点返回None）
+    from bots.gomoku import GomokuGame, quick_move
+    x0, y0, game = crop(GomokuGame.from_bytes(game_bytes))
+    c = Searcher(game, time_limit).think()
+    if c is None:
+        move = quick_move(game)
+        if move is None:
+            return None
+    else:
+        move = divmod(c, game.board_size[1])
+    return move[0] + x0, move[1] + y0
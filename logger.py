@@ -1,14 +1,125 @@
+import atexit
 import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# bot进程（main里调start_logging之后）：日志先进队列，由后台线程写控制台和文件，事件循环里打日志不碰磁盘。
+# 其他进程（命令行工具、引擎和分析的子进程）只import不start，直接同步写控制台。
+# 各子系统用get_logger('ws')之类拿到rocket.ws，级别在LOG_LEVELS里分别设；
+# 量大的DEBUG日志（比如websocket收到的每一帧）按SAMPLE_RATES抽样，N条留1条
+LOG_FILE = 'rocket.log'
+LOG_MAX_BYTES = 10 * 1024 * 1024  # 写满就滚动成rocket.log.1、.2……
+LOG_BACKUPS = 5
+
+LOG_LEVELS = {
+    'rocket': logging.INFO,
+    'rocket.ws': logging.INFO,       # websocket连接、收发的原始帧（DEBUG时每帧都记，见SAMPLE_RATES）
+    'rocket.message': logging.INFO,  # 收到的聊天消息，DEBUG时记完整的消息dict
+    'rocket.clock': logging.INFO,
+    'rocket.chess': logging.INFO,
+    'rocket.gomoku': logging.INFO,
+}
+SAMPLE_RATES = {
+    'rocket.ws': 100,
+    'rocket.message': 10,
+}
+
+
+class SampleFilter(logging.Filter):
+    # 只抽样DEBUG，INFO及以上都留着
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self.counts = {}
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = self.rates.get(record.name)
+        if not rate:
+            return True
+        n = self.counts.get(record.name, 0)
+        self.counts[record.name] = n + 1
+        return n % rate == 0
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record):
+        # 默认会在打日志的线程里先把消息格式化好再入队。同一进程里的队列不用序列化，原样入队，格式化留给后台线程；
+        # 代价是参数对象要在打完日志之后不再改（消息dict收到后就不动了）。
+        # 要是换成跨进程的队列，args/exc_info不一定能pickle，还是走默认的先格式化
+        if isinstance(self.queue, (queue.SimpleQueue, queue.Queue)):
+            return record
+        return super().prepare(record)
+
 
 log_formatter = logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s')
+sample_filter = SampleFilter(SAMPLE_RATES)
 
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(log_formatter)
 
-file_handler = logging.FileHandler('rocket.log', encoding='utf-8')
-file_handler.setFormatter(log_formatter)
+def _direct_handler():
+    handler = logging.StreamHandler()
+    handler.setFormatter(log_formatter)
+    handler.addFilter(sample_filter)
+    return handler
+
 
 logger = logging.getLogger("rocket")
-logger.setLevel(logging.INFO)
-logger.addHandler(console_handler)
-logger.addHandler(file_handler) 
\ No newline at end of file
+for name, level in LOG_LEVELS.items():
+    logging.getLogger(name).setLevel(level)
+direct_handler = _direct_handler()
+logger.addHandler(direct_handler)
+
+queue_handler = None
+listener = None
+
+
+def get_logger(subsystem):
+    return logger.getChild(subsystem)
+
+
+def start_logging():
+    """bot进程启动时调一次：换成队列+后台线程，写控制台和滚动的rocket.log"""
+    global queue_handler, listener
+    if listener is not None:
+        return
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(log_formatter)
+    file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS,
+                                       encoding='utf-8', delay=True)
+    file_handler.setFormatter(log_formatter)
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(sample_filter)
+    listener = QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+    listener.start()
+    logger.removeHandler(direct_handler)
+    logger.addHandler(queue_handler)
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """把队列里剩下的写完，换回直接写控制台；进程退出前调（os._exit不走atexit，要手动调）"""
+    global queue_handler, listener
+    if listener is None:
+        return
+    logger.removeHandler(queue_handler)
+    logger.addHandler(direct_handler)
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+    queue_handler = listener = None
+
+
+def _after_fork_in_child():
+    # fork出来的子进程（引擎、分析的进程池）继承了队列，但没有后台线程，往里放的日志没人写；
+    # 换回直接写控制台（不写rocket.log，免得几个进程一起滚动同一个文件）
+    global queue_handler, listener
+    if listener is not None:
+        logger.removeHandler(queue_handler)
+        logger.addHandler(direct_handler)
+        queue_handler = listener = None
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
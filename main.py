@@ -1,20 +1,23 @@
 import asyncio
 import json
-import logging
-import traceback
 from typing import Optional, Dict, Any
 import aiohttp
 import websockets
 import os
 import signal
+import time
 import importlib
 import pkgutil
 from data_manager import DataManager
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from logger import logger
+from logger import logger, get_logger, start_logging, stop_logging
 
 from message import Message
 
+ws_log = get_logger('ws')
+msg_log = get_logger('message')
+clock_log = get_logger('clock')
+
 data_manager = DataManager()
 channel_bot_map = {}
 
@@ -31,6 +34,19 @@ def auto_register_bots():
             channel_bot_map[bot_instance.channel_id] = bot_instance
             logger.info(f'注册机器人: {classname} {bot_instance.channel_id}')
 
+TICK_SECONDS = 1
+
+async def clock_loop():
+    # 所有房间的期限都在各个bot的时间轮上，这里统一每秒推进一次，不给每个房间单独开任务
+    while True:
+        await asyncio.sleep(TICK_SECONDS)
+        now = time.time()
+        for bot in channel_bot_map.values():
+            try:
+                await bot.tick(now)
+            except Exception as e:
+                clock_log.exception('计时处理失败: %s', e)
+
 def start_scheduler():
     scheduler = AsyncIOScheduler()
     scheduler.add_job(data_manager.save_all, 'interval', minutes=5)
@@ -44,6 +60,7 @@ def on_exit(*args):
         logger.info('程序退出，所有房间数据已保存')
     except Exception as e:
         logger.error(f'退出保存所有房间数据失败: {e}')
+    stop_logging()  # os._exit不走atexit，先把队列里的日志写完
     os._exit(0)
 
 signal.signal(signal.SIGTERM, on_exit)
@@ -60,9 +77,10 @@ class RocketChatBot:
         self.ws_url = server_url.replace('http://', 'ws://').replace('https://', 'wss://') + '/websocket'
         self.token: Optional[str] = None
         self.user_id: Optional[str] = None
+        self.dm_rooms: Dict[str, str] = {}  # 用户名 -> 私聊房间号
         
-        logger.debug(f"API URL: {self.api_url}")
-        logger.debug(f"WebSocket URL: {self.ws_url}")
+        ws_log.debug('API URL: %s', self.api_url)
+        ws_log.debug('WebSocket URL: %s', self.ws_url)
 
 
     async def login(self) -> None:
@@ -86,23 +104,47 @@ class RocketChatBot:
             logger.error(f'Login error: {e}')
             raise
 
-    async def send_message(self, room_id: str, text: str) -> None:
-        """发送消息"""
+    async def send_message(self, room_id: str, text: str, image_url: str = None) -> bool:
+        """发送消息，image_url是已经上传过的图片（按地址引用，不重新上传）"""
         async with aiohttp.ClientSession() as session:
             headers = {
                 'X-Auth-Token': self.token,
                 'X-User-Id': self.user_id
             }
+            payload = {'roomId': room_id, 'text': text}
+            if image_url:
+                payload['attachments'] = [{'image_url': image_url}]
             async with session.post(
                 f'{self.api_url}/api/v1/chat.postMessage',  # 使用 api_url
                 headers=headers,
-                json={'roomId': room_id, 'text': text}
+                json=payload
             ) as response:
                 if response.status != 200:
                     logger.error(f'Failed to send message: {await response.text()}')
+                    return False
+                return True
 
-    async def send_image(self, room_id: str, image_path: str, description: str = None) -> None:
-        """发送图片消息到指定房间"""
+    async def dm_room(self, username: str) -> Optional[str]:
+        """和某个用户的私聊房间号，没有就创建"""
+        if username not in self.dm_rooms:
+            async with aiohttp.ClientSession() as session:
+                headers = {
+                    'X-Auth-Token': self.token,
+                    'X-User-Id': self.user_id
+                }
+                async with session.post(
+                    f'{self.api_url}/api/v1/im.create',
+                    headers=headers,
+                    json={'username': username}
+                ) as response:
+                    if response.status != 200:
+                        logger.error(f'Failed to create DM: {await response.text()}')
+                        return None
+                    self.dm_rooms[username] = (await response.json())['room']['_id']
+        return self.dm_rooms[username]
+
+    async def send_image(self, room_id: str, image_path: str, description: str = None) -> Optional[str]:
+        """发送图片消息到指定房间，返回上传后的图片地址，别的房间可以直接引用"""
         # 1. 上传图片
         async with aiohttp.ClientSession() as session:
             headers = {
@@ -119,11 +161,14 @@ class RocketChatBot:
             ) as response:
                 if response.status != 200:
                     logger.error(f'Failed to upload image: {await response.text()}')
-                    return
+                    return None
                 res_json = await response.json()
                 if description:
                     # 2. 发送一条带描述的消息
                     await self.send_message(room_id, description)
+                attachments = res_json.get('message', {}).get('attachments') or [{}]
+                url = attachments[0].get('image_url')
+                return self.api_url + url if url and url.startswith('/') else url
 
     async def handle_message(self, message: Dict[str, Any]) -> None:
         """处理收到的消息"""
@@ -131,8 +176,10 @@ class RocketChatBot:
             # 忽略自己发的
             if message.get('u', {}).get('username') == self.user:
                 return
-            logger.info(f"Received message: {message}")
             msg = Message(message, self)
+            # 每条消息都会走到这里：INFO只记谁在哪儿说了什么，完整的dict只在DEBUG时（抽样）记；参数留给后台线程格式化
+            msg_log.info('%s %s: %s', msg.room_id, msg.talker_id, msg.text)
+            msg_log.debug('%s', message)
 
             # 测试ding-dong
             if msg.text == 'ding':
@@ -146,16 +193,19 @@ class RocketChatBot:
             bot = channel_bot_map.get(msg.room_id)
             if bot:
                 await bot.message_handler(msg)
+            elif msg.text.startswith(('观战', '取消观战')):
+                # 别的频道/私聊里观战要带上游戏名：【观战 五子棋 1000】，推送到发消息的这个房间
+                for bot in channel_bot_map.values():
+                    await bot.watch_handler(msg, in_game_channel=False)
 
         except Exception as e:
-            logger.error(f'Error handling message: {e}')
-            print(traceback.format_exc())
+            msg_log.exception('Error handling message: %s', e)
 
     async def connect(self) -> None:
         """建立 WebSocket 连接并处理消息"""
         try:
             await self.login()
-            logger.debug(f"Attempting to connect to WebSocket at: {self.ws_url}")
+            ws_log.debug('Attempting to connect to WebSocket at: %s', self.ws_url)
             
             async with websockets.connect(
                 self.ws_url,
@@ -164,7 +214,7 @@ class RocketChatBot:
                 },
                 subprotocols=['websocket']
             ) as websocket:
-                logger.info("WebSocket connection established")
+                ws_log.info('WebSocket connection established')
 
                 # 发送连接消息
                 connect_msg = {
@@ -172,12 +222,12 @@ class RocketChatBot:
                     "version": "1",
                     "support": ["1"]
                 }
-                logger.debug(f"Sending connect message: {connect_msg}")
+                ws_log.debug('Sending connect message: %s', connect_msg)
                 await websocket.send(json.dumps(connect_msg))
 
                 # 等待连接确认
                 response = await websocket.recv()
-                logger.debug(f"Received initial response: {response}")
+                ws_log.debug('Received initial response: %s', response)
 
                 # 发送登录消息
                 login_msg = {
@@ -188,12 +238,12 @@ class RocketChatBot:
                         {"resume": self.token}
                     ]
                 }
-                logger.debug(f"Sending login message: {login_msg}")
+                ws_log.debug('Sending login message: %s', login_msg)
                 await websocket.send(json.dumps(login_msg))
 
                 # 等待登录响应
                 response = await websocket.recv()
-                logger.debug(f"Received login response: {response}")
+                ws_log.debug('Received login response: %s', response)
 
                 # 订阅消息
                 sub_msg = {
@@ -202,7 +252,7 @@ class RocketChatBot:
                     "name": "stream-room-messages",
                     "params": ["__my_messages__", False]
                 }
-                logger.debug(f"Sending subscription message: {sub_msg}")
+                ws_log.debug('Sending subscription message: %s', sub_msg)
                 await websocket.send(json.dumps(sub_msg))
 
                 # 持续接收消息
@@ -210,7 +260,7 @@ class RocketChatBot:
                     try:
                         message = await websocket.recv()
                         data = json.loads(message)
-                        logger.debug(f"Received message: {data}")
+                        ws_log.debug('Received message: %s', message)  # 心跳也算，量大，按logger.SAMPLE_RATES抽样
 
                         # 处理心跳
                         if data.get('msg') == 'ping':
@@ -220,13 +270,13 @@ class RocketChatBot:
                         if data.get('msg') == 'changed' and data.get('collection') == 'stream-room-messages':
                             asyncio.create_task(self.handle_message(data['fields']['args'][0]))
                     except websockets.ConnectionClosed:
-                        logger.warning("WebSocket connection closed")
+                        ws_log.warning('WebSocket connection closed')
                         break
                     except Exception as e:
-                        logger.error(f"Error processing message: {e}")
+                        ws_log.exception('Error processing message: %s', e)
 
         except Exception as e:
-            logger.error(f"Connection error: {e}")
+            ws_log.error('Connection error: %s', e)
             await asyncio.sleep(5)
 
     async def run(self) -> None:
@@ -239,6 +289,7 @@ class RocketChatBot:
                 await asyncio.sleep(5)  # 出错后等待重连
 
 def main():
+    start_logging()  # 只有bot进程走队列写日志，引擎/分析的子进程和命令行工具直接写控制台
     auto_register_bots()
     data_manager.load_all()
     start_scheduler()
@@ -250,8 +301,15 @@ def main():
         # server_url='https://rocket.shadiao.win'
     )
     
+    for game in channel_bot_map.values():
+        game.client = bot
+
+    async def run():
+        asyncio.create_task(clock_loop())
+        await bot.run()
+
     # 运行机器人
-    asyncio.run(bot.run())
+    asyncio.run(run())
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
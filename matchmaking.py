@@ -0,0 +1,125 @@
+import random
+
+# 匹配队列：按(等级分, 入队时间, 用户id)排好序的跳表，等级分相近的挨在一起，同分先来的在前。
+# 入队、出队期望O(log n)（有序list的insort/del要挪后面所有元素，是O(n)），
+# 每个人记着自己的节点，配对只看节点前后相邻的两个人，O(1)。
+# 能接受的等级分差随等待时间分段放宽，每放宽一档由bot的时间轮触发一次重新配对，不用定时扫全队列
+MATCH_WINDOW = 100              # 刚入队时接受的等级分差
+MATCH_WIDEN = 50                # 每等MATCH_WIDEN_INTERVAL秒放宽这么多
+MATCH_WIDEN_INTERVAL = 10
+MATCH_MAX_WINDOW = 800
+MATCH_TIMEOUT = 10 * 60         # 排这么久还没匹配到就退出队列
+
+
+SKIP_MAX_LEVEL = 24  # 0.25的概率升一层，4**24个人以内够用
+
+
+def match_window(wait):
+    return min(MATCH_WINDOW + MATCH_WIDEN * int(wait // MATCH_WIDEN_INTERVAL), MATCH_MAX_WINDOW)
+
+
+class _Node:
+    __slots__ = ('entry', 'prev', 'next')
+
+    def __init__(self, entry, prev, level):
+        self.entry = entry
+        self.prev = prev           # 第0层的前一个节点，第一个节点是None
+        self.next = [None] * level  # 每层的后一个节点
+
+
+class _SkipList:
+    def __init__(self):
+        self.head = _Node(None, None, SKIP_MAX_LEVEL)
+        self.level = 1
+        self.size = 0
+
+    def _search(self, entry):
+        # 每一层最后一个小于entry的节点
+        update = [self.head] * SKIP_MAX_LEVEL
+        node = self.head
+        for lv in range(self.level - 1, -1, -1):
+            nxt = node.next[lv]
+            while nxt is not None and nxt.entry < entry:
+                node = nxt
+                nxt = node.next[lv]
+            update[lv] = node
+        return update
+
+    def insert(self, entry):
+        update = self._search(entry)
+        level = 1
+        while level < SKIP_MAX_LEVEL and random.random() < 0.25:
+            level += 1
+        self.level = max(self.level, level)
+        node = _Node(entry, None if update[0] is self.head else update[0], level)
+        for lv in range(level):
+            node.next[lv] = update[lv].next[lv]
+            update[lv].next[lv] = node
+        if node.next[0] is not None:
+            node.next[0].prev = node
+        self.size += 1
+        return node
+
+    def remove(self, node):
+        update = self._search(node.entry)
+        for lv in range(len(node.next)):
+            if update[lv].next[lv] is node:
+                update[lv].next[lv] = node.next[lv]
+        if node.next[0] is not None:
+            node.next[0].prev = node.prev
+        while self.level > 1 and self.head.next[self.level - 1] is None:
+            self.level -= 1
+        self.size -= 1
+
+
+class MatchQueue:
+    def __init__(self):
+        self.entries = _SkipList()  # 节点的entry是(等级分, 入队时间, 用户id)
+        self.players = {}  # 用户id -> (节点, player)
+
+    def __len__(self):
+        return self.entries.size
+
+    def __contains__(self, user_id):
+        return user_id in self.players
+
+    def push(self, player, rating, now):
+        node = self.entries.insert((rating, now, player.id))
+        self.players[player.id] = (node, player)
+
+    def remove(self, user_id):
+        # 返回player，不在队列里返回None
+        item = self.players.pop(user_id, None)
+        if item is None:
+            return None
+        node, player = item
+        self.entries.remove(node)
+        return player
+
+    def waited(self, user_id, now):
+        return now - self.players[user_id][0].entry[1]
+
+    def next_widen(self, user_id, now):
+        # 下一次放宽窗口的时间，从入队时间起算，不会因为处理晚了越拖越晚
+        since = self.players[user_id][0].entry[1]
+        return since + MATCH_WIDEN_INTERVAL * (int((now - since) // MATCH_WIDEN_INTERVAL) + 1)
+
+    def partner(self, user_id, now):
+        # 等级分上下相邻的两个人里，分差在双方较宽的窗口内、分差最小的那个
+        node = self.players[user_id][0]
+        entry = node.entry
+        best = None
+        for neighbour in (node.prev, node.next[0]):
+            if neighbour is not None:
+                other = neighbour.entry
+                diff = abs(other[0] - entry[0])
+                if diff <= match_window(now - min(entry[1], other[1])) and (best is None or diff < best[0]):
+                    best = (diff, other[2])
+        return best and best[1]
+
+    def pair(self, user_id, now):
+        # 给user_id找对手，找到了两个人都出队，返回(player, 对手player)，否则None
+        other = self.partner(user_id, now)
+        if other is None:
+            return None
+        return self.remove(user_id), self.remove(other)
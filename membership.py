@@ -0,0 +1,69 @@
+import json
+
+# 谁在哪些房间：用户 -> 所在房间的集合，房间 -> 房间里的用户，再加上每个用户当前活动的房间（发棋步等指令作用在这个房间）。
+# 开房、加入、匹配、清房间时增量更新，【我的房间】【切换】只看这个用户自己的那几个房间，不扫全部房间。
+# 活动房间存盘（重启后还在原来的房间），成员关系读档时从房间的players重建
+
+
+class Membership:
+    def __init__(self):
+        self.rooms = {}   # 用户id -> {房间号}
+        self.users = {}   # 房间号 -> {用户id}
+        self.active = {}  # 用户id -> 当前活动的房间号
+
+    def rooms_of(self, user_id):
+        return self.rooms.get(user_id, ())
+
+    def join(self, user_id, room_id, activate=True):
+        self.rooms.setdefault(user_id, set()).add(room_id)
+        self.users.setdefault(room_id, set()).add(user_id)
+        if activate:
+            self.active[user_id] = room_id
+
+    def activate(self, user_id, room_id):
+        """切换活动房间，不在这个房间里返回False"""
+        if room_id not in self.rooms.get(user_id, ()):
+            return False
+        self.active[user_id] = room_id
+        return True
+
+    def leave(self, user_id, room_id):
+        rooms = self.rooms.get(user_id)
+        if rooms is not None:
+            rooms.discard(room_id)
+            if not rooms:
+                del self.rooms[user_id]
+        users = self.users.get(room_id)
+        if users is not None:
+            users.discard(user_id)
+            if not users:
+                del self.users[room_id]
+        if self.active.get(user_id) == room_id:
+            del self.active[user_id]
+
+    def drop_room(self, room_id):
+        # 房间清掉了，里面的人都退出；活动房间是它的就没有活动房间了
+        for user_id in list(self.users.get(room_id, ())):
+            self.leave(user_id, room_id)
+
+    def clear(self):
+        self.rooms.clear()
+        self.users.clear()
+        self.active.clear()
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.active, f, ensure_ascii=False)
+
+    def load(self, path):
+        """读档：成员关系已经按房间join好（activate=False），这里恢复活动房间
+
+        存的活动房间不在了（比如已经清掉）就用这个人房间号最大的那个，也就是最近开的
+        """
+        saved = {}
+        if path.exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        for user_id, rooms in self.rooms.items():
+            room_id = saved.get(user_id)
+            self.active[user_id] = room_id if room_id in rooms else max(rooms, key=lambda r: (len(r), r))
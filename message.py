@@ -12,4 +12,5 @@ class Message:
         await self.bot.send_message(self.room_id, text)
     
     async def reply_image(self, image_path, description=None):
-        await self.bot.send_image(self.room_id, image_path, description)
\ No newline at end of file
+        # 返回上传后的图片地址
+        return await self.bot.send_image(self.room_id, image_path, description)
\ No newline at end of file
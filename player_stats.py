@@ -0,0 +1,158 @@
+import bisect
+import json
+import os
+import sys
+from pathlib import Path
+
+# 玩家战绩与Elo等级分。每局归档时增量更新一次，排行榜用有序表维护。
+
+INITIAL_RATING = 1500
+K_FACTOR = 32
+RECENT_GAMES = 10
+
+
+class PlayerRecord:
+    __slots__ = ('user_id', 'name', 'rating', 'wins', 'losses', 'draws', 'recent')
+
+    def __init__(self, user_id, name=None, rating=INITIAL_RATING, wins=0, losses=0, draws=0, recent=None):
+        self.user_id = user_id
+        self.name = name or user_id
+        self.rating = rating
+        self.wins = wins
+        self.losses = losses
+        self.draws = draws
+        self.recent = recent or []  # [[时间戳, 对手id, 得分], ...]，最新的在最后
+
+    @property
+    def games(self):
+        return self.wins + self.losses + self.draws
+
+    def to_list(self):
+        return [self.name, round(self.rating, 1), self.wins, self.losses, self.draws, self.recent]
+
+    @classmethod
+    def from_list(cls, user_id, data):
+        name, rating, wins, losses, draws, recent = data
+        return cls(user_id, name, rating, wins, losses, draws, recent)
+
+
+class PlayerStats:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.players = {}  # user_id -> PlayerRecord
+        self._ladder = []  # 按(-rating, user_id)排序，用于排行和名次查询
+        self.dirty = False
+
+    def expected_score(self, ra, rb):
+        return 1 / (1 + 10 ** ((rb - ra) / 400))
+
+    def _get(self, player):
+        rec = self.players.get(player['id'])
+        if rec is None:
+            rec = PlayerRecord(player['id'], player.get('name'))
+            self.players[rec.user_id] = rec
+            bisect.insort(self._ladder, (-rec.rating, rec.user_id))
+        elif player.get('name'):
+            rec.name = player['name']
+        return rec
+
+    def _set_rating(self, rec, rating):
+        i = bisect.bisect_left(self._ladder, (-rec.rating, rec.user_id))
+        del self._ladder[i]
+        rec.rating = rating
+        bisect.insort(self._ladder, (-rating, rec.user_id))
+
+    def record_game(self, players, score, ts):
+        """players为两名玩家的{'id','name'}，score为players[0]的得分：1胜 0负 0.5和"""
+        a, b = self._get(players[0]), self._get(players[1])
+        ea = self.expected_score(a.rating, b.rating)
+        ra = a.rating + K_FACTOR * (score - ea)
+        rb = b.rating + K_FACTOR * ((1 - score) - (1 - ea))
+        self._set_rating(a, ra)
+        self._set_rating(b, rb)
+        for rec, opp, s in ((a, b, score), (b, a, 1 - score)):
+            if s == 1:
+                rec.wins += 1
+            elif s == 0:
+                rec.losses += 1
+            else:
+                rec.draws += 1
+            rec.recent.append([ts, opp.user_id, s])
+            del rec.recent[:-RECENT_GAMES]
+        self.dirty = True
+
+    def rank(self, user_id):
+        rec = self.players.get(user_id)
+        if rec is None:
+            return None
+        return bisect.bisect_left(self._ladder, (-rec.rating, rec.user_id)) + 1
+
+    def top(self, n=10):
+        return [self.players[uid] for _, uid in self._ladder[:n]]
+
+    def format_record(self, user_id):
+        rec = self.players.get(user_id)
+        if rec is None:
+            return "你还没有下完过一盘，没有战绩。"
+        text = (f"{rec.name} 等级分{rec.rating:.0f}（第{self.rank(user_id)}名）\n"
+                f"{rec.games}局 {rec.wins}胜 {rec.losses}负 {rec.draws}和")
+        if rec.recent:
+            marks = {1: '胜', 0: '负', 0.5: '和'}
+            recent = ' '.join(marks[s] for _, _, s in reversed(rec.recent))
+            text += f"\n最近: {recent}"
+        return text
+
+    def format_leaderboard(self, n=10):
+        if not self._ladder:
+            return "还没有人上榜。"
+        lines = ["排行榜："]
+        for i, rec in enumerate(self.top(n), 1):
+            lines.append(f"{i}. {rec.name} {rec.rating:.0f}（{rec.wins}胜{rec.losses}负{rec.draws}和）")
+        return '\n'.join(lines)
+
+    def save(self):
+        if not self.dirty:
+            return
+        data = {uid: rec.to_list() for uid, rec in self.players.items()}
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+    def load(self):
+        self.players = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for uid, row in json.load(f).items():
+                    self.players[uid] = PlayerRecord.from_list(uid, row)
+        self._ladder = sorted((-rec.rating, uid) for uid, rec in self.players.items())
+        self.dirty = False
+
+    def rebuild(self, archive_dir, result_fn):
+        """按时间顺序流式读取归档，一次性重建全部战绩"""
+        self.players = {}
+        self._ladder = []
+        files = sorted(Path(archive_dir).glob('*.json'), key=lambda f: int(f.stem.split('_')[0]))
+        count = 0
+        for file in files:
+            with open(file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            score = result_fn(data)
+            if score is None or len(data.get('players', [])) != 2:
+                continue
+            self.record_game(data['players'], score, int(file.stem.split('_')[0]))
+            count += 1
+        self.dirty = True
+        return count
+
+
+if __name__ == '__main__':
+    # 用法: python player_stats.py chess|gomoku  从archive重建战绩
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    game_type = sys.argv[1]
+    classname = game_type[0].upper() + game_type[1:] + 'Bot'
+    bot = getattr(__import__(f'bots.{game_type}', fromlist=[classname]), classname)()
+    n = bot.stats.rebuild(Path(f'archive/{game_type}'), bot.game_result)
+    bot.stats.save()
+    print(f'{game_type}: 已从{n}局归档重建{len(bot.stats.players)}名玩家的战绩')
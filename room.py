@@ -0,0 +1,75 @@
+from enum import Enum
+
+# 房间和玩家。用__slots__的类，不用dict：十万个空闲房间时每个房间少占不少内存，字段名写错了直接报错，
+# 另外每个房间带一个用户id -> 座位号的表，不用每条消息都在players里找一遍。
+# 存盘/归档还是dict（json），用to_dict/from_dict转，来回转不丢东西
+
+
+class RoomStatus(Enum):
+    WAITING = 'waiting'    # 等人加入
+    PLAYING = 'playing'
+    FINISHED = 'finished'  # 已经归档，在内存里再留一会儿
+
+
+class Player:
+    __slots__ = ('id', 'name')
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+    def __repr__(self):
+        return f'Player({self.id!r}, {self.name!r})'
+
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data.get('name'))
+
+
+class Room:
+    __slots__ = ('game', 'history', 'players', 'seats', 'status', 'undo_offer', 'clock', 'deadline', 'thinking')
+
+    def __init__(self, game, history, players, status, clock=None):
+        self.game = game
+        self.history = history        # GameHistory，悔棋/回放用，不存盘
+        self.status = status
+        self.undo_offer = None        # 提出悔棋的一方
+        self.clock = clock            # 计时，见chess_base.parse_time_control
+        self.deadline = None          # 时间轮上的期限（绝对时间）
+        self.thinking = False         # 电脑正在想，不存盘
+        self.set_players(players)
+
+    def set_players(self, players):
+        # players有变化（加入、打乱先后手）都要走这里，座位表跟着更新
+        self.players = players
+        self.seats = {p.id: i for i, p in enumerate(players)}
+
+    def add_player(self, player):
+        self.seats[player.id] = len(self.players)
+        self.players.append(player)
+
+    def seat(self, user_id):
+        """user_id在players里的下标，不在房间里返回None"""
+        return self.seats.get(user_id)
+
+    def to_dict(self):
+        return {
+            'game': self.game.to_dict(),
+            'players': [p.to_dict() for p in self.players],
+            'status': self.status.value,
+            'undo_offer': self.undo_offer,
+            'clock': self.clock,
+            'deadline': self.deadline,
+        }
+
+    @classmethod
+    def from_dict(cls, data, game, history):
+        # game、history由bot从data['game']还原好传进来
+        room = cls(game, history, [Player.from_dict(p) for p in data['players']],
+                   RoomStatus(data['status']), data.get('clock'))
+        room.undo_offer = data.get('undo_offer')
+        room.deadline = data.get('deadline')
+        return room
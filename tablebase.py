@@ -0,0 +1,428 @@
+import argparse
+import mmap
+import os
+import random
+import sys
+import time
+from pathlib import Path
+if __name__ == '__main__':
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from bots.chess import (ChessGame, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, WHITE, BLACK,
+                        KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, ROOK_DIRS, BISHOP_DIRS,
+                        MOVE_EP, slide_attacks)
+
+# 少子残局库（3~4子），离线用逆向分析生成，运行时mmap只读打开，多个进程共享同一份页缓存
+#
+# 文件格式（data/tablebases/KQvK.rtb）：
+#   4字节魔数 b'RTB1' + 1字节子力串长度 + 子力串（如 'KQvK'）+ 数据
+#   数据每个局面1字节，下标 = ((走棋方*64 + 第1个子的格子)*64 + 第2个子的格子)...，子的顺序同子力串
+#   0 = 和棋，255 = 非法局面，其他值v：距离将死 v-1 个半回合，奇数表示走棋方胜，偶数表示走棋方负
+#
+# 生成: python tablebase.py generate            # 默认的3子残局
+#       python tablebase.py generate KQvKR       # 4子残局要先生成它吃子/升变后的子残局，比较慢
+# 校验: python tablebase.py verify KRvK
+
+TB_DIR = Path('data/tablebases')
+MAGIC = b'RTB1'
+ILLEGAL = 255
+DEFAULT_MATERIALS = ['KNvK', 'KBvK', 'KRvK', 'KQvK', 'KPvK']
+LETTER_KINDS = {'P': PAWN, 'N': KNIGHT, 'B': BISHOP, 'R': ROOK, 'Q': QUEEN, 'K': KING}
+KIND_ORDER = [KING, QUEEN, ROOK, BISHOP, KNIGHT, PAWN]
+KIND_LETTERS = {v: k for k, v in LETTER_KINDS.items()}
+
+
+def parse_material(material):
+    # 'KQvKR' -> [(WHITE, KING), (WHITE, QUEEN), (BLACK, KING), (BLACK, ROOK)]
+    white, black = material.upper().split('V')
+    return [(WHITE, LETTER_KINDS[c]) for c in white] + [(BLACK, LETTER_KINDS[c]) for c in black]
+
+
+def side_material(bitboards, color):
+    return ''.join(KIND_LETTERS[k] * bin(bitboards[color * 6 + k]).count('1') for k in KIND_ORDER)
+
+
+def decode_value(v):
+    # 返回 (结果, 半回合数)：结果 1 走棋方胜，-1 走棋方负，0 和棋；非法返回None
+    if v == ILLEGAL:
+        return None
+    if v == 0:
+        return 0, 0
+    plies = v - 1
+    return (1 if plies % 2 else -1), plies
+
+
+class Table:
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:4] != MAGIC:
+            raise ValueError(f'{path} 不是残局库文件')
+        n = self.mm[4]
+        self.material = self.mm[5:5 + n].decode()
+        self.pieces = parse_material(self.material)
+        self.offset = 5 + n
+
+    def index_of(self, game, flip):
+        # 按子力串的顺序取出每个子的格子；flip时黑白互换并上下翻转
+        bbs = game.bitboards[6:] + game.bitboards[:6] if flip else list(game.bitboards)
+        idx = (0 if game.current_player == 'w' else 1) ^ flip
+        for color, kind in self.pieces:
+            bb = bbs[color * 6 + kind]
+            low = bb & -bb
+            bbs[color * 6 + kind] = bb ^ low
+            sq = low.bit_length() - 1
+            idx = idx * 64 + (sq ^ 56 if flip else sq)
+        return idx
+
+    def value_at(self, idx):
+        return self.mm[self.offset + idx]
+
+    def close(self):
+        self.mm.close()
+
+
+class Tablebase:
+    def __init__(self, directory=TB_DIR):
+        self.directory = Path(directory)
+        self.tables = {}
+        self.max_pieces = 0
+        if self.directory.exists():
+            for path in self.directory.glob('*.rtb'):
+                self.add(Table(path))
+
+    def add(self, table):
+        self.tables[table.material] = table
+        self.max_pieces = max(self.max_pieces, len(table.pieces))
+
+    def probe(self, game):
+        # 返回 (结果, 半回合数)，结果是走棋方视角；库里没有返回None
+        if game.must_capture or game.castling:
+            return None
+        bbs = game.bitboards
+        stm = 0 if game.current_player == 'w' else 1
+        if game.ep_square is not None and PAWN_ATTACKS[1 - stm][game.ep_square] & bbs[stm * 6 + PAWN]:
+            return None  # 真能吃过路兵的局面库里没有
+        white, black = side_material(bbs, WHITE), side_material(bbs, BLACK)
+        if white == 'K' and black == 'K':
+            return 0, 0
+        table = self.tables.get(f'{white}v{black}')
+        flip = 0
+        if table is None:
+            table = self.tables.get(f'{black}v{white}')
+            flip = 1
+        if table is None:
+            return None
+        return decode_value(table.value_at(table.index_of(game, flip)))
+
+    def best_move(self, game):
+        # 库里的最佳走法：能赢就选最快将死的，要输就拖最久，否则保和；返回(走法整数, 结果, 半回合数)
+        here = self.probe(game)
+        if here is None:
+            return None
+        best = None
+        for m in game._generate_legal_ints(game.current_player):
+            undo = game._make(m)
+            child = self.probe(game)
+            game._unmake(undo)
+            if child is None:
+                return None
+            result, plies = -child[0], child[1] + 1
+            # 排序键：胜 > 和 > 负，胜越快越好，负越慢越好
+            key = (result, -plies if result > 0 else plies if result < 0 else 0)
+            if best is None or key > best[0]:
+                best = (key, m, result, plies if result else 0)
+        if best is None:
+            return None
+        return best[1], best[2], best[3]
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+
+
+_tablebase = None
+
+
+def get_tablebase():
+    global _tablebase
+    if _tablebase is None:
+        _tablebase = Tablebase()
+    return _tablebase
+
+
+def describe(result, plies, player):
+    # 把探测结果写成一句话
+    if result == 0:
+        return '理论和棋'
+    winner = player if result > 0 else ('b' if player == 'w' else 'w')
+    name = '白方' if winner == 'w' else '黑方'
+    return f'{name}胜，{(plies + 1) // 2}步内将死'
+
+
+# ---------- 生成 ----------
+
+def _decode_index(idx, n):
+    sqs = [0] * n
+    for i in range(n - 1, -1, -1):
+        sqs[i] = idx & 63
+        idx >>= 6
+    return idx, sqs
+
+
+def _encode_index(stm, sqs):
+    idx = stm
+    for sq in sqs:
+        idx = idx * 64 + sq
+    return idx
+
+
+def _load(game, pieces, sqs, stm):
+    game.bitboards = [0] * 12
+    game.occupancy = [0, 0]
+    game.squares = [None] * 64
+    for (color, kind), sq in zip(pieces, sqs):
+        p = color * 6 + kind
+        game.bitboards[p] |= 1 << sq
+        game.occupancy[color] |= 1 << sq
+        game.squares[sq] = p
+    game.current_player = 'w' if stm == WHITE else 'b'
+
+
+def _attacked_by(target, pieces, sqs, color, occ):
+    # color方（按pieces/sqs给出的子）是否攻击target格
+    bit = 1 << target
+    for (c, kind), sq in zip(pieces, sqs):
+        if c != color:
+            continue
+        if kind == KNIGHT:
+            attacks = KNIGHT_ATTACKS[sq]
+        elif kind == KING:
+            attacks = KING_ATTACKS[sq]
+        elif kind == PAWN:
+            attacks = PAWN_ATTACKS[color][sq]
+        elif kind == BISHOP:
+            attacks = slide_attacks(sq, occ, BISHOP_DIRS)
+        elif kind == ROOK:
+            attacks = slide_attacks(sq, occ, ROOK_DIRS)
+        else:
+            attacks = slide_attacks(sq, occ, BISHOP_DIRS) | slide_attacks(sq, occ, ROOK_DIRS)
+        if attacks & bit:
+            return True
+    return False
+
+
+def _is_valid(pieces, sqs, stm):
+    if len(set(sqs)) != len(sqs):
+        return False
+    occ = 0
+    for (color, kind), sq in zip(pieces, sqs):
+        if kind == PAWN and (sq < 8 or sq >= 56):
+            return False
+        occ |= 1 << sq
+    # 不走棋的一方不能正被将军
+    other = 1 - stm
+    king = next(sq for (c, k), sq in zip(pieces, sqs) if c == other and k == KING)
+    return not _attacked_by(king, pieces, sqs, stm, occ)
+
+
+def _predecessors(pieces, sqs, stm):
+    # 逆着走一步：上一步是对方走的，且没有吃子/升变（那些在别的子力库里）
+    mover = 1 - stm
+    occ = 0
+    for sq in sqs:
+        occ |= 1 << sq
+    empty = ~occ
+    for i, ((color, kind), t) in enumerate(zip(pieces, sqs)):
+        if color != mover:
+            continue
+        if kind == KING:
+            origins = KING_ATTACKS[t] & empty
+        elif kind == KNIGHT:
+            origins = KNIGHT_ATTACKS[t] & empty
+        elif kind == BISHOP:
+            origins = slide_attacks(t, occ, BISHOP_DIRS) & empty
+        elif kind == ROOK:
+            origins = slide_attacks(t, occ, ROOK_DIRS) & empty
+        elif kind == QUEEN:
+            origins = (slide_attacks(t, occ, BISHOP_DIRS) | slide_attacks(t, occ, ROOK_DIRS)) & empty
+        else:
+            back = 8 if color == WHITE else -8
+            f = t + back
+            origins = 0
+            if 8 <= f < 56 and not (occ >> f) & 1:
+                origins |= 1 << f
+                double_row = 4 if color == WHITE else 3
+                if t >> 3 == double_row and not (occ >> (f + back)) & 1:
+                    origins |= 1 << (f + back)
+        while origins:
+            low = origins & -origins
+            origins ^= low
+            f = low.bit_length() - 1
+            prev = list(sqs)
+            prev[i] = f
+            # 上一局面里，不走棋的一方（stm）不能被将军
+            prev_occ = occ ^ (1 << t) ^ (1 << f)
+            king = next(sq for (c, k), sq in zip(pieces, prev) if c == stm and k == KING)
+            if not _attacked_by(king, pieces, prev, mover, prev_occ):
+                yield _encode_index(mover, prev)
+
+
+def generate(material, directory=TB_DIR, log=print):
+    pieces = parse_material(material)
+    n = len(pieces)
+    size = 2 * 64 ** n
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    subs = Tablebase(directory)  # 吃子/升变后落到的子残局
+    game = ChessGame()
+    game.castling = 0
+    game.ep_square = None
+    game.zobrist = 0
+
+    values = bytearray(size)      # 最终结果
+    done = bytearray(size)        # 1 = 已确定胜负
+    remaining = bytearray(size)   # 还没确定为“对方胜”的库内走法数
+    loss_out = bytearray(size)    # 走出本库且对方胜的走法里，最长的半回合数
+    draw_out = bytearray(size)    # 有走出本库后和棋的走法，不可能输
+    buckets = [[] for _ in range(256)]
+
+    start = time.time()
+    # 第一遍：标出非法局面、将死/逼和，统计库内走法，查出走出本库的结果
+    for idx in range(size):
+        stm, sqs = _decode_index(idx, n)
+        if not _is_valid(pieces, sqs, stm):
+            values[idx] = ILLEGAL
+            done[idx] = 1
+            continue
+        _load(game, pieces, sqs, stm)
+        moves = game._generate_legal_ints(game.current_player)
+        if not moves:
+            if game.is_in_check(game.current_player):
+                buckets[0].append(idx)
+            else:
+                done[idx] = 1  # 逼和
+            continue
+        count = 0
+        best_win = 0
+        for m in moves:
+            if game.squares[(m >> 6) & 63] is None and not m & MOVE_EP and not m & 0x7000:
+                count += 1
+                continue
+            undo = game._make(m)
+            child = subs.probe(game)
+            game._unmake(undo)
+            if child is None:
+                raise RuntimeError(f'生成{material}前需要先生成它吃子/升变后的残局库')
+            result, plies = child
+            if result < 0:
+                if not best_win or plies + 1 < best_win:
+                    best_win = plies + 1
+            elif result > 0:
+                loss_out[idx] = max(loss_out[idx], plies + 1)
+            else:
+                draw_out[idx] = 1
+        remaining[idx] = count
+        if best_win:
+            buckets[best_win].append(idx)
+        elif count == 0:
+            if draw_out[idx]:
+                done[idx] = 1
+            else:
+                buckets[loss_out[idx]].append(idx)
+    log(f'{material}: 第一遍完成 {time.time() - start:.1f}s')
+
+    # 逆向分析：按半回合数从小到大确定结果，再往前推
+    for d in range(255):
+        bucket = buckets[d]
+        buckets[d] = None
+        for idx in bucket:
+            if done[idx]:
+                continue
+            done[idx] = 1
+            values[idx] = d + 1
+            stm, sqs = _decode_index(idx, n)
+            for prev in _predecessors(pieces, sqs, stm):
+                if done[prev]:
+                    continue
+                if d % 2 == 0:
+                    # 这里走棋方输，上一步走到这里的一方赢
+                    buckets[d + 1].append(prev)
+                else:
+                    remaining[prev] -= 1
+                    if remaining[prev] == 0 and not draw_out[prev]:
+                        buckets[max(d + 1, loss_out[prev])].append(prev)
+    for idx in range(size):
+        if values[idx] == ILLEGAL:
+            continue
+        if not done[idx]:
+            values[idx] = 0
+    log(f'{material}: 逆向分析完成 {time.time() - start:.1f}s')
+
+    path = directory / f'{material}.rtb'
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC + bytes([len(material)]) + material.encode())
+        f.write(values)
+    os.replace(tmp, path)
+    subs.close()
+    return path
+
+
+# ---------- 校验 ----------
+
+def verify(material, samples=200, directory=TB_DIR, search_time=2.0, log=print):
+    # 抽样检查：每个局面的值要和它所有子局面一致；短将死再用搜索交叉验证
+    import chess_engine
+    tb = Tablebase(directory)
+    table = tb.tables[material]
+    pieces = table.pieces
+    n = len(pieces)
+    game = ChessGame()
+    game.castling = 0
+    game.ep_square = None
+    errors = 0
+    checked = 0
+    while checked < samples:
+        idx = random.randrange(2 * 64 ** n)
+        v = table.value_at(idx)
+        if v == ILLEGAL:
+            continue
+        stm, sqs = _decode_index(idx, n)
+        _load(game, pieces, sqs, stm)
+        game.zobrist = game.compute_zobrist()
+        game._legal_cache = None
+        result, plies = decode_value(v)
+        if game._generate_legal_ints(game.current_player):
+            best = tb.best_move(game)
+            ok = best is not None and (best[1], best[2]) == (result, plies)
+        else:
+            ok = result == (-1 if game.is_in_check(game.current_player) else 0) and plies == 0
+        if ok and result != 0 and plies <= 5:
+            searcher = chess_engine.Searcher(game, search_time, use_tablebase=False)
+            _, score, depth = searcher.search(max_depth=plies + 1)
+            if depth:  # 只有一步可走时搜索直接返回，不比较
+                found = chess_engine.MATE - abs(score) if abs(score) > chess_engine.MATE_BOUND else None
+                ok = found == plies and (score > 0) == (result > 0)
+        if not ok:
+            errors += 1
+            log(f'不一致: 下标{idx} 库中值{v}')
+        checked += 1
+    log(f'{material}: 抽查{checked}个局面，{errors}个不一致')
+    tb.close()
+    return errors
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['generate', 'verify'])
+    parser.add_argument('materials', nargs='*')
+    parser.add_argument('--samples', type=int, default=200)
+    args = parser.parse_args()
+    materials = args.materials or DEFAULT_MATERIALS
+    if args.command == 'generate':
+        for material in materials:
+            print(f'已生成 {generate(material)}')
+    else:
+        failed = sum(verify(material, args.samples) for material in materials)
+        sys.exit(1 if failed else 0)
@@ -0,0 +1,84 @@
+import math
+
+# 分层时间轮：LEVELS层，每层SLOTS个槽。第0层一个槽是一个tick，第l层一个槽是第l-1层转一圈。
+# 定时器按离现在多远放进对应层的槽里，第l层的槽轮到时把里面的定时器重新往下层放（cascade），
+# 落到第0层的槽轮到时就是到期。加、删定时器O(1)，每个tick只碰当前槽，和定时器总数无关
+# 默认1秒一个tick、64槽4层，能放下194天以内的定时器，更远的先放在overflow里，最外层每转一槽检查一次
+SLOTS = 64
+LEVELS = 4
+SLOT_BITS = 6  # SLOTS = 1 << SLOT_BITS
+
+
+class TimerWheel:
+    def __init__(self, now, tick=1.0):
+        self.tick = tick
+        self.current = int(now // tick)  # 已经处理到的tick
+        self.wheels = [[set() for _ in range(SLOTS)] for _ in range(LEVELS)]
+        self.overflow = set()
+        self.expires = {}  # key -> 到期的tick
+        self.where = {}    # key -> 所在的槽(set)，删除时直接找到
+
+    def __len__(self):
+        return len(self.expires)
+
+    def __contains__(self, key):
+        return key in self.expires
+
+    def schedule(self, key, when):
+        # 在时间when（和now同一个时钟，秒）到期；同一个key已有定时器的话替换掉。已经过了的下个tick到期
+        self.cancel(key)
+        t = max(math.ceil(when / self.tick), self.current + 1)
+        self.expires[key] = t
+        self._place(key, t)
+
+    def cancel(self, key):
+        slot = self.where.pop(key, None)
+        if slot is not None:
+            slot.discard(key)
+            del self.expires[key]
+
+    def deadline(self, key):
+        t = self.expires.get(key)
+        return None if t is None else t * self.tick
+
+    def _place(self, key, t):
+        # 找最低的一层，使t和当前tick在这一层的槽号相差不到一圈
+        for level in range(LEVELS):
+            shift = SLOT_BITS * level
+            if (t >> shift) - (self.current >> shift) < SLOTS:
+                slot = self.wheels[level][(t >> shift) & (SLOTS - 1)]
+                break
+        else:
+            slot = self.overflow
+        slot.add(key)
+        self.where[key] = slot
+
+    def advance(self, now):
+        # 走到时间now，返回这期间到期的key（按到期先后）
+        target = int(now // self.tick)
+        expired = []
+        while self.current < target:
+            self.current += 1
+            c = self.current
+            # 从外往里：外层的槽转到了，把里面的定时器重新放，可能正好落进这一步要处理的内层槽
+            if c & ((1 << SLOT_BITS * (LEVELS - 1)) - 1) == 0 and self.overflow:
+                self._cascade(self.overflow)
+            for level in range(LEVELS - 1, 0, -1):
+                shift = SLOT_BITS * level
+                if c & ((1 << shift) - 1) == 0:
+                    self._cascade(self.wheels[level][(c >> shift) & (SLOTS - 1)])
+            slot = self.wheels[0][c & (SLOTS - 1)]
+            if slot:
+                keys = list(slot)
+                slot.clear()
+                for key in keys:
+                    del self.where[key]
+                    del self.expires[key]
+                expired += keys
+        return expired
+
+    def _cascade(self, slot):
+        keys = list(slot)
+        slot.clear()
+        for key in keys:
+            self._place(key, self.expires[key])